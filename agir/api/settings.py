@@ -14,6 +14,7 @@ import os
 import re
 import dj_database_url
 import dj_email_url
+from celery.schedules import crontab
 from django.contrib import messages
 from django.contrib.messages import ERROR
 from django.core.exceptions import ImproperlyConfigured
@@ -81,6 +82,8 @@ MAP_DOMAIN = os.environ.get(
 MAILTRAIN_HOST = os.environ.get("MAILTRAIN_HOST", "http://agir.local:8000")
 MAILTRAIN_LIST_ID = os.environ.get("MAILTRAIN_LIST_ID", "SyWda9pi")
 MAILTRAIN_DISABLE = DEBUG
+# délai pendant lequel les mises à jour d'une même personne sont regroupées
+MAILTRAIN_UPDATE_DELAY = 60
 
 ALLOWED_HOSTS = os.environ.get("ALLOWED_HOSTS", "localhost,agir.local").split(",")
 
@@ -451,9 +454,42 @@ CACHES = {
         "LOCATION": os.environ.get("CACHING_REDIS_URL", "redis://localhost?db=0"),
         "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
         "KEY_PREFIX": "caching_",
-    }
+    },
+    "geocoding": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": os.environ.get(
+            "GEOCODING_REDIS_URL",
+            os.environ.get("CACHING_REDIS_URL", "redis://localhost?db=0"),
+        ),
+        "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+        "KEY_PREFIX": "geocoding_",
+    },
 }
 
+# GEOCODING
+GEOCODING_CACHE = "geocoding"
+GEOCODING_CACHE_TIMEOUT = int(
+    os.environ.get("GEOCODING_CACHE_TIMEOUT", 60 * 60 * 24 * 30)
+)
+GEOCODING_CACHE_VERSION = int(os.environ.get("GEOCODING_CACHE_VERSION", 1))
+# index local des communes, généré par ./manage.py update_communes
+COMMUNES_FILE = os.environ.get(
+    "COMMUNES_FILE", os.path.join(os.path.dirname(BASE_DIR), "data", "communes.csv")
+)
+# copie locale des templates d'emails, mise à jour par ./manage.py fetch_mosaico_templates
+MAIL_TEMPLATES_DIR = os.environ.get(
+    "MAIL_TEMPLATES_DIR",
+    os.path.join(os.path.dirname(BASE_DIR), "data", "mail_templates"),
+)
+
+# Nominatim autorise au plus une requête par seconde
+NOMINATIM_RATE_MAX = int(os.environ.get("NOMINATIM_RATE_MAX", 1))
+NOMINATIM_RATE_INTERVAL = int(os.environ.get("NOMINATIM_RATE_INTERVAL", 1))
+NOMINATIM_MAX_WORKERS = int(os.environ.get("NOMINATIM_MAX_WORKERS", 4))
+NOMINATIM_TIMEOUT = 10
+NOMINATIM_MAX_WAIT = 5
+NOMINATIM_USER_AGENT = "agir ({})".format(FRONT_DOMAIN)
+
 
 # SECURITY
 CORS_ORIGIN_ALLOW_ALL = True
@@ -485,6 +521,23 @@ CELERY_WORKER_SEND_TASK_EVENTS = True
 CELERY_TASK_SEND_SENT_EVENT = True
 
 CELERY_RESULT_BACKEND = os.environ.get("BROKER_URL", "redis://")
+CELERY_BEAT_SCHEDULE = {
+    # revalidation périodique de la copie locale des templates d'emails
+    "update-mail-templates": {
+        "task": "agir.lib.tasks.update_mail_templates",
+        "schedule": int(os.environ.get("MAIL_TEMPLATES_REFRESH_INTERVAL", 3600)),
+    },
+    # index local des communes utilisé pour le géocodage hors ligne
+    "update-communes": {
+        "task": "agir.lib.tasks.update_communes",
+        "schedule": crontab(day_of_week=1, hour=4, minute=0),
+    },
+    # nombre d'événements en cours des groupes, qui change avec la date
+    "update-current-events-count": {
+        "task": "agir.groups.tasks.update_current_events_count",
+        "schedule": crontab(hour=3, minute=0),
+    },
+}
 
 DEFAULT_EVENT_IMAGE = "front/images/default_event_pic.jpg"
 
@@ -601,10 +654,15 @@ OVH_SMS_SERVICE = os.environ.get("OVH_SMS_SERVICE")
 OVH_APPLICATION_KEY = os.environ.get("OVH_APPLICATION_KEY")
 OVH_APPLICATION_SECRET = os.environ.get("OVH_APPLICATION_SECRET")
 OVH_CONSUMER_KEY = os.environ.get("OVH_CONSUMER_KEY")
+# fonction renvoyant le client utilisé pour envoyer les SMS (voir agir.lib.sms.LocalSMSClient)
+SMS_CLIENT = os.environ.get("SMS_CLIENT", "agir.lib.sms.create_ovh_client")
 SMS_BUCKET_MAX = 3
 SMS_BUCKET_INTERVAL = 600
 SMS_BUCKET_IP_MAX = 10
 SMS_BUCKET_IP_INTERVAL = 600
+# taille des tranches d'une campagne SMS, et délai en secondes entre deux tranches
+SMS_CAMPAIGN_CHUNK_SIZE = 1000
+SMS_CAMPAIGN_CHUNK_INTERVAL = 10
 
 
 # Short login codes settings
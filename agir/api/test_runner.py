@@ -1,5 +1,6 @@
 import shutil
 import tempfile
+from django.conf import settings
 from django.test import override_settings
 from django.test.runner import DiscoverRunner
 
@@ -31,3 +32,16 @@ class TestRunner(TempMediaMixin, DiscoverRunner):
     def setup_test_environment(self, **kwargs):
         super().setup_test_environment(**kwargs)
         app.conf.task_always_eager = True
+
+        # les tests ne doivent pas réutiliser de résultats de géocodage réels
+        self.geocoding_cache_overrider = override_settings(
+            CACHES={
+                **settings.CACHES,
+                "geocoding": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+            }
+        )
+        self.geocoding_cache_overrider.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        super().teardown_test_environment(**kwargs)
+        self.geocoding_cache_overrider.disable()
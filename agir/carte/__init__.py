@@ -0,0 +1 @@
+default_app_config = "agir.carte.apps.CarteConfig"
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class CarteConfig(AppConfig):
+    name = "agir.carte"
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,94 @@
+from django.db import connection
+
+from .tiles import HALF_CIRCUMFERENCE, MAX_ZOOM
+
+# taille approximative d'un cluster à l'écran, en pixels
+CLUSTER_SIZE = 64
+TILE_SIZE = 256
+
+CLUSTER_SQL = """
+SELECT
+    floor(ST_X(items.projected) / %s) AS cell_x,
+    floor(ST_Y(items.projected) / %s) AS cell_y,
+    items.subtype,
+    count(*),
+    sum(ST_X(items.coordinates::geometry)),
+    sum(ST_Y(items.coordinates::geometry))
+FROM (
+    SELECT
+        {subtype} AS subtype,
+        coordinates,
+        ST_Transform(coordinates::geometry, 3857) AS projected
+    FROM ({items}) AS i
+) AS items
+GROUP BY cell_x, cell_y, items.subtype
+"""
+
+
+def parse_zoom(zoom):
+    try:
+        zoom = int(zoom)
+    except (TypeError, ValueError):
+        return None
+
+    if not 0 <= zoom <= MAX_ZOOM:
+        return None
+
+    return zoom
+
+
+def cell_size(zoom):
+    """Renvoie la taille en mètres (projection Web Mercator) d'une cellule de la grille de clustering
+    """
+    return 2 * HALF_CIRCUMFERENCE / 2 ** zoom * CLUSTER_SIZE / TILE_SIZE
+
+
+def compute_clusters(queryset, subtype_column, zoom):
+    """Regroupe les éléments d'un queryset selon une grille adaptée au niveau de zoom
+
+    Les éléments sont regroupés par cellule directement par PostGIS ; chaque cluster
+    renvoyé indique le barycentre des éléments qu'il contient, leur nombre et leur
+    répartition par sous-type.
+
+    :param queryset: un queryset de modèles possédant un champ `coordinates`, déjà filtré
+    :param subtype_column: le nom de la colonne du queryset qui indique le sous-type
+    :param zoom: le niveau de zoom de la carte
+    :return: une liste de clusters
+    """
+    items_sql, items_params = (
+        queryset.order_by()
+        .values(subtype_column, "coordinates")
+        .query.sql_with_params()
+    )
+
+    sql = CLUSTER_SQL.format(
+        subtype="i." + connection.ops.quote_name(subtype_column), items=items_sql
+    )
+    size = cell_size(zoom)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (size, size, *items_params))
+        rows = cursor.fetchall()
+
+    clusters = {}
+    for cell_x, cell_y, subtype, count, lon, lat in rows:
+        cluster = clusters.setdefault(
+            (cell_x, cell_y), {"count": 0, "lon": 0.0, "lat": 0.0, "subtypes": {}}
+        )
+        cluster["count"] += count
+        cluster["lon"] += lon
+        cluster["lat"] += lat
+        if subtype is not None:
+            cluster["subtypes"][subtype] = count
+
+    return [
+        {
+            "coordinates": {
+                "type": "Point",
+                "coordinates": [c["lon"] / c["count"], c["lat"] / c["count"]],
+            },
+            "count": c["count"],
+            "subtypes": c["subtypes"],
+        }
+        for c in clusters.values()
+    ]
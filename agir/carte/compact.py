@@ -0,0 +1,61 @@
+from django.db.models import Func, FloatField, BigIntegerField
+from rest_framework.renderers import JSONRenderer
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """Renderer JSON sélectionné par le paramètre `?format=compact`
+
+    Les vues de la carte renvoient alors leurs données sous forme de colonnes.
+    """
+
+    format = "compact"
+
+
+class Longitude(Func):
+    function = "ST_X"
+    template = "%(function)s(%(expressions)s::geometry)"
+    output_field = FloatField()
+
+
+class Latitude(Func):
+    function = "ST_Y"
+    template = "%(function)s(%(expressions)s::geometry)"
+    output_field = FloatField()
+
+
+class EpochTime(Func):
+    template = "extract(epoch FROM %(expressions)s)::bigint"
+    output_field = BigIntegerField()
+
+
+def queryset_to_columns(queryset, columns, lookup_columns=()):
+    """Renvoie les données d'un queryset sous forme de tableaux parallèles
+
+    Les coordonnées sont renvoyées sous la forme d'un unique tableau de flottants
+    [lon1, lat1, lon2, lat2, ...]. Les valeurs des colonnes indiquées dans
+    `lookup_columns` sont remplacées par leur index dans une table de correspondance
+    renvoyée sous la clé `lookups`.
+
+    :param queryset: un queryset de modèles possédant un champ `coordinates`
+    :param columns: un dictionnaire associant le nom des colonnes à un nom de champ
+        ou une expression
+    :param lookup_columns: les noms des colonnes à encoder avec une table de correspondance
+    :return: un dictionnaire sérialisable en JSON
+    """
+    names = list(columns)
+    rows = queryset.values_list(
+        *columns.values(), Longitude("coordinates"), Latitude("coordinates")
+    )
+
+    values = list(zip(*rows)) or [()] * (len(names) + 2)
+    data = dict(zip(names, (list(v) for v in values)))
+
+    data["coordinates"] = [c for point in zip(values[-2], values[-1]) for c in point]
+
+    data["lookups"] = {}
+    for name in lookup_columns:
+        table = {}
+        data[name] = [table.setdefault(v, len(table)) for v in data[name]]
+        data["lookups"][name] = list(table)
+
+    return data
@@ -12,7 +12,6 @@ class MapEventSerializer(serializers.ModelSerializer):
 
 class MapGroupSerializer(serializers.ModelSerializer):
     subtype = serializers.SerializerMethodField("get_first_subtype")
-    current_events_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = SupportGroup
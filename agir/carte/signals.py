@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from agir.events.models import Event, OrganizerConfig
+from agir.groups.models import SupportGroup
+from .snapshots import schedule_groups_snapshot_regeneration
+
+
+def schedule_on_commit():
+    transaction.on_commit(schedule_groups_snapshot_regeneration)
+
+
+@receiver(post_save, sender=SupportGroup, dispatch_uid="carte_group_saved")
+@receiver(post_delete, sender=SupportGroup, dispatch_uid="carte_group_deleted")
+def group_changed(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+
+    schedule_on_commit()
+
+
+@receiver(
+    m2m_changed,
+    sender=SupportGroup.subtypes.through,
+    dispatch_uid="carte_group_subtypes_changed",
+)
+def group_subtypes_changed(sender, instance, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        schedule_on_commit()
+
+
+@receiver(post_save, sender=OrganizerConfig, dispatch_uid="carte_organizer_saved")
+@receiver(post_delete, sender=OrganizerConfig, dispatch_uid="carte_organizer_deleted")
+def organizer_config_changed(sender, instance, **kwargs):
+    if kwargs.get("raw") or instance.as_group_id is None:
+        return
+
+    schedule_on_commit()
+
+
+@receiver(post_save, sender=Event, dispatch_uid="carte_event_saved")
+def event_changed(sender, instance, **kwargs):
+    if kwargs.get("raw"):
+        return
+
+    # seuls les événements organisés par un groupe comptent dans la carte des groupes
+    if OrganizerConfig.objects.filter(
+        event_id=instance.pk, as_group__isnull=False
+    ).exists():
+        schedule_on_commit()
@@ -0,0 +1,57 @@
+from hashlib import md5
+
+from django.core.cache import cache
+
+GROUPS_SNAPSHOT_VERSION_KEY = "carte:groups_snapshot:version"
+GROUPS_SNAPSHOT_KEY = "carte:groups_snapshot:{version}"
+GROUPS_SNAPSHOT_PENDING_KEY = "carte:groups_snapshot:pending"
+
+# au-delà, l'instantané est considéré comme périmé (le nombre d'événements en cours change avec le temps)
+SNAPSHOT_MAX_AGE = 3600
+# les anciennes versions restent disponibles un peu plus longtemps pour les requêtes en cours
+SNAPSHOT_RETENTION = 2 * SNAPSHOT_MAX_AGE
+# délai permettant de regrouper les modifications successives en une seule régénération
+SNAPSHOT_REGENERATION_DELAY = 10
+# si la tâche de régénération est perdue, une nouvelle pourra être programmée après ce délai ;
+# une tâche seulement retardée peut être programmée deux fois, ce qui est sans conséquence
+SNAPSHOT_PENDING_TIMEOUT = 6 * SNAPSHOT_REGENERATION_DELAY
+
+
+def get_groups_snapshot():
+    """Renvoie la version actuelle de l'instantané de la carte des groupes
+
+    :return: un tuple (version, contenu JSON) ou None si aucun instantané n'est disponible
+    """
+    version = cache.get(GROUPS_SNAPSHOT_VERSION_KEY)
+    if version is None:
+        return None
+
+    content = cache.get(GROUPS_SNAPSHOT_KEY.format(version=version))
+    if content is None:
+        return None
+
+    return version, content
+
+
+def store_groups_snapshot(content):
+    """Enregistre un nouvel instantané et en fait la version courante
+
+    La version est dérivée du contenu : elle est utilisée comme ETag.
+    """
+    version = md5(content).hexdigest()
+    cache.set(GROUPS_SNAPSHOT_KEY.format(version=version), content, SNAPSHOT_RETENTION)
+    cache.set(GROUPS_SNAPSHOT_VERSION_KEY, version, SNAPSHOT_MAX_AGE)
+    return version
+
+
+def schedule_groups_snapshot_regeneration():
+    """Programme la régénération de l'instantané, sauf si elle est déjà programmée
+    """
+    from .tasks import update_groups_snapshot
+
+    if cache.add(GROUPS_SNAPSHOT_PENDING_KEY, True, SNAPSHOT_PENDING_TIMEOUT):
+        update_groups_snapshot.apply_async(countdown=SNAPSHOT_REGENERATION_DELAY)
+
+
+def clear_groups_snapshot_regeneration():
+    cache.delete(GROUPS_SNAPSHOT_PENDING_KEY)
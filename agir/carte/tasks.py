@@ -0,0 +1,16 @@
+from celery import shared_task
+from rest_framework.renderers import JSONRenderer
+
+from . import snapshots
+from .serializers import MapGroupSerializer
+from .views import GroupsView
+
+
+@shared_task
+def update_groups_snapshot():
+    snapshots.clear_groups_snapshot_regeneration()
+
+    queryset = GroupsView().get_queryset()
+    data = MapGroupSerializer(queryset, many=True).data
+
+    snapshots.store_groups_snapshot(JSONRenderer().render(data))
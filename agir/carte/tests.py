@@ -1,7 +1,15 @@
-from django.test import TestCase
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from agir.lib.tests.mixins import FakeDataMixin
+from .tasks import update_groups_snapshot
+
+
+def streamed_json(res):
+    return json.loads(b"".join(res.streaming_content))
 
 
 class CarteTestCase(FakeDataMixin, TestCase):
@@ -20,3 +28,98 @@ class CarteTestCase(FakeDataMixin, TestCase):
             reverse("carte:single_group_map", args=[self.groups["user1_group"].pk])
         )
         self.assertEqual(res.status_code, 200)
+
+    def test_can_get_vector_tiles(self):
+        for view_name in ["event_tiles", "group_tiles"]:
+            res = self.client.get(
+                reverse("carte:" + view_name, kwargs={"z": 0, "x": 0, "y": 0})
+            )
+            self.assertEqual(res.status_code, 200, f"cannot get '{view_name}'")
+            self.assertEqual(res["Content-Type"], "application/vnd.mapbox-vector-tile")
+
+            res = self.client.get(
+                reverse("carte:" + view_name, kwargs={"z": 0, "x": 0, "y": 0}),
+                HTTP_IF_NONE_MATCH=res["ETag"],
+            )
+            self.assertEqual(res.status_code, 304)
+
+    def test_cannot_get_tile_outside_of_grid(self):
+        res = self.client.get(
+            reverse("carte:event_tiles", kwargs={"z": 1, "x": 2, "y": 0})
+        )
+        self.assertEqual(res.status_code, 404)
+
+    def test_can_get_clusters(self):
+        for view_name in ["event_list", "group_list"]:
+            res = self.client.get(
+                reverse("carte:" + view_name),
+                {"zoom": 5, "bbox": "[-5.3, 41.2, 9.6, 51.2]"},
+            )
+            self.assertEqual(res.status_code, 200, f"cannot get '{view_name}'")
+            for cluster in res.json():
+                self.assertIn("count", cluster)
+                self.assertEqual(
+                    sum(cluster["subtypes"].values()),
+                    cluster["count"],
+                    f"wrong subtype breakdown for '{view_name}'",
+                )
+
+    def test_cannot_get_clusters_with_invalid_zoom(self):
+        res = self.client.get(reverse("carte:event_list"), {"zoom": "loin"})
+        self.assertEqual(res.status_code, 400)
+
+    def test_can_get_compact_format(self):
+        for view_name, fields in [
+            ("event_list", ["id", "name", "subtype", "start_time", "end_time"]),
+            ("group_list", ["id", "name", "type", "subtype", "current_events_count"]),
+        ]:
+            direct = self.client.get(reverse("carte:" + view_name))
+            res = self.client.get(reverse("carte:" + view_name), {"format": "compact"})
+            self.assertEqual(res.status_code, 200, f"cannot get '{view_name}'")
+
+            data = res.json()
+            self.assertCountEqual(
+                data["id"], [item["id"] for item in streamed_json(direct)], view_name
+            )
+            for field in fields:
+                self.assertEqual(len(data[field]), len(data["id"]))
+            self.assertEqual(len(data["coordinates"]), 2 * len(data["id"]))
+
+            for index in data["subtype"]:
+                self.assertIn(index, range(len(data["lookups"]["subtype"])))
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "geocoding": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+    }
+)
+class GroupsSnapshotTestCase(FakeDataMixin, TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_groups_list_is_served_from_snapshot(self):
+        direct = self.client.get(reverse("carte:group_list"))
+        self.assertNotIn("ETag", direct)
+
+        update_groups_snapshot()
+
+        res = self.client.get(reverse("carte:group_list"))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("ETag", res)
+        self.assertCountEqual(
+            [g["id"] for g in res.json()], [g["id"] for g in streamed_json(direct)]
+        )
+
+        res = self.client.get(
+            reverse("carte:group_list"), HTTP_IF_NONE_MATCH=res["ETag"]
+        )
+        self.assertEqual(res.status_code, 304)
+
+    def test_filtered_groups_list_is_not_served_from_snapshot(self):
+        update_groups_snapshot()
+
+        res = self.client.get(reverse("carte:group_list"), {"subtype": "certifié"})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("ETag", res)
@@ -0,0 +1,132 @@
+import math
+
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+from rest_framework.renderers import BaseRenderer
+
+# demi-circonférence de la terre en projection Web Mercator (EPSG:3857)
+HALF_CIRCUMFERENCE = 20_037_508.342_789_244
+
+MAX_ZOOM = 20
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+TILE_SQL = """
+SELECT ST_AsMVT(tile.*, %s, %s, 'geom')
+FROM (
+    SELECT {columns}, ST_AsMVTGeom(
+        ST_Transform(items.coordinates::geometry, 3857),
+        ST_MakeEnvelope(%s, %s, %s, %s, 3857),
+        %s,
+        %s,
+        true
+    ) AS geom
+    FROM ({items}) AS items
+) AS tile
+WHERE tile.geom IS NOT NULL
+"""
+
+
+class MVTRenderer(BaseRenderer):
+    """Renderer permettant à DRF d'accepter les requêtes de tuiles vectorielles
+
+    Les vues de tuiles renvoient directement le contenu binaire de la tuile.
+    """
+
+    media_type = "application/vnd.mapbox-vector-tile"
+    format = "mvt"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+def check_tile(z, x, y):
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError(f"Niveau de zoom invalide : {z}")
+
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tuile invalide : {z}/{x}/{y}")
+
+
+def tile_mercator_bounds(z, x, y):
+    """Renvoie les limites (xmin, ymin, xmax, ymax) de la tuile en projection Web Mercator
+    """
+    size = 2 * HALF_CIRCUMFERENCE / 2 ** z
+
+    xmin = -HALF_CIRCUMFERENCE + x * size
+    ymax = HALF_CIRCUMFERENCE - y * size
+
+    return xmin, ymax - size, xmin + size, ymax
+
+
+def tile_lonlat_polygon(z, x, y):
+    """Renvoie un polygone en coordonnées WGS84 couvrant la tuile et sa zone tampon
+
+    Ce polygone permet de filtrer les éléments de la tuile en utilisant l'index spatial
+    de la colonne `coordinates`.
+    """
+    n = 2 ** z
+    margin = TILE_BUFFER / TILE_EXTENT
+
+    def lon(tile_x):
+        return max(-180.0, min(180.0, tile_x / n * 360.0 - 180.0))
+
+    def lat(tile_y):
+        tile_y = max(0, min(n, tile_y))
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return Polygon.from_bbox(
+        (lon(x - margin), lat(y + 1 + margin), lon(x + 1 + margin), lat(y - margin))
+    )
+
+
+def render_tile(queryset, layer_name, columns, z, x, y):
+    """Génère une tuile vectorielle Mapbox (MVT) à partir d'un queryset
+
+    :param queryset: un queryset de modèles possédant un champ `coordinates`, déjà filtré
+    :param layer_name: le nom de la couche dans la tuile générée
+    :param columns: un dictionnaire associant le nom des propriétés de la tuile au nom des colonnes
+        du queryset, éventuellement accompagnés d'une conversion SQL, sous la forme d'un tuple
+        (nom de la colonne, format SQL) où `{}` représente la colonne
+    :return: le contenu binaire de la tuile
+    """
+    fields = set()
+    column_expressions = []
+
+    for property_name, column in columns.items():
+        if isinstance(column, tuple):
+            field_name, template = column
+        else:
+            field_name, template = column, "{}"
+
+        fields.add(field_name)
+        column = "items." + connection.ops.quote_name(field_name)
+        column_expressions.append(
+            f"{template.format(column)} AS {connection.ops.quote_name(property_name)}"
+        )
+
+    items_sql, items_params = (
+        queryset.filter(coordinates__intersects=tile_lonlat_polygon(z, x, y))
+        .order_by()
+        .values(*fields, "coordinates")
+        .query.sql_with_params()
+    )
+
+    sql = TILE_SQL.format(columns=", ".join(column_expressions), items=items_sql)
+    params = (
+        layer_name,
+        TILE_EXTENT,
+        *tile_mercator_bounds(z, x, y),
+        TILE_EXTENT,
+        TILE_BUFFER,
+        *items_params,
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    return bytes(row[0]) if row and row[0] is not None else b""
@@ -6,6 +6,16 @@ app_name = "carte"
 urlpatterns = [
     path("liste_evenements/", views.EventsView.as_view(), name="event_list"),
     path("liste_groupes/", views.GroupsView.as_view(), name="group_list"),
+    path(
+        "tiles/events/<int:z>/<int:x>/<int:y>.mvt",
+        views.EventsTileView.as_view(),
+        name="event_tiles",
+    ),
+    path(
+        "tiles/groups/<int:z>/<int:x>/<int:y>.mvt",
+        views.GroupsTileView.as_view(),
+        name="group_tiles",
+    ),
     path("evenements/", views.EventMapView.as_view(), name="events_map"),
     path(
         "evenements/<uuid:pk>/",
@@ -1,25 +1,29 @@
 import json
-from datetime import timedelta
 
 from django.contrib.gis.geos import Polygon
-from django.db.models import Case, When, Value, BooleanField, Q, Count
-from django.utils.timezone import now
+from django.db.models import Case, When, Value, BooleanField, Subquery, OuterRef
 from django.utils.translation import ugettext as _
 from django.utils.html import mark_safe
 from django.views.generic import TemplateView, DetailView
 from django.views.decorators import cache
 from django.views.decorators.clickjacking import xframe_options_exempt
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework.authentication import SessionAuthentication
-from rest_framework.generics import ListAPIView
+from rest_framework.generics import ListAPIView, GenericAPIView
 from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 import django_filters
 from django_filters.rest_framework.backends import DjangoFilterBackend
-from django.http import QueryDict, Http404
+from django.http import QueryDict, Http404, HttpResponse
+from hashlib import md5
 
 from ..events.models import Event, EventSubtype
 from ..groups.models import SupportGroup, SupportGroupSubtype
+from ..lib.views import StreamingListMixin
 
-from . import serializers
+from . import serializers, tiles, clusters, snapshots, compact
 
 
 def parse_bounds(bounds):
@@ -56,7 +60,7 @@ class BBoxFilterBackend(object):
         if not "bbox" in request.query_params:
             return queryset
 
-        bbox = request.query_params["bbox"]
+        bbox = parse_bounds(request.query_params["bbox"])
 
         if bbox is None:
             raise ValidationError(self.error_message)
@@ -94,10 +98,6 @@ class EventFilterSet(django_filters.rest_framework.FilterSet):
 
         super().__init__(data, *args, **kwargs)
 
-    @property
-    def qs(self):
-        return super().qs[:5000]
-
     def filter_include_past(self, queryset, name, value):
         if not value:
             return queryset.upcoming(published_only=False)
@@ -115,8 +115,70 @@ class EventFilterSet(django_filters.rest_framework.FilterSet):
         fields = ("subtype", "include_past")
 
 
-class EventsView(ListAPIView):
-    serializer_class = serializers.MapEventSerializer
+class MapListMixin(StreamingListMixin):
+    """Mixin des vues de liste de la carte
+
+    Ces vues peuvent renvoyer, en plus de la liste habituelle :
+    - des clusters si le paramètre `zoom` est fourni ;
+    - les données sous forme de colonnes avec le paramètre `format=compact`.
+    """
+
+    renderer_classes = (
+        *StreamingListMixin.renderer_classes,
+        compact.CompactJSONRenderer,
+    )
+
+    cluster_subtype_column = None
+    compact_columns = None
+    compact_lookup_columns = ("subtype",)
+    max_results = None
+
+    zoom_error_message = _(
+        "Le paramètre zoom devrait être un entier entre 0 et {}.".format(tiles.MAX_ZOOM)
+    )
+
+    def get_cluster_queryset(self, queryset):
+        return queryset
+
+    def get_compact_queryset(self, queryset):
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        if "zoom" in request.query_params:
+            zoom = clusters.parse_zoom(request.query_params["zoom"])
+            if zoom is None:
+                raise ValidationError({"zoom": self.zoom_error_message})
+
+            return Response(
+                clusters.compute_clusters(
+                    self.get_cluster_queryset(queryset),
+                    self.cluster_subtype_column,
+                    zoom,
+                )
+            )
+
+        compact_format = isinstance(
+            request.accepted_renderer, compact.CompactJSONRenderer
+        )
+        if compact_format:
+            queryset = self.get_compact_queryset(queryset)
+
+        if self.max_results is not None:
+            queryset = queryset[: self.max_results]
+
+        if compact_format:
+            return Response(
+                compact.queryset_to_columns(
+                    queryset, self.compact_columns, self.compact_lookup_columns
+                )
+            )
+
+        return self.get_list_response(queryset)
+
+
+class EventListMixin:
     filter_backends = (BBoxFilterBackend, DjangoFilterBackend)
     filterset_class = EventFilterSet
     authentication_classes = [SessionAuthentication]
@@ -129,6 +191,19 @@ class EventsView(ListAPIView):
             qs = qs.published()
         return qs.filter(coordinates__isnull=False).select_related("subtype")
 
+
+class EventsView(MapListMixin, EventListMixin, ListAPIView):
+    serializer_class = serializers.MapEventSerializer
+    cluster_subtype_column = "subtype_id"
+    compact_columns = {
+        "id": "id",
+        "name": "name",
+        "subtype": "subtype_id",
+        "start_time": compact.EpochTime("start_time"),
+        "end_time": compact.EpochTime("end_time"),
+    }
+    max_results = 5000
+
     @cache.cache_control(max_age=300, public=True)
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
@@ -146,41 +221,121 @@ class GroupFilterSet(django_filters.rest_framework.FilterSet):
         fields = ("subtype",)
 
 
-class GroupsView(ListAPIView):
-    serializer_class = serializers.MapGroupSerializer
+class GroupListMixin:
     filter_backends = (BBoxFilterBackend, DjangoFilterBackend)
     filterset_class = GroupFilterSet
-    queryset = (
-        SupportGroup.objects.active()
-        .filter(coordinates__isnull=False)
-        .prefetch_related("subtypes")
-    )
     authentication_classes = []
 
-    @cache.cache_control(max_age=300, public=True)
-    def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
-
     def get_queryset(self):
         return (
             SupportGroup.objects.active()
             .filter(coordinates__isnull=False)
             .prefetch_related("subtypes")
-            .annotate(
-                current_events_count=Count(
-                    "organized_events",
-                    filter=Q(
-                        organized_events__start_time__range=(
-                            now() - timedelta(days=62),
-                            now() + timedelta(days=31),
-                        ),
-                        organized_events__visibility=Event.VISIBILITY_PUBLIC,
-                    ),
-                )
+        )
+
+    @staticmethod
+    def annotate_first_subtype(queryset):
+        return queryset.annotate(
+            first_subtype=Subquery(
+                SupportGroup.subtypes.through.objects.filter(
+                    supportgroup_id=OuterRef("pk")
+                ).values("supportgroupsubtype_id")[:1]
             )
         )
 
 
+class GroupsView(MapListMixin, GroupListMixin, ListAPIView):
+    serializer_class = serializers.MapGroupSerializer
+    cluster_subtype_column = "first_subtype"
+    compact_columns = {
+        "id": "id",
+        "name": "name",
+        "type": "type",
+        "subtype": "first_subtype",
+        "current_events_count": "current_events_count",
+    }
+    compact_lookup_columns = ("type", "subtype")
+
+    def get_cluster_queryset(self, queryset):
+        return self.annotate_first_subtype(queryset)
+
+    def get_compact_queryset(self, queryset):
+        return self.annotate_first_subtype(queryset)
+
+    @cache.cache_control(max_age=300, public=True)
+    def get(self, request, *args, **kwargs):
+        # la carte complète des groupes est servie depuis un instantané précalculé
+        if not request.query_params:
+            snapshot = snapshots.get_groups_snapshot()
+
+            if snapshot is None:
+                snapshots.schedule_groups_snapshot_regeneration()
+            else:
+                version, content = snapshot
+                etag = quote_etag(version)
+                response = get_conditional_response(request, etag=etag)
+                if response is None:
+                    response = HttpResponse(content, content_type="application/json")
+                response["ETag"] = etag
+                return response
+
+        return super().get(request, *args, **kwargs)
+
+
+class TileView(GenericAPIView):
+    """Vue abstraite renvoyant une tuile vectorielle (MVT) pour une couche de la carte
+    """
+
+    renderer_classes = (JSONRenderer, tiles.MVTRenderer)
+    layer_name = None
+    tile_columns = None
+
+    @cache.cache_control(max_age=300, public=True)
+    def get(self, request, *args, z, x, y, **kwargs):
+        try:
+            tiles.check_tile(z, x, y)
+        except ValueError:
+            raise Http404()
+
+        queryset = self.filter_queryset(self.get_queryset())
+        content = tiles.render_tile(
+            queryset, self.layer_name, self.tile_columns, z, x, y
+        )
+
+        etag = quote_etag(md5(content).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type=tiles.MVTRenderer.media_type)
+        response["ETag"] = etag
+
+        return response
+
+
+class EventsTileView(EventListMixin, TileView):
+    layer_name = "events"
+    tile_columns = {
+        "id": ("id", "{}::text"),
+        "name": "name",
+        "subtype": "subtype_id",
+        "start_time": ("start_time", "extract(epoch FROM {})::bigint"),
+        "end_time": ("end_time", "extract(epoch FROM {})::bigint"),
+    }
+
+
+class GroupsTileView(GroupListMixin, TileView):
+    layer_name = "groups"
+    tile_columns = {
+        "id": ("id", "{}::text"),
+        "name": "name",
+        "type": "type",
+        "subtype": "first_subtype",
+        "current_events_count": "current_events_count",
+    }
+
+    def get_queryset(self):
+        return self.annotate_first_subtype(super().get_queryset())
+
+
 class MapViewMixin:
     @xframe_options_exempt
     def get(self, request, *args, **kwargs):
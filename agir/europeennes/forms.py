@@ -13,7 +13,7 @@ from django_countries.fields import LazyTypedChoiceField
 from agir.donations.base_forms import SimpleDonationForm, SimpleDonorForm
 from agir.donations.form_fields import AskAmountField
 from agir.europeennes.apps import EuropeennesConfig
-from agir.lib.data import departements_choices
+from agir.lib import data
 from agir.lib.form_fields import IBANField
 from agir.payments.models import Payment
 from agir.payments.payment_modes import PaymentModeField, PAYMENT_MODES
@@ -58,8 +58,8 @@ class LenderForm(SimpleDonorForm):
     city_of_birth = forms.CharField(label="Ville de naissance", required=True)
     departement_of_birth = forms.ChoiceField(
         label="Département de naissance (France uniquement)",
-        choices=(("", "Indiquez votre département de naissance"),)
-        + departements_choices,
+        choices=lambda: (("", "Indiquez votre département de naissance"),)
+        + data.departements_choices,
         required=False,
     )
 
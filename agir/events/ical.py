@@ -0,0 +1,125 @@
+"""Génération des calendriers au format iCalendar
+
+Chaque événement n'est sérialisé qu'une fois par version : la sérialisation est
+conservée dans le cache, sous une clé qui dépend de sa date de modification. Les
+calendriers complets sont envoyés en flux, et les vues renvoient un ETag pour
+permettre les requêtes conditionnelles.
+"""
+import hashlib
+
+import ics
+from django.core.cache import cache
+from django.http import StreamingHttpResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+# à incrémenter quand le format de sérialisation change
+ICS_CACHE_VERSION = 1
+ICS_CACHE_TIMEOUT = 7 * 24 * 3600
+ICS_BATCH_SIZE = 500
+
+
+def event_ics_key(pk, modified):
+    return f"ics:{ICS_CACHE_VERSION}:event:{pk}:{modified.timestamp()}"
+
+
+def serialize_events(events):
+    """Renvoie la sérialisation iCalendar de chacun des événements, dans l'ordre
+
+    Les sérialisations sont récupérées dans le cache par lots ; seuls les
+    événements absents du cache, ou modifiés depuis, sont sérialisés.
+    """
+    batch = []
+    for event in events:
+        batch.append(event)
+        if len(batch) >= ICS_BATCH_SIZE:
+            yield from _serialize_batch(batch)
+            batch = []
+
+    yield from _serialize_batch(batch)
+
+
+def _serialize_batch(events):
+    keys = [event_ics_key(event.pk, event.modified) for event in events]
+    cached = cache.get_many(keys)
+
+    missing = {
+        key: str(event.to_ics())
+        for key, event in zip(keys, events)
+        if key not in cached
+    }
+    if missing:
+        cache.set_many(missing, ICS_CACHE_TIMEOUT)
+
+    return [cached.get(key) or missing[key] for key in keys]
+
+
+def stream_calendar(events):
+    """Génère le calendrier contenant les événements, morceau par morceau
+    """
+    head, end, tail = str(ics.Calendar()).rpartition("END:VCALENDAR")
+
+    yield head
+    for serialized_event in serialize_events(events):
+        yield serialized_event.rstrip("\r\n") + "\r\n"
+    yield end + tail
+
+
+def calendar_ics(events):
+    return "".join(stream_calendar(events))
+
+
+def calendar_version(events):
+    """Renvoie l'ETag d'un calendrier
+
+    Seuls les identifiants et dates de modification des événements sont lus : l'ETag
+    change dès qu'un événement est ajouté, retiré ou modifié. Aucun en-tête
+    Last-Modified n'est dérivé de ces dates : le retrait d'un événement ne change
+    pas la plus récente d'entre elles.
+    """
+    digest = hashlib.sha1(str(ICS_CACHE_VERSION).encode())
+    for pk, modified in events.order_by("pk").values_list("pk", "modified"):
+        digest.update(f"{pk}:{modified.timestamp()};".encode())
+
+    return quote_etag(digest.hexdigest())
+
+
+class ICSViewMixin:
+    """Mixin pour les vues renvoyant un calendrier au format iCalendar
+
+    Les sous-classes doivent implémenter `get_ics_events`, qui renvoie le queryset des
+    événements du calendrier.
+    """
+
+    def get_ics_events(self):
+        raise NotImplementedError()
+
+    def render_to_response(self, context, **response_kwargs):
+        events = self.get_ics_events()
+        etag = calendar_version(events)
+
+        response = get_conditional_response(self.request, etag=etag)
+
+        if response is None:
+            body_key = f"ics:{ICS_CACHE_VERSION}:calendar:{etag}"
+            body = cache.get(body_key)
+
+            if body is not None:
+                response = HttpResponse(body, content_type="text/calendar")
+            else:
+                response = StreamingHttpResponse(
+                    self._stream_and_cache(events, body_key),
+                    content_type="text/calendar",
+                )
+
+        response["ETag"] = etag
+
+        return response
+
+    def _stream_and_cache(self, events, body_key):
+        parts = []
+        for part in stream_calendar(events.order_by("start_time", "pk")):
+            parts.append(part)
+            yield part
+
+        cache.set(body_key, "".join(parts), ICS_CACHE_TIMEOUT)
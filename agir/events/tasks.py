@@ -1,7 +1,6 @@
 import smtplib
 from collections import OrderedDict
 
-import ics
 import requests
 import socket
 from celery import shared_task
@@ -19,7 +18,12 @@ from agir.lib.display import str_summary
 from agir.lib.html import sanitize_html
 from agir.people.models import Person
 from ..lib.utils import front_url
-from ..people.actions.mailing import send_mosaico_email
+from ..people.actions.mailing import (
+    send_mosaico_email,
+    dispatch_notification,
+    send_notification_chunk,
+)
+from .ical import calendar_ics
 from .models import Event, RSVP, OrganizerConfig
 
 a = requests.adapters.HTTPAdapter(max_retries=Retry(total=5, backoff_factor=1))
@@ -76,7 +80,7 @@ def send_event_creation_notification(self, organizer_config_pk):
             attachments=(
                 {
                     "filename": "event.ics",
-                    "content": str(ics.Calendar(events=[event.to_ics()])),
+                    "content": calendar_ics([event]),
                     "mimetype": "text/calendar",
                 },
             ),
@@ -85,14 +89,37 @@ def send_event_creation_notification(self, organizer_config_pk):
         self.retry(countdown=60, exc=exc)
 
 
-@shared_task(max_retries=2, bind=True)
-def send_event_changed_notification(self, event_pk, changes):
+def notified_attendees(event):
+    notifications_enabled = Q(notifications_enabled=True) & Q(
+        person__event_notifications=True
+    )
+    return event.rsvps.filter(notifications_enabled).values_list("person_id", flat=True)
+
+
+@shared_task
+def send_event_changed_notification(event_pk, changes):
     try:
         event = Event.objects.get(pk=event_pk)
     except Event.DoesNotExist:
         # event does not exist anymore ?! nothing to do
         return
 
+    dispatch_notification(
+        send_event_changed_notification_chunk,
+        [str(event_pk), changes],
+        notified_attendees(event),
+    )
+
+
+@shared_task(max_retries=2, bind=True)
+def send_event_changed_notification_chunk(
+    self, event_pk, changes, notification_id, person_pks
+):
+    try:
+        event = Event.objects.get(pk=event_pk)
+    except Event.DoesNotExist:
+        return
+
     change_descriptions = [
         desc for label, desc in CHANGE_DESCRIPTION.items() if label in changes
     ]
@@ -100,16 +127,6 @@ def send_event_changed_notification(self, event_pk, changes):
         template_name="lib/list_fragment.html", context={"items": change_descriptions}
     )
 
-    notifications_enabled = Q(notifications_enabled=True) & Q(
-        person__event_notifications=True
-    )
-    recipients = [
-        rsvp.person
-        for rsvp in event.rsvps.filter(notifications_enabled).prefetch_related(
-            "person__emails"
-        )
-    ]
-
     bindings = {
         "EVENT_NAME": event.name,
         "EVENT_CHANGES": change_fragment,
@@ -117,18 +134,19 @@ def send_event_changed_notification(self, event_pk, changes):
         "EVENT_QUIT_LINK": front_url("quit_event", kwargs={"pk": event_pk}),
     }
     try:
-        send_mosaico_email(
+        send_notification_chunk(
+            notification_id,
+            person_pks,
             code="EVENT_CHANGED",
             subject=_(
                 "Les informations d'un événement auquel vous assistez ont été changées"
             ),
             from_email=settings.EMAIL_FROM,
-            recipients=recipients,
             bindings=bindings,
             attachments=(
                 {
                     "filename": "event.ics",
-                    "content": str(ics.Calendar(events=[event.to_ics()])),
+                    "content": calendar_ics([event]),
                     "mimetype": "text/calendar",
                 },
             ),
@@ -174,7 +192,7 @@ def send_rsvp_notification(self, rsvp_pk):
         attachments=(
             {
                 "filename": "event.ics",
-                "content": str(ics.Calendar(events=[rsvp.event.to_ics()])),
+                "content": calendar_ics([rsvp.event]),
                 "mimetype": "text/calendar",
             },
         ),
@@ -231,8 +249,8 @@ def send_guest_confirmation(self, rsvp_pk):
         self.retry(countdown=60, exc=exc)
 
 
-@shared_task(max_retries=2, bind=True)
-def send_cancellation_notification(self, event_pk):
+@shared_task
+def send_cancellation_notification(event_pk):
     try:
         event = Event.objects.get(pk=event_pk)
     except Event.DoesNotExist:
@@ -242,27 +260,27 @@ def send_cancellation_notification(self, event_pk):
     if event.visibility != Event.VISIBILITY_ADMIN:
         return
 
-    event_name = event.name
-
-    notifications_enabled = Q(notifications_enabled=True) & Q(
-        person__event_notifications=True
+    dispatch_notification(
+        send_cancellation_notification_chunk, [str(event_pk)], notified_attendees(event)
     )
 
-    recipients = [
-        rsvp.person
-        for rsvp in event.rsvps.filter(notifications_enabled).prefetch_related(
-            "person__emails"
-        )
-    ]
 
-    bindings = {"EVENT_NAME": event_name}
+@shared_task(max_retries=2, bind=True)
+def send_cancellation_notification_chunk(self, event_pk, notification_id, person_pks):
+    try:
+        event = Event.objects.get(pk=event_pk)
+    except Event.DoesNotExist:
+        return
+
+    bindings = {"EVENT_NAME": event.name}
 
     try:
-        send_mosaico_email(
+        send_notification_chunk(
+            notification_id,
+            person_pks,
             code="EVENT_CANCELLATION",
             subject=_("Un événement auquel vous participiez a été annulé"),
             from_email=settings.EMAIL_FROM,
-            recipients=recipients,
             bindings=bindings,
         )
     except (smtplib.SMTPException, socket.error) as exc:
@@ -255,8 +255,9 @@ class LegacyEventViewSetTestCase(TestCase):
         response = self.client.get("/legacy/events/summary/")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
 
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(json.loads(b"".join(response.streaming_content))), 1)
 
 
 class FiltersTestCase(APITestCase):
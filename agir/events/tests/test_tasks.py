@@ -1,3 +1,6 @@
+from unittest.mock import patch
+from uuid import uuid4
+
 from django.test import TestCase
 from django.utils import timezone
 from django.core import mail
@@ -130,6 +133,33 @@ class EventTasksTestCase(TestCase):
             self.assert_(str(tasks.CHANGE_DESCRIPTION["timing"]) in text)
             self.assert_(str(tasks.CHANGE_DESCRIPTION["contact"]) not in text)
 
+    @patch("agir.people.actions.mailing.NOTIFICATION_CHUNK_SIZE", 1)
+    def test_changed_event_notification_is_sent_in_chunks(self):
+        with patch.object(
+            tasks.send_event_changed_notification_chunk,
+            "si",
+            wraps=tasks.send_event_changed_notification_chunk.si,
+        ) as si:
+            tasks.send_event_changed_notification(self.event.pk, ["information"])
+
+        self.assertEqual(si.call_count, 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_changed_event_notification_chunk_is_idempotent(self):
+        notification_id = uuid4().hex
+        person_pks = [str(self.attendee1.pk), str(self.attendee2.pk)]
+
+        tasks.send_event_changed_notification_chunk(
+            str(self.event.pk), ["information"], notification_id, person_pks
+        )
+        self.assertEqual(len(mail.outbox), 2)
+
+        # une nouvelle tentative n'envoie rien aux personnes déjà notifiées
+        tasks.send_event_changed_notification_chunk(
+            str(self.event.pk), ["information"], notification_id, person_pks
+        )
+        self.assertEqual(len(mail.outbox), 2)
+
     def test_send_event_report_mail(self):
         tasks.send_event_report(self.event.pk)
         self.assertEqual(len(mail.outbox), 2)
@@ -1310,6 +1310,39 @@ class CalendarPageTestCase(TestCase):
         self.assertContains(res, '<li class="previous">')
         self.assertContains(res, 'href="?page=1"')
 
+    def test_ics_calendar_is_streamed_and_revalidated(self):
+        res = self.client.get("/agenda/my_calendar/icalendar/")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        content = b"".join(res.streaming_content).decode()
+        self.assertTrue(content.startswith("BEGIN:VCALENDAR"))
+        self.assertEqual(content.count("BEGIN:VEVENT"), 20)
+        self.assertIn("Event 19", content)
+
+        etag = res["ETag"]
+        self.assertNotIn("Last-Modified", res)
+        res = self.client.get("/agenda/my_calendar/icalendar/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        CalendarItem.objects.filter(
+            calendar=self.calendar, event=self.calendar.events.last()
+        ).delete()
+        res = self.client.get("/agenda/my_calendar/icalendar/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            b"".join(res.streaming_content).decode().count("BEGIN:VEVENT"), 19
+        )
+        etag = res["ETag"]
+
+        event = self.calendar.events.first()
+        event.name = "Nouveau nom"
+        event.save()
+
+        res = self.client.get("/agenda/my_calendar/icalendar/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+        self.assertIn("Nouveau nom", b"".join(res.streaming_content).decode())
+
 
 class ExternalRSVPTestCase(TestCase):
     def setUp(self):
@@ -1,4 +1,3 @@
-import ics
 from datetime import timedelta, datetime
 from django.conf import settings
 from django.contrib import messages
@@ -63,6 +62,7 @@ from ..forms import (
     SearchEventForm,
     EventLegalForm,
 )
+from ..ical import ICSViewMixin
 from ..models import Event, RSVP, Calendar, EventSubtype
 from ..tasks import (
     send_cancellation_notification,
@@ -261,15 +261,13 @@ class EventParticipationView(
         return context_data
 
 
-class EventIcsView(PermissionsRequiredMixin, DetailView):
+class EventIcsView(ICSViewMixin, PermissionsRequiredMixin, DetailView):
     model = Event
     permissions_required = ("events.view_event",)
     permission_denied_to_not_found = True
 
-    def render_to_response(self, context, **response_kwargs):
-        ics_calendar = ics.Calendar(events=[context["event"].to_ics()])
-
-        return HttpResponse(ics_calendar, content_type="text/calendar")
+    def get_ics_events(self):
+        return Event.objects.filter(pk=self.object.pk)
 
 
 class ManageEventView(HardLoginRequiredMixin, PermissionsRequiredMixin, DetailView):
@@ -602,20 +600,11 @@ class CalendarView(ObjectOpengraphMixin, DetailView):
         return list(ids)
 
 
-class CalendarIcsView(DetailView):
+class CalendarIcsView(ICSViewMixin, DetailView):
     model = Calendar
 
-    def render_to_response(self, context, **response_kwargs):
-        calendar = ics.Calendar(
-            events=[
-                event.to_ics()
-                for event in self.object.events.filter(
-                    visibility=Event.VISIBILITY_PUBLIC
-                )
-            ]
-        )
-
-        return HttpResponse(calendar, content_type="text/calendar")
+    def get_ics_events(self):
+        return self.object.events.filter(visibility=Event.VISIBILITY_PUBLIC)
 
 
 class ChangeEventLocationView(
@@ -4,7 +4,6 @@ from django.utils import timezone
 from django.views.decorators.cache import cache_control
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import action, authentication_classes
-from rest_framework.response import Response
 from ..authentication.models import Role
 import django_filters
 from django_filters.rest_framework.backends import DjangoFilterBackend
@@ -12,7 +11,11 @@ from django_filters.rest_framework.backends import DjangoFilterBackend
 from ..lib.permissions import PermissionsOrReadOnly, RestrictViewPermissions
 from ..lib.pagination import LegacyPaginator
 from ..lib.filters import DistanceFilter, OrderByDistanceToBackend
-from ..lib.views import NationBuilderViewMixin, CreationSerializerMixin
+from ..lib.views import (
+    NationBuilderViewMixin,
+    CreationSerializerMixin,
+    StreamingListMixin,
+)
 
 from . import serializers, models
 
@@ -35,7 +38,7 @@ class EventFilterSet(django_filters.rest_framework.FilterSet):
         fields = ("contact_email", "close_to", "path", "before", "after")
 
 
-class LegacyEventViewSet(NationBuilderViewMixin, ModelViewSet):
+class LegacyEventViewSet(StreamingListMixin, NationBuilderViewMixin, ModelViewSet):
     """
     Legacy endpoint for events that imitates the endpoint from Eve Python
     """
@@ -100,10 +103,12 @@ class LegacyEventViewSet(NationBuilderViewMixin, ModelViewSet):
             .filter(end_time__gt=timezone.now())
             .prefetch_related("tags")
         )
-        serializer = serializers.SummaryEventSerializer(
-            instance=events, many=True, context=self.get_serializer_context()
+        return self.get_list_response(
+            events,
+            serializer=serializers.SummaryEventSerializer(
+                context=self.get_serializer_context()
+            ),
         )
-        return Response(data=serializer.data)
 
 
 class CalendarViewSet(ModelViewSet):
@@ -1,2 +1,3 @@
 from .promo_codes import *
 from .export import *
+from .events_count import *
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from agir.events.models import Event, OrganizerConfig
+
+__all__ = ["update_current_events_count"]
+
+# les événements pris en compte sont ceux commençant dans cet intervalle autour de la date actuelle
+CURRENT_EVENTS_WINDOW = (timedelta(days=-62), timedelta(days=31))
+
+
+def current_events_count_subquery(as_of=None):
+    if as_of is None:
+        as_of = timezone.now()
+
+    return Coalesce(
+        Subquery(
+            OrganizerConfig.objects.filter(
+                as_group_id=OuterRef("pk"),
+                event__start_time__range=(
+                    as_of + CURRENT_EVENTS_WINDOW[0],
+                    as_of + CURRENT_EVENTS_WINDOW[1],
+                ),
+                event__visibility=Event.VISIBILITY_PUBLIC,
+            )
+            .order_by()
+            .values("as_group_id")
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def update_current_events_count(queryset, as_of=None):
+    """Recalcule le nombre d'événements en cours des groupes du queryset
+
+    :param queryset: un queryset de groupes
+    :param as_of: la date par rapport à laquelle calculer les événements en cours
+    :return: le nombre de groupes mis à jour
+    """
+    return queryset.update(current_events_count=current_events_count_subquery(as_of))
@@ -1,20 +1,16 @@
-from datetime import timedelta
-
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.gis.admin import OSMGeoAdmin
-from django.db.models import Count, Q, QuerySet
+from django.db.models import QuerySet
 from django.db.models.expressions import RawSQL
 from django.urls import path
 from django.urls import reverse
-from django.utils import timezone
 from django.utils.html import format_html, escape
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from functools import partial, update_wrapper
 
 from agir.api.admin import admin_site
-from agir.events.models import Event
 from agir.lib.admin import CenterOnFranceMixin, DepartementListFilter, RegionListFilter
 from agir.lib.display import display_price
 from agir.lib.utils import front_url
@@ -54,18 +50,6 @@ class GroupHasEventsFilter(admin.SimpleListFilter):
         return (("yes", _("Oui")), ("no", _("Non")))
 
     def queryset(self, request, queryset):
-        queryset = queryset.annotate(
-            current_events_count=Count(
-                "organized_events",
-                filter=Q(
-                    organized_events__start_time__range=(
-                        timezone.now() - timedelta(days=62),
-                        timezone.now() + timedelta(days=31),
-                    ),
-                    organized_events__visibility=Event.VISIBILITY_PUBLIC,
-                ),
-            )
-        )
         if self.value() == "yes":
             return queryset.exclude(current_events_count=0)
         if self.value() == "no":
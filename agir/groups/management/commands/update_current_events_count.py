@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+
+from agir.groups.actions.events_count import update_current_events_count
+from agir.groups.models import SupportGroup
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the current events count of all support groups as the date window moves"
+    )
+
+    def handle(self, *args, **options):
+        updated = update_current_events_count(SupportGroup.objects.all())
+
+        if options["verbosity"] > 1:
+            self.stdout.write(f"Updated {updated} groups.")
@@ -0,0 +1,38 @@
+# Generated by Django 2.2 on 2019-05-27 10:12
+
+from django.db import migrations, models
+
+
+UPDATE_COUNT_SQL = """
+UPDATE groups_supportgroup AS g
+SET current_events_count = (
+    SELECT count(*)
+    FROM events_organizerconfig AS o
+    JOIN events_event AS e ON e.id = o.event_id
+    WHERE o.as_group_id = g.id
+    AND e.visibility = 'P'
+    AND e.start_time BETWEEN now() - interval '62 days' AND now() + interval '31 days'
+);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("groups", "0034_auto_20190419_1153"),
+        ("events", "0075_recherche_evenement_plein_texte"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="supportgroup",
+            name="current_events_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Le nombre d'événements publics organisés par le groupe dans les 2 mois précédents ou le mois à venir. Mis à jour automatiquement.",
+                verbose_name="nombre d'événements en cours",
+            ),
+        ),
+        migrations.RunSQL(sql=UPDATE_COUNT_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -87,6 +87,16 @@ class SupportGroup(
         "people.Person", related_name="supportgroups", through="Membership", blank=True
     )
 
+    current_events_count = models.PositiveIntegerField(
+        _("nombre d'événements en cours"),
+        default=0,
+        editable=False,
+        help_text=_(
+            "Le nombre d'événements publics organisés par le groupe dans les 2 mois précédents ou le mois à venir."
+            " Mis à jour automatiquement."
+        ),
+    )
+
     @property
     def is_certified(self):
         return self.subtypes.filter(
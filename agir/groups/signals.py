@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from agir.events.models import Event, OrganizerConfig
+from .actions.events_count import update_current_events_count
+from .models import SupportGroup
+
+
+@receiver(post_save, sender=Event, dispatch_uid="group_event_saved_update_count")
+def update_count_on_event_change(sender, instance, raw, **kwargs):
+    if raw:
+        return
+
+    update_current_events_count(
+        SupportGroup.objects.filter(organizer_configs__event_id=instance.pk)
+    )
+
+
+@receiver(
+    post_save, sender=OrganizerConfig, dispatch_uid="group_organizer_saved_update_count"
+)
+@receiver(
+    post_delete,
+    sender=OrganizerConfig,
+    dispatch_uid="group_organizer_deleted_update_count",
+)
+def update_count_on_organizer_config_change(sender, instance, **kwargs):
+    if kwargs.get("raw") or instance.as_group_id is None:
+        return
+
+    update_current_events_count(SupportGroup.objects.filter(pk=instance.as_group_id))
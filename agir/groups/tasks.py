@@ -15,8 +15,15 @@ from agir.authentication.signers import (
     abusive_invitation_report_token_generator,
 )
 from agir.lib.utils import front_url
-from agir.people.actions.mailing import send_mosaico_email
+from agir.people.actions.mailing import (
+    send_mosaico_email,
+    dispatch_notification,
+    send_notification_chunk,
+)
 from agir.people.models import Person
+from .actions.events_count import (
+    update_current_events_count as _update_current_events_count,
+)
 from .models import SupportGroup, Membership
 
 # encodes the preferred order when showing the messages
@@ -69,8 +76,30 @@ def send_support_group_creation_notification(self, membership_pk):
         self.retry(countdown=60, exc=exc)
 
 
+@shared_task
+def send_support_group_changed_notification(support_group_pk, changes):
+    try:
+        group = SupportGroup.objects.get(pk=support_group_pk, published=True)
+    except SupportGroup.DoesNotExist:
+        return
+
+    notifications_enabled = Q(notifications_enabled=True) & Q(
+        person__group_notifications=True
+    )
+
+    dispatch_notification(
+        send_support_group_changed_notification_chunk,
+        [str(support_group_pk), changes],
+        group.memberships.filter(notifications_enabled).values_list(
+            "person_id", flat=True
+        ),
+    )
+
+
 @shared_task(max_retries=2, bind=True)
-def send_support_group_changed_notification(self, support_group_pk, changes):
+def send_support_group_changed_notification_chunk(
+    self, support_group_pk, changes, notification_id, person_pks
+):
     try:
         group = SupportGroup.objects.get(pk=support_group_pk, published=True)
     except SupportGroup.DoesNotExist:
@@ -89,22 +118,13 @@ def send_support_group_changed_notification(self, support_group_pk, changes):
         "GROUP_LINK": front_url("view_group", kwargs={"pk": support_group_pk}),
     }
 
-    notifications_enabled = Q(notifications_enabled=True) & Q(
-        person__group_notifications=True
-    )
-
-    recipients = [
-        membership.person
-        for membership in group.memberships.filter(
-            notifications_enabled
-        ).prefetch_related("person__emails")
-    ]
     try:
-        send_mosaico_email(
+        send_notification_chunk(
+            notification_id,
+            person_pks,
             code="GROUP_CHANGED",
             subject=_("Les informations de votre groupe d'action ont été changées"),
             from_email=settings.EMAIL_FROM,
-            recipients=recipients,
             bindings=bindings,
         )
     except (smtplib.SMTPException, socket.error) as exc:
@@ -279,3 +299,14 @@ def send_abuse_report_message(self, inviter_id):
         )
     except (smtplib.SMTPException, socket.error) as exc:
         self.retry(countdown=60, exc=exc)
+
+
+@shared_task
+def update_current_events_count():
+    """Recalcule le nombre d'événements en cours de tous les groupes
+
+    Les signaux ne mettent ce nombre à jour que lorsqu'un événement change : cette
+    tâche quotidienne prend en compte le déplacement de la fenêtre des événements
+    en cours.
+    """
+    return _update_current_events_count(SupportGroup.objects.all())
@@ -1,3 +1,4 @@
+import json
 from unittest import skip, mock
 from unittest.mock import patch
 
@@ -22,6 +23,7 @@ from agir.groups.tasks import send_someone_joined_notification, invite_to_group
 from agir.lib.tests.mixins import FakeDataMixin
 from agir.people.models import Person
 from . import tasks
+from .actions.events_count import update_current_events_count
 from .forms import SupportGroupForm
 from .models import SupportGroup, Membership, SupportGroupSubtype
 from .viewsets import LegacySupportGroupViewSet, MembershipViewSet
@@ -256,7 +258,8 @@ class LegacySupportGroupViewSetTestCase(TestCase):
         response = self.client.get("/legacy/groups/summary/")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(json.loads(b"".join(response.streaming_content))), 1)
 
 
 class FiltersTestCase(TestCase):
@@ -595,6 +598,58 @@ class GroupSubtypesTestCase(FakeDataMixin, TestCase):
         )
 
 
+class CurrentEventsCountTestCase(TestCase):
+    def setUp(self):
+        self.person = Person.objects.create_person("test@test.com")
+        self.group = SupportGroup.objects.create(name="Groupe")
+
+        now = timezone.now()
+        self.event = Event.objects.create(
+            name="événement",
+            start_time=now + timezone.timedelta(days=3),
+            end_time=now + timezone.timedelta(days=3, hours=4),
+        )
+
+    def test_count_is_updated_when_group_organizes_event(self):
+        self.assertEqual(self.group.current_events_count, 0)
+
+        organizer_config = OrganizerConfig.objects.create(
+            event=self.event, person=self.person, as_group=self.group
+        )
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.current_events_count, 1)
+
+        organizer_config.delete()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.current_events_count, 0)
+
+    def test_count_is_updated_when_event_changes(self):
+        OrganizerConfig.objects.create(
+            event=self.event, person=self.person, as_group=self.group
+        )
+
+        self.event.visibility = Event.VISIBILITY_ORGANIZER
+        self.event.save()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.current_events_count, 0)
+
+    def test_count_follows_date_window(self):
+        OrganizerConfig.objects.create(
+            event=self.event, person=self.person, as_group=self.group
+        )
+
+        update_current_events_count(
+            SupportGroup.objects.all(),
+            as_of=timezone.now() - timezone.timedelta(days=60),
+        )
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.current_events_count, 0)
+
+        tasks.update_current_events_count()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.current_events_count, 1)
+
+
 class GroupPageTestCase(TestCase):
     def setUp(self):
         self.person = Person.objects.create_person("test@test.com")
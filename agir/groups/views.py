@@ -1,7 +1,6 @@
 import logging
 from uuid import UUID
 
-import ics
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -14,7 +13,6 @@ from django.http import (
     HttpResponseRedirect,
     HttpResponseBadRequest,
     JsonResponse,
-    HttpResponse,
     HttpResponseForbidden,
 )
 from django.template.response import TemplateResponse
@@ -44,6 +42,7 @@ from agir.authentication.view_mixins import (
 )
 from agir.donations.actions import get_balance
 from agir.donations.models import SpendingRequest
+from agir.events.ical import ICSViewMixin
 from agir.events.views.utils import group_events_by_day
 from agir.front.view_mixins import (
     ObjectOpengraphMixin,
@@ -62,7 +61,6 @@ from agir.groups.tasks import (
     send_abuse_report_message,
 )
 from agir.lib.http import add_query_params_to_url
-from agir.lib.utils import front_url
 from agir.people.views import (
     ConfirmSubscriptionView,
     subscription_confirmation_token_generator,
@@ -189,26 +187,11 @@ class SupportGroupDetailView(ObjectOpengraphMixin, DetailView):
         return HttpResponseBadRequest()
 
 
-class SupportGroupIcsView(DetailView):
+class SupportGroupIcsView(ICSViewMixin, DetailView):
     queryset = SupportGroup.objects.active().all()
 
-    def render_to_response(self, context, **response_kwargs):
-        calendar = ics.Calendar(
-            events=[
-                ics.event.Event(
-                    name=event.name,
-                    begin=event.start_time,
-                    end=event.end_time,
-                    uid=str(event.pk),
-                    description=event.description,
-                    location=event.short_address,
-                    url=front_url("view_event", args=[event.pk], auto_login=False),
-                )
-                for event in context["supportgroup"].organized_events.all()
-            ]
-        )
-
-        return HttpResponse(calendar, content_type="text/calendar")
+    def get_ics_events(self):
+        return self.object.organized_events.all()
 
 
 class SupportGroupManagementView(
@@ -1,7 +1,6 @@
 import django_filters
 from django_filters.rest_framework.backends import DjangoFilterBackend
 from django.views.decorators.cache import cache_control
-from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import action, authentication_classes
 
@@ -12,7 +11,11 @@ from agir.lib.permissions import (
 )
 from agir.lib.pagination import LegacyPaginator
 from agir.lib.filters import DistanceFilter, OrderByDistanceToBackend
-from agir.lib.views import NationBuilderViewMixin, CreationSerializerMixin
+from agir.lib.views import (
+    NationBuilderViewMixin,
+    CreationSerializerMixin,
+    StreamingListMixin,
+)
 
 from agir.authentication.models import Role
 
@@ -28,7 +31,9 @@ class SupportGroupFilterSet(django_filters.rest_framework.FilterSet):
         fields = ("contact_email", "close_to", "path")
 
 
-class LegacySupportGroupViewSet(NationBuilderViewMixin, ModelViewSet):
+class LegacySupportGroupViewSet(
+    StreamingListMixin, NationBuilderViewMixin, ModelViewSet
+):
     """
     Legacy endpoint for events that imitates the endpoint from Eve Python
     """
@@ -64,10 +69,12 @@ class LegacySupportGroupViewSet(NationBuilderViewMixin, ModelViewSet):
         supportgroups = (
             self.get_queryset().prefetch_related("tags").prefetch_related("subtypes")
         )
-        serializer = serializers.SummaryGroupSerializer(
-            instance=supportgroups, many=True, context=self.get_serializer_context()
+        return self.get_list_response(
+            supportgroups,
+            serializer=serializers.SummaryGroupSerializer(
+                context=self.get_serializer_context()
+            ),
         )
-        return Response(data=serializer.data)
 
 
 class SupportGroupTagViewSet(ModelViewSet):
@@ -1,73 +1,108 @@
 import csv
+from functools import lru_cache
+from pathlib import Path
 
-import os
-import re
 from django.db.models import Q
-from functools import reduce
-from operator import or_
 from unidecode import unidecode
 
+DATA_DIR = Path(__file__).parent
+
+# tables chargées à la première utilisation, voir `__getattr__`
+LAZY_TABLES = {
+    "departements",
+    "regions",
+    "anciennes_regions",
+    "departements_map",
+    "departements_choices",
+    "regions_map",
+    "regions_choices",
+    "anciennes_regions_map",
+    "zipcode_prefixes",
+}
+
 
 def _normalize_entity_name(name):
     return unidecode(str(name)).lower().replace("-", " ")
 
 
-with open(os.path.dirname(os.path.realpath(__file__)) + "/departements.csv") as file:
-    departements = list(csv.DictReader(file))
-
-with open(os.path.dirname(os.path.realpath(__file__)) + "/regions.csv") as file:
-    regions = list(csv.DictReader(file))
-
-for region in regions:
-    region["alias"] = region["alias"].split("/") if region["alias"] else []
-
-with open(
-    os.path.dirname(os.path.realpath(__file__)) + "/anciennes_regions.csv"
-) as file:
-    anciennes_regions = list(csv.DictReader(file))
-
-departements_map = {d["id"]: d for d in departements}
-departements_choices = tuple((d["id"], f'{d["id"]} - {d["nom"]}') for d in departements)
-
-regions_map = {
-    **{r["id"]: r for r in regions},
-    **{_normalize_entity_name(r["nom"]): r for r in regions},
-}
+def _read_csv(path):
+    with path.open() as file:
+        return list(csv.DictReader(file))
+
+
+def build_tables():
+    departements = _read_csv(DATA_DIR / "departements.csv")
+    regions = _read_csv(DATA_DIR / "regions.csv")
+    anciennes_regions = _read_csv(DATA_DIR / "anciennes_regions.csv")
+
+    for region in regions:
+        region["alias"] = region["alias"].split("/") if region["alias"] else []
+
+    departements_map = {d["id"]: d for d in departements}
+
+    regions_map = {
+        **{r["id"]: r for r in regions},
+        **{_normalize_entity_name(r["nom"]): r for r in regions},
+    }
+    for r in regions:
+        regions_map.update({_normalize_entity_name(alias): r for alias in r["alias"]})
+
+    # préfixes de codes postaux : deux chiffres en métropole, trois outre-mer ; les
+    # codes postaux 200xx et 201xx sont en Corse-du-Sud, les autres en Haute-Corse
+    zipcode_prefixes = {
+        d["id"]: d for d in departements if len(d["id"]) == 2 and d["id"].isdigit()
+    }
+    zipcode_prefixes.update({d["id"]: d for d in departements if len(d["id"]) == 3})
+    zipcode_prefixes.update(
+        {
+            "200": departements_map["2A"],
+            "201": departements_map["2A"],
+            "20": departements_map["2B"],
+        }
+    )
 
-for r in regions:
-    regions_map.update({_normalize_entity_name(alias): r for alias in r["alias"]})
+    return {
+        "departements": departements,
+        "regions": regions,
+        "anciennes_regions": anciennes_regions,
+        "departements_map": departements_map,
+        "departements_choices": tuple(
+            (d["id"], f'{d["id"]} - {d["nom"]}') for d in departements
+        ),
+        "regions_map": regions_map,
+        # utiliser unidecode permet de classer Île-de-France à I
+        "regions_choices": tuple(
+            (r["id"], r["nom"])
+            for r in sorted(regions, key=lambda d: unidecode(d["nom"]))
+        ),
+        "anciennes_regions_map": {r["id"]: r for r in anciennes_regions},
+        "zipcode_prefixes": zipcode_prefixes,
+    }
 
 
-# utiliser unidecode permet de classer Île-de-France à I
-regions_choices = tuple(
-    (r["id"], r["nom"]) for r in sorted(regions, key=lambda d: unidecode(d["nom"]))
-)
+@lru_cache(maxsize=None)
+def get_tables():
+    return build_tables()
 
-anciennes_regions_map = {r["id"]: r for r in anciennes_regions}
 
-_CORSE_RE = re.compile("^[A|B]")
+def __getattr__(name):
+    if name in LAZY_TABLES:
+        return get_tables()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def filtre_departement(code):
-    return Q(location_zip__startswith=_CORSE_RE.sub("0", code))
+    return Q(location_departement_code=code)
 
 
 def filtre_region(code):
-    code = regions_map[_normalize_entity_name(code)]["id"]
-
-    return reduce(
-        or_, (filtre_departement(d["id"]) for d in departements if d["region"] == code)
-    )
+    region = get_tables()["regions_map"][_normalize_entity_name(code)]
+    return Q(location_region_code=region["id"])
 
 
 def departement_from_zipcode(zipcode):
-    if zipcode.startswith("97"):
-        return departements_map.get(zipcode[:3], None)
-
-    # on retourne toujours par défaut le premier département Corse
-    if zipcode[:2] == "20":
-        zipcode = "2A"
-    return departements_map.get(zipcode[:2], None)
+    prefixes = get_tables()["zipcode_prefixes"]
+    return prefixes.get(zipcode[:3]) or prefixes.get(zipcode[:2])
 
 
 FRANCE_COUNTRY_CODES = [
@@ -1,20 +1,197 @@
+import csv
+import io
 import json
 import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps, lru_cache
 from pathlib import Path
 
 import requests
+from django.conf import settings
 from django.contrib.gis.geos import Point
+from django.core.cache import caches
+from prometheus_client import Counter
+from requests.adapters import HTTPAdapter
+from unidecode import unidecode
 
+from .mail_templates import write_atomic
 from .models import LocationMixin
+from .token_bucket import TokenBucket
 
 logger = logging.getLogger(__name__)
 
 BAN_ENDPOINT = "https://api-adresse.data.gouv.fr/search"
+BAN_CSV_ENDPOINT = "https://api-adresse.data.gouv.fr/search/csv/"
 NOMINATIM_ENDPOINT = "https://nominatim.openstreetmap.org/"
 
 
-with open(Path(__file__).parent / "data" / "arrondissements.json") as f:
-    ARRONDISSEMENTS = json.load(f)
+# limite globale de requêtes à Nominatim, partagée par tous les workers
+nominatim_bucket = TokenBucket(
+    "Nominatim", settings.NOMINATIM_RATE_MAX, settings.NOMINATIM_RATE_INTERVAL
+)
+
+nominatim_session = requests.Session()
+nominatim_session.headers["User-Agent"] = settings.NOMINATIM_USER_AGENT
+nominatim_session.mount(
+    "https://", HTTPAdapter(pool_maxsize=settings.NOMINATIM_MAX_WORKERS)
+)
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+GEOCODING_CACHE_KEY = "geocoding:{service}:{query}"
+
+geocoding_cache_requests = Counter(
+    "agir_geocoding_cache_requests_total",
+    "Nombre de consultations du cache de géocodage",
+    ["service", "result"],
+)
+
+DATA_DIR = Path(__file__).parent / "data"
+COMMUNES_FILE = Path(settings.COMMUNES_FILE)
+
+
+@lru_cache(maxsize=None)
+def get_arrondissements():
+    with open(DATA_DIR / "arrondissements.json") as f:
+        return json.load(f)
+
+
+Commune = namedtuple("Commune", ["citycode", "name", "longitude", "latitude"])
+
+
+def normalize_commune_name(name):
+    return " ".join(unidecode(name).lower().replace("-", " ").replace("'", " ").split())
+
+
+class CommuneIndex:
+    """Index en mémoire des communes françaises
+
+    Chaque commune n'est stockée qu'une fois, sous la forme d'un tuple ; les
+    index par code postal, par code INSEE et par nom ne contiennent que des
+    références vers ces tuples.
+    """
+
+    def __init__(self, rows):
+        """
+        :param rows: un itérable de tuples (code postal, code INSEE, nom, longitude, latitude)
+        """
+        self.by_zip = {}
+        self.by_citycode = {}
+        self.by_name = {}
+
+        for zip_code, citycode, name, lon, lat in rows:
+            commune = self.by_citycode.get(citycode)
+            if commune is None:
+                commune = self.by_citycode[citycode] = Commune(
+                    citycode, name, float(lon), float(lat)
+                )
+                self.by_name.setdefault(normalize_commune_name(name), []).append(
+                    commune
+                )
+            self.by_zip.setdefault(zip_code, []).append(commune)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            next(reader)
+            return cls(reader)
+
+    def __len__(self):
+        return len(self.by_citycode)
+
+    def find(self, zip_code=None, city=None):
+        """Renvoie les communes correspondant à un code postal et/ou un nom de ville
+
+        Lorsque le nom de la ville permet de choisir parmi les communes du code
+        postal, seule cette commune est renvoyée. Si rien ne correspond, la liste
+        renvoyée est vide.
+        """
+        name = normalize_commune_name(city) if city else None
+
+        if not zip_code:
+            return list(self.by_name.get(name, [])) if name else []
+
+        communes = self.by_zip.get(zip_code, [])
+        if name and len(communes) > 1:
+            matching = [c for c in communes if normalize_commune_name(c.name) == name]
+            if matching:
+                return matching
+            return []
+
+        return list(communes)
+
+
+GEO_API_COMMUNES_ENDPOINT = "https://geo.api.gouv.fr/communes"
+
+# index des communes, associé à la version du fichier dont il est issu
+_communes = None
+
+
+def get_communes():
+    """Renvoie l'index local des communes
+
+    L'index est rechargé quand le fichier est remplacé par `update_communes`. Tant
+    que le fichier n'existe pas, l'index est vide et toutes les recherches sont
+    faites auprès de la BAN.
+    """
+    global _communes
+
+    try:
+        stat = COMMUNES_FILE.stat()
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        version = None
+
+    if _communes is None or _communes[0] != version:
+        if version is None:
+            logger.warning(f"Commune index {COMMUNES_FILE} not found")
+            _communes = (None, CommuneIndex([]))
+        else:
+            _communes = (version, CommuneIndex.from_csv(COMMUNES_FILE))
+
+    return _communes[1]
+
+
+def update_communes():
+    """Met à jour l'index local des communes à partir de geo.api.gouv.fr
+
+    :return: le nombre de lignes écrites
+    :raises requests.RequestException: si la liste des communes n'a pas pu être récupérée
+    """
+    res = requests.get(
+        GEO_API_COMMUNES_ENDPOINT,
+        params={
+            "fields": "nom,code,codesPostaux,centre",
+            "format": "json",
+            "geometry": "centre",
+        },
+        timeout=60,
+    )
+    res.raise_for_status()
+    communes = res.json()
+
+    rows = sorted(
+        (zip_code, c["code"], c["nom"], *c["centre"]["coordinates"])
+        for c in communes
+        if c.get("centre")
+        for zip_code in c.get("codesPostaux", [])
+    )
+
+    content = io.StringIO(newline="")
+    writer = csv.writer(content)
+    writer.writerow(["code_postal", "code_insee", "nom", "longitude", "latitude"])
+    writer.writerows(rows)
+
+    COMMUNES_FILE.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(COMMUNES_FILE, content.getvalue())
+
+    return len(rows)
 
 
 def geocode_element(item):
@@ -35,6 +212,93 @@ def geocode_element(item):
         item.coordinates_type = LocationMixin.COORDINATES_NO_POSITION
 
 
+def normalize_geocoding_query(query):
+    """Renvoie une clé identique pour deux requêtes ne différant que par la casse,
+    les accents ou les espaces
+    """
+    return "|".join(
+        f"{key}={' '.join(unidecode(str(value)).lower().split())}"
+        for key, value in sorted(query.items())
+    )
+
+
+def cached_geocoding(service, compact):
+    """Décorateur ajoutant un cache devant une fonction interrogeant un service de géocodage
+
+    Seuls les résultats valides sont conservés, sous la forme réduite renvoyée par
+    `compact` : les erreurs réseau ne sont jamais mises en cache. Le cache utilisé et
+    la durée de conservation se configurent avec les paramètres `GEOCODING_CACHE` et
+    `GEOCODING_CACHE_TIMEOUT` ; modifier `GEOCODING_CACHE_VERSION` invalide
+    l'ensemble des résultats enregistrés.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(query):
+            cache = caches[settings.GEOCODING_CACHE]
+            key = GEOCODING_CACHE_KEY.format(
+                service=service, query=normalize_geocoding_query(query)
+            )
+            version = settings.GEOCODING_CACHE_VERSION
+
+            # une panne du cache ne doit pas empêcher le géocodage : le service est
+            # alors interrogé directement
+            try:
+                results = cache.get(key, version=version)
+            except Exception:
+                logger.warning("Could not read the geocoding cache", exc_info=True)
+                geocoding_cache_requests.labels(service, "error").inc()
+                results = None
+            else:
+                geocoding_cache_requests.labels(
+                    service, "miss" if results is None else "hit"
+                ).inc()
+
+            if results is not None:
+                return results
+
+            results = func(query)
+            if results is not None:
+                results = compact(results)
+                try:
+                    cache.set(
+                        key,
+                        results,
+                        timeout=settings.GEOCODING_CACHE_TIMEOUT,
+                        version=version,
+                    )
+                except Exception:
+                    logger.warning(
+                        "Could not write to the geocoding cache", exc_info=True
+                    )
+
+            return results
+
+        return wrapper
+
+    return decorator
+
+
+def compact_ban_results(results):
+    return {
+        "features": [
+            {
+                "geometry": f["geometry"],
+                "properties": {
+                    "type": f["properties"]["type"],
+                    "citycode": f["properties"]["citycode"],
+                },
+            }
+            for f in results["features"]
+        ]
+    }
+
+
+def compact_nominatim_results(results):
+    return [{"lon": r["lon"], "lat": r["lat"]} for r in results]
+
+
+@cached_geocoding("ban", compact_ban_results)
 def get_results_from_ban(query):
     try:
         res = requests.get(BAN_ENDPOINT, params=query, timeout=5)
@@ -57,20 +321,38 @@ def get_results_from_ban(query):
     return results
 
 
+def wait_for_nominatim_token(max_wait):
+    """Attend au plus `max_wait` secondes que la limite globale autorise une requête
+
+    :raises RateLimitExceeded: si la limite n'autorise toujours pas de requête
+    """
+    deadline = time.monotonic() + max_wait
+
+    while not nominatim_bucket.has_tokens("global"):
+        if time.monotonic() >= deadline:
+            raise RateLimitExceeded()
+        time.sleep(0.1)
+
+
+@cached_geocoding("nominatim", compact_nominatim_results)
 def get_results_from_nominatim(query):
+    wait_for_nominatim_token(settings.NOMINATIM_MAX_WAIT)
 
     try:
-        res = requests.get(NOMINATIM_ENDPOINT, params=query)
+        res = nominatim_session.get(
+            NOMINATIM_ENDPOINT, params=query, timeout=settings.NOMINATIM_TIMEOUT
+        )
         res.raise_for_status()
         results = res.json()
     except requests.RequestException:
         logger.warning(
-            f"Error while geocoding address '{query.q}' with Nominatim", exc_info=True
+            f"Error while geocoding address '{query['q']}' with Nominatim",
+            exc_info=True,
         )
         raise
     except ValueError:
         logger.warning(
-            f"Invalid JSON while geocoding address '{query.q}' with Nominatim",
+            f"Invalid JSON while geocoding address '{query['q']}' with Nominatim",
             exc_info=True,
         )
         raise
@@ -79,13 +361,38 @@ def get_results_from_nominatim(query):
 
 
 def geocode_ban_district_exception(item):
-    arrondissement = ARRONDISSEMENTS[item.location_zip]
+    arrondissement = get_arrondissements()[item.location_zip]
     item.location_citycode = arrondissement["citycode"]
     item.coordinates = Point(*arrondissement["coordinates"])
     item.location_city = arrondissement["city"]
     item.coordinates_type = LocationMixin.COORDINATES_DISTRICT
 
 
+def geocode_citylevel_offline(item):
+    """Géolocalise un élément au niveau de la commune à partir de l'index local
+
+    :return: True si l'élément a pu être géolocalisé, False s'il faut interroger la BAN
+    """
+    communes = get_communes().find(item.location_zip, item.location_city)
+
+    if not communes or (not item.location_zip and len(communes) > 1):
+        return False
+
+    # si plusieurs communes partagent le code postal, on prend leur milieu
+    lon = sum(c.longitude for c in communes) / len(communes)
+    lat = sum(c.latitude for c in communes) / len(communes)
+
+    item.coordinates = Point(lon, lat)
+    if len(communes) == 1:
+        item.coordinates_type = LocationMixin.COORDINATES_CITY
+        item.location_citycode = communes[0].citycode
+    else:
+        item.coordinates_type = LocationMixin.COORDINATES_UNKNOWN_PRECISION
+        item.location_citycode = ""
+
+    return True
+
+
 def geocode_ban_citylevel(item):
     query = {
         "q": item.location_city or item.location_zip,
@@ -145,11 +452,12 @@ def geocode_ban(item):
     no_address = not item.location_address1 and not item.location_address2
 
     if no_address:
-        if item.location_zip in ARRONDISSEMENTS:
+        if item.location_zip in get_arrondissements():
             geocode_ban_district_exception(item)
             return
 
-        geocode_ban_citylevel(item)
+        if not geocode_citylevel_offline(item):
+            geocode_ban_citylevel(item)
         return
 
     q = " ".join(
@@ -188,11 +496,89 @@ def geocode_ban(item):
     item.coordinates_type = LocationMixin.COORDINATES_NOT_FOUND
 
 
+def geocode_ban_csv(items, endpoint=BAN_CSV_ENDPOINT):
+    """Géolocalise un lot d'éléments français en une seule requête à la BAN
+
+    Les éléments sans adresse sont traités localement comme dans `geocode_ban` ;
+    les autres sont envoyés ensemble à l'API CSV de la BAN. Les éléments sont
+    modifiés mais pas enregistrés.
+
+    :param items: une liste d'éléments situés en France
+    :param endpoint: l'URL de l'API CSV, modifiable pour les tests
+    """
+    remaining = {}
+
+    for item in items:
+        no_address = not item.location_address1 and not item.location_address2
+        if no_address and item.location_zip in get_arrondissements():
+            geocode_ban_district_exception(item)
+        elif no_address and geocode_citylevel_offline(item):
+            continue
+        else:
+            remaining[str(item.pk)] = item
+
+    if not remaining:
+        return
+
+    data = io.StringIO()
+    writer = csv.writer(data)
+    writer.writerow(["id", "address", "postcode", "city"])
+    writer.writerows(
+        [
+            pk,
+            " ".join(l for l in [item.location_address1, item.location_address2] if l),
+            item.location_zip,
+            item.location_city,
+        ]
+        for pk, item in remaining.items()
+    )
+
+    try:
+        res = requests.post(
+            endpoint,
+            files={"data": ("items.csv", data.getvalue().encode(), "text/csv")},
+            data={"columns": ["address", "city"], "postcode": "postcode"},
+            timeout=300,
+        )
+        res.raise_for_status()
+    except requests.RequestException:
+        logger.warning(
+            f"Network error while geocoding {len(remaining)} items with BAN",
+            exc_info=True,
+        )
+        raise
+
+    types = {
+        "housenumber": LocationMixin.COORDINATES_EXACT,
+        "street": LocationMixin.COORDINATES_STREET,
+        "locality": LocationMixin.COORDINATES_STREET,
+        "municipality": LocationMixin.COORDINATES_CITY,
+    }
+
+    for row in csv.DictReader(io.StringIO(res.content.decode("utf-8-sig"))):
+        item = remaining.get(row["id"])
+        if item is None:
+            continue
+
+        if row.get("result_type") in types and row.get("longitude"):
+            item.coordinates = Point(float(row["longitude"]), float(row["latitude"]))
+            item.coordinates_type = types[row["result_type"]]
+            item.location_citycode = row.get("result_citycode", "")
+        else:
+            item.coordinates = None
+            item.coordinates_type = LocationMixin.COORDINATES_NOT_FOUND
+
+
 def geocode_coordinate_from_simple_address(addresse):
     if not addresse:
         return None
 
-    results = get_results_from_nominatim({"format": "json", "q": addresse, "limit": 1})
+    try:
+        results = get_results_from_nominatim(
+            {"format": "json", "q": addresse, "limit": 1}
+        )
+    except (requests.RequestException, ValueError, RateLimitExceeded):
+        return None
 
     if not results:
         return None
@@ -222,24 +608,7 @@ def geocode_nominatim(item):
     if item.location_country:
         query["countrycodes"] = str(item.location_country)
 
-    display_address = f"{q} ({item.location_country})"
-
-    try:
-        res = requests.get(NOMINATIM_ENDPOINT, params=query)
-        res.raise_for_status()
-        results = res.json()
-    except requests.RequestException:
-        logger.warning(
-            f"Error while geocoding address '{display_address}' with Nominatim",
-            exc_info=True,
-        )
-        raise
-    except ValueError:
-        logger.warning(
-            f"Invalid JSON while geocoding address '{display_address}' with Nominatim",
-            exc_info=True,
-        )
-        raise
+    results = get_results_from_nominatim(query)
 
     if results:
         item.coordinates = Point(float(results[0]["lon"]), float(results[0]["lat"]))
@@ -249,3 +618,32 @@ def geocode_nominatim(item):
         item.coordinates = None
         item.coordinates_type = LocationMixin.COORDINATES_NOT_FOUND
         return
+
+
+class NominatimExecutor:
+    """Géolocalise des éléments étrangers en parallèle, dans la limite du débit autorisé
+
+    Les requêtes sont effectuées par un groupe de threads partageant la session
+    `nominatim_session` ; le débit global reste limité par `nominatim_bucket`. Les
+    éléments dont la géolocalisation a échoué sont renvoyés plutôt que de bloquer
+    un thread, pour être réessayés plus tard.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or settings.NOMINATIM_MAX_WORKERS
+
+    def geocode(self, items):
+        """
+        :param items: une liste d'éléments à géolocaliser avec Nominatim
+        :return: la liste des éléments qu'il faudra réessayer de géolocaliser
+        """
+
+        def geocode_item(item):
+            try:
+                geocode_nominatim(item)
+            except (requests.RequestException, ValueError, RateLimitExceeded):
+                return item
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return [item for item in executor.map(geocode_item, items) if item]
@@ -0,0 +1,170 @@
+"""Copie locale des templates d'emails Mosaico
+
+Les templates listés dans `settings.EMAIL_TEMPLATES` sont recopiés dans le dossier
+`settings.MAIL_TEMPLATES_DIR`, en dehors du code : l'envoi d'un email ne dépend
+jamais du serveur Mosaico. La copie est revalidée régulièrement avec les en-têtes
+ETag et Last-Modified renvoyés par le serveur, et chaque fichier est remplacé de
+façon atomique. Tant qu'un template n'a pas été recopié, c'est la version livrée
+avec le code, dans le dossier `mail_templates/` de l'application, qui est utilisée.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.template import engines, TemplateDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+MAIL_TEMPLATES_DIR = Path(settings.MAIL_TEMPLATES_DIR)
+PACKAGED_TEMPLATES_DIR = Path(__file__).parent / "templates" / "mail_templates"
+# validateurs HTTP et version de chacun des templates
+VERSIONS_FILE = MAIL_TEMPLATES_DIR / "versions.json"
+
+MOSAICO_VARIABLE_REGEX = re.compile(r"\[([-A-Z_]+)\]")
+TEMPLATE_FILE_REGEX = re.compile(r"^([-A-Za-z_]+)\.(?:html|txt)$")
+
+session = requests.Session()
+
+# templates compilés, associés à la version du fichier dont ils sont issus
+_compiled_templates = {}
+
+
+def write_atomic(path, content):
+    """Remplace le contenu d'un fichier, sans que le fichier ne soit jamais lu à moitié écrit
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_versions():
+    try:
+        with VERSIONS_FILE.open() as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def fetch_template(url, previous):
+    """Récupère un template, si celui-ci a changé depuis la dernière récupération
+
+    :param previous: les informations enregistrées lors de la dernière récupération
+    :return: un tuple (contenu, informations), le contenu valant `None` si le
+        template n'a pas changé
+    :raises requests.RequestException: si le template n'a pas pu être récupéré
+    """
+    headers = {}
+    if previous.get("url") == url:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+    res = session.get(url, headers=headers, timeout=30)
+    if res.status_code == 304:
+        return None, previous
+    res.raise_for_status()
+
+    return (
+        res.text,
+        {
+            "url": url,
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+        },
+    )
+
+
+def update_mail_templates(force=False):
+    """Met à jour la copie locale des templates d'emails
+
+    Les templates qui ne figurent plus dans `settings.EMAIL_TEMPLATES` sont
+    supprimés. Un template qui n'a pas pu être récupéré conserve sa copie locale.
+
+    :param force: récupérer tous les templates, sans revalidation
+    :return: un tuple (templates mis à jour, templates en erreur)
+    """
+    from agir.people.actions.mailing import generate_plain_text
+
+    MAIL_TEMPLATES_DIR.mkdir(0o755, parents=True, exist_ok=True)
+    versions = {} if force else read_versions()
+
+    for file in MAIL_TEMPLATES_DIR.iterdir():
+        match = TEMPLATE_FILE_REGEX.match(file.name)
+        if match and match.group(1) not in settings.EMAIL_TEMPLATES:
+            file.unlink()
+
+    updated = []
+    failed = []
+
+    for name, url in settings.EMAIL_TEMPLATES.items():
+        html_file = MAIL_TEMPLATES_DIR / f"{name}.html"
+        txt_file = MAIL_TEMPLATES_DIR / f"{name}.txt"
+        previous = versions.get(name, {}) if html_file.exists() else {}
+
+        try:
+            content, information = fetch_template(url, previous)
+        except requests.RequestException:
+            logger.warning(f"Could not fetch mail template {name}", exc_info=True)
+            failed.append(name)
+            continue
+
+        if content is not None:
+            content = MOSAICO_VARIABLE_REGEX.sub(r"{{ \1 }}", content)
+            previous_content = html_file.read_text() if html_file.exists() else None
+
+            if content != previous_content:
+                write_atomic(html_file, content)
+                updated.append(name)
+
+            if content != previous_content or not txt_file.exists():
+                write_atomic(txt_file, generate_plain_text(content))
+
+            information["version"] = hashlib.sha1(content.encode()).hexdigest()[:12]
+
+        versions[name] = information
+        write_atomic(VERSIONS_FILE, json.dumps(versions, indent=2, sort_keys=True))
+
+    return updated, failed
+
+
+def get_mail_template(code, extension="html"):
+    """Renvoie le template compilé correspondant à un email
+
+    La copie locale est utilisée si elle existe, sinon la version livrée avec le
+    code. Les templates compilés sont conservés en mémoire, et recompilés quand le
+    fichier est remplacé par `update_mail_templates`.
+
+    :raises TemplateDoesNotExist: si le template n'existe pas localement
+    """
+    name = f"{code}.{extension}"
+
+    for path in (MAIL_TEMPLATES_DIR / name, PACKAGED_TEMPLATES_DIR / name):
+        try:
+            stat = path.stat()
+            break
+        except FileNotFoundError:
+            pass
+    else:
+        raise TemplateDoesNotExist(f"mail_templates/{name}")
+
+    version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _compiled_templates.get(path)
+
+    if cached is None or cached[0] != version:
+        template = engines["django"].from_string(path.read_text())
+        cached = _compiled_templates[path] = (version, template)
+
+    return cached[1]
@@ -1,10 +1,11 @@
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from urllib.parse import urlencode
 
 import requests
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Q, Count
 from requests import HTTPError
 from urllib3 import Retry
 
@@ -13,40 +14,95 @@ from agir.lib.utils import generate_token_params
 params = {"access_token": settings.MAILTRAIN_API_KEY}
 
 
+# nombre de requêtes envoyées en parallèle par `update_people`
+MAX_WORKERS = 8
+
 s = requests.Session()
-a = requests.adapters.HTTPAdapter(max_retries=Retry(total=5, backoff_factor=1))
-b = requests.adapters.HTTPAdapter(max_retries=Retry(total=5, backoff_factor=1))
+a = requests.adapters.HTTPAdapter(
+    max_retries=Retry(total=5, backoff_factor=1), pool_maxsize=MAX_WORKERS
+)
+b = requests.adapters.HTTPAdapter(
+    max_retries=Retry(total=5, backoff_factor=1), pool_maxsize=MAX_WORKERS
+)
 s.mount("https://", a)
 s.mount("http://", b)
 
 
 def data_from_person(person, tmp_tags=None):
-    data = {}
+    return data_from_people([person], tmp_tags)[person.pk]
+
+
+def data_from_people(people, tmp_tags=None):
+    """Calcule les champs Mailtrain d'un ensemble de personnes
+
+    Les inscriptions et les tags sont calculés pour toutes les personnes à la fois,
+    en trois requêtes agrégées.
+
+    :param people: une liste de personnes
+    :return: un dictionnaire associant à l'identifiant de chaque personne ses champs
+    """
+    from agir.events.models import RSVP
+    from agir.groups.models import Membership
+    from agir.people.models import Person
+
+    pks = [person.pk for person in people]
+
+    with_events = set(
+        RSVP.objects.upcoming()
+        .filter(person_id__in=pks)
+        .values_list("person_id", flat=True)
+        .distinct()
+    )
 
     is_animateur = Q(is_referent=True) | Q(is_manager=True)
+    is_certified = Q(
+        supportgroup__subtypes__label__in=settings.CERTIFIED_GROUP_SUBTYPES
+    )
+    memberships = {
+        m["person_id"]: m
+        for m in Membership.objects.active()
+        .filter(person_id__in=pks)
+        .values("person_id")
+        .annotate(
+            certified=Count("pk", filter=is_certified),
+            animateur=Count("pk", filter=is_animateur),
+            certified_animateur=Count("pk", filter=is_animateur & is_certified),
+        )
+    }
+
+    tags = {}
+    for person_id, label in (
+        Person.tags.through.objects.filter(person_id__in=pks, persontag__exported=True)
+        .order_by("id")
+        .values_list("person_id", "persontag__label")
+    ):
+        tags.setdefault(person_id, []).append(label)
+
+    return {
+        person.pk: _person_data(
+            person,
+            has_events=person.pk in with_events,
+            memberships=memberships.get(person.pk),
+            tags=tags.get(person.pk, []),
+            tmp_tags=tmp_tags,
+        )
+        for person in people
+    }
+
+
+def _person_data(person, has_events, memberships, tags, tmp_tags):
+    data = {}
+
+    def flag(name, value):
+        return f"{name}_yes" if value else f"{name}_no"
+
     inscriptions = [
-        ("evenements_yes" if person.events.upcoming().count() > 0 else "evenements_no"),
-        ("groupe_yes" if person.supportgroups.active().count() > 0 else "groupe_no"),
-        (
-            "groupe_certifié_yes"
-            if person.supportgroups.active().certified().count() > 0
-            else "groupe_certifié_no"
-        ),
-        (
-            "groupe_anim_yes"
-            if person.memberships.active().filter(is_animateur).count() > 0
-            else "groupe_anim_no"
-        ),
-        (
-            "groupe_certifié_anim_yes"
-            if person.memberships.active()
-            .filter(
-                is_animateur
-                & Q(supportgroup__subtypes__label__in=settings.CERTIFIED_GROUP_SUBTYPES)
-            )
-            .count()
-            > 0
-            else "groupe_certifié_anim_no"
+        ("evenements_yes" if has_events else "evenements_no"),
+        flag("groupe", memberships),
+        flag("groupe_certifié", memberships and memberships["certified"]),
+        flag("groupe_anim", memberships and memberships["animateur"]),
+        flag(
+            "groupe_certifié_anim", memberships and memberships["certified_animateur"]
         ),
         (
             "country-{}".format(
@@ -65,9 +121,7 @@ def data_from_person(person, tmp_tags=None):
     )
     data["MERGE_INSCRIPTIONS"] = ",".join(inscriptions)
     data["MERGE_LOGIN_QUERY"] = urlencode(generate_token_params(person))
-    data["MERGE_TAGS"] = (
-        "," + ",".join(t.label for t in person.tags.filter(exported=True)) + ","
-    )
+    data["MERGE_TAGS"] = "," + ",".join(tags) + ","
 
     data["MERGE_REGION"] = " ".join([person.region, person.ancienne_region])
     data["MERGE_ANNEE_DE_NAISSANCE"] = (
@@ -160,18 +214,56 @@ def delete_email(email):
 
 
 def update_person(person, tmp_tags=None):
-    data = data_from_person(person, tmp_tags)
-    emails = list(person.emails.all())
+    push_person(person, data_from_person(person, tmp_tags), list(person.emails.all()))
+
+
+def update_people(people, max_workers=MAX_WORKERS):
+    """Met à jour un ensemble de personnes sur Mailtrain
+
+    Les champs sont calculés pour toutes les personnes à la fois, et les requêtes
+    à Mailtrain sont envoyées en parallèle, sur les connexions du pool de la session.
 
+    :return: le nombre de personnes mises à jour
+    """
+    from agir.people.models import PersonEmail
+
+    people = list(people)
+    data = data_from_people(people)
+
+    emails = {}
+    for email in PersonEmail.objects.filter(
+        person_id__in=[person.pk for person in people]
+    ).order_by("person_id", "_order"):
+        emails.setdefault(email.person_id, []).append(email)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in executor.map(
+            lambda person: push_person(
+                person, data[person.pk], emails.get(person.pk, [])
+            ),
+            people,
+        ):
+            pass
+
+    return len(people)
+
+
+def split_emails(emails):
+    """Sépare l'adresse principale pour Mailtrain des autres adresses
+
+    L'adresse principale est la première adresse qui n'est pas en erreur et dont le
+    domaine n'est pas désactivé.
+    """
     for i, email in enumerate(emails):
         local_part, domain = email.address.rsplit("@", 1)
         if not email.bounced and domain.lower() not in settings.EMAIL_DISABLED_DOMAINS:
-            primary_email = email
-            other_emails = emails[:i] + emails[i + 1 :]
-            break
-    else:
-        primary_email = None
-        other_emails = emails
+            return email, emails[:i] + emails[i + 1 :]
+
+    return None, emails
+
+
+def push_person(person, data, emails):
+    primary_email, other_emails = split_emails(emails)
 
     if primary_email is not None:
         if person.subscribed:
@@ -1,55 +1,24 @@
-from pathlib import Path
-
-import re
-import requests
-from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
-from agir.people.actions.mailing import generate_plain_text
-
-
-LIB_APP_DIR = Path(__file__).parent.parent.parent
+from agir.lib.mail_templates import update_mail_templates
 
 
 class Command(BaseCommand):
     help = "Fetch all mosaico mails"
 
-    def handle(self, *args, **options):
-        # create target directory in case it does not exist
-        target_dir = LIB_APP_DIR / "templates" / "mail_templates"
-        target_dir.mkdir(0o755, parents=True, exist_ok=True)
-
-        var_regex = re.compile(r"\[([-A-Z_]+)\]")
-        var_files = re.compile(r"^([-A-Za-z_]+)\.(?:html|txt)$")
-
-        for file in target_dir.iterdir():
-            match = var_files.match(file.name)
-            if match and match.group(1) not in settings.EMAIL_TEMPLATES:
-                # delete all
-                file.unlink()
-
-        for name, url in settings.EMAIL_TEMPLATES.items():
-            try:
-                res = requests.get(url)
-                res.raise_for_status()
-            except requests.RequestException:
-                raise CommandError('Could not fetch url "{}"'.format(url))
-
-            content = var_regex.sub(r"{{ \1 }}", res.text)
-
-            html_file = target_dir.joinpath(f"{name}.html")
-            txt_file = target_dir.joinpath(f"{name}.txt")
-
-            previous_content = None
-            if html_file.exists():
-                with html_file.open("r") as f:
-                    previous_content = f.read()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Récupérer tous les templates, même ceux qui n'ont pas changé",
+        )
 
-            with html_file.open("w") as f:
-                f.write(content)
+    def handle(self, *args, force, **options):
+        updated, failed = update_mail_templates(force=force)
 
-            if not txt_file.exists() or content != previous_content:
-                txt_content = generate_plain_text(content)
+        if options["verbosity"] > 1:
+            for name in updated:
+                self.stdout.write(f"{name} updated")
 
-                with txt_file.open("w") as f:
-                    f.write(txt_content)
+        if failed:
+            raise CommandError(f"Could not fetch templates {', '.join(failed)}")
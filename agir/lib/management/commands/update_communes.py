@@ -0,0 +1,19 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from agir.lib.geo import COMMUNES_FILE, GEO_API_COMMUNES_ENDPOINT, update_communes
+
+
+class Command(BaseCommand):
+    help = (
+        "Met à jour l'index local des communes à partir de geo.api.gouv.fr, dans "
+        "le fichier indiqué par settings.COMMUNES_FILE"
+    )
+
+    def handle(self, *args, **options):
+        try:
+            count = update_communes()
+        except (requests.RequestException, ValueError):
+            raise CommandError(f'Could not fetch url "{GEO_API_COMMUNES_ENDPOINT}"')
+
+        self.stdout.write(f"{count} lignes écrites dans {COMMUNES_FILE}")
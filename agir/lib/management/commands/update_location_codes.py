@@ -0,0 +1,53 @@
+from django.apps import apps
+from django.core.management import BaseCommand
+
+from agir.lib.models import LocationMixin
+
+LOCATION_CODES_FIELDS = ["location_departement_code", "location_region_code"]
+
+
+class Command(BaseCommand):
+    help = "Backfill the departement and region codes of all models with a location"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, batch_size, **options):
+        for model in apps.get_models():
+            if not issubclass(model, LocationMixin) or not model._meta.managed:
+                continue
+
+            updated = 0
+            qs = model.objects.only(
+                "pk", "location_zip", "location_country", *LOCATION_CODES_FIELDS
+            ).order_by("pk")
+            last_pk = None
+
+            while True:
+                batch = list(
+                    (qs if last_pk is None else qs.filter(pk__gt=last_pk))[:batch_size]
+                )
+                if not batch:
+                    break
+
+                changed = []
+                for item in batch:
+                    previous = (
+                        item.location_departement_code,
+                        item.location_region_code,
+                    )
+                    item.update_location_codes()
+                    if previous != (
+                        item.location_departement_code,
+                        item.location_region_code,
+                    ):
+                        changed.append(item)
+
+                model.objects.bulk_update(changed, LOCATION_CODES_FIELDS)
+                updated += len(changed)
+                last_pk = batch[-1].pk
+
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"Updated {updated} {model._meta.verbose_name_plural}."
+                )
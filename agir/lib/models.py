@@ -2,6 +2,7 @@ import uuid
 
 import re
 from django.contrib.gis.db import models
+from django.db import migrations
 from django.core.validators import RegexValidator
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
@@ -23,6 +24,44 @@ from .display import display_address
 RE_FRENCH_ZIPCODE = re.compile("^[0-9]{5}$")
 
 
+def location_codes_backfill(app_label, model_name):
+    """Renvoie l'opération de migration remplissant les codes de département et de
+    région des lignes existantes d'un modèle
+
+    Le calcul est le même que celui de `LocationMixin.update_location_codes` : les
+    préfixes de trois chiffres sont appliqués après ceux de deux chiffres, pour
+    l'emporter sur eux.
+    """
+
+    def backfill(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        table = schema_editor.quote_name(model._meta.db_table)
+        prefixes = data.zipcode_prefixes
+
+        with schema_editor.connection.cursor() as cursor:
+            for length in (2, 3):
+                values = [
+                    (prefix, departement["id"], departement["region"])
+                    for prefix, departement in prefixes.items()
+                    if len(prefix) == length
+                ]
+                cursor.execute(
+                    f"""
+                    UPDATE {table}
+                    SET location_departement_code = p.departement,
+                        location_region_code = p.region
+                    FROM (VALUES {", ".join(["(%s, %s, %s)"] * len(values))})
+                        AS p (prefix, departement, region)
+                    WHERE {table}.location_country = 'FR'
+                    AND {table}.location_zip ~ '^[0-9]{{5}}$'
+                    AND LEFT({table}.location_zip, {length}) = p.prefix
+                    """,
+                    [v for row in values for v in row],
+                )
+
+    return migrations.RunPython(backfill, migrations.RunPython.noop)
+
+
 class TimeStampedModel(models.Model):
     created = models.DateTimeField(_("created"), default=timezone.now, editable=False)
     modified = models.DateTimeField(_("modified"), auto_now=True)
@@ -144,6 +183,18 @@ class LocationMixin(models.Model):
         _("pays"), blank=True, blank_label=_("(sélectionner un pays)"), default="FR"
     )
 
+    # codes dénormalisés pour permettre de filtrer efficacement par département et région
+    location_departement_code = models.CharField(
+        _("code du département"),
+        max_length=3,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
+    location_region_code = models.CharField(
+        _("code de la région"), max_length=3, blank=True, editable=False, db_index=True
+    )
+
     # legacy fields --> copied from NationBuilder
     location_address = models.CharField(
         _("adresse complète"),
@@ -154,6 +205,32 @@ class LocationMixin(models.Model):
         ),
     )
 
+    def update_location_codes(self):
+        """Met à jour les codes de département et de région à partir du code postal
+        """
+        departement = None
+        if self.location_country == "FR" and RE_FRENCH_ZIPCODE.match(self.location_zip):
+            departement = departement_from_zipcode(self.location_zip)
+
+        self.location_departement_code = departement["id"] if departement else ""
+        self.location_region_code = departement["region"] if departement else ""
+
+    def save(self, *args, **kwargs):
+        self.update_location_codes()
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {
+            "location_zip",
+            "location_country",
+        }.intersection(update_fields):
+            kwargs["update_fields"] = {
+                *update_fields,
+                "location_departement_code",
+                "location_region_code",
+            }
+
+        super().save(*args, **kwargs)
+
     def html_full_address(self):
         return display_address(self)
 
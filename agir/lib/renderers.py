@@ -0,0 +1,31 @@
+import json
+
+from rest_framework.renderers import JSONRenderer
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """Renderer JSON capable de sérialiser une liste au fur et à mesure
+
+    Il se comporte comme le renderer JSON habituel, mais permet en plus aux vues utilisant
+    `StreamingListMixin` de renvoyer une `StreamingHttpResponse` plutôt que de construire
+    toute la réponse en mémoire.
+    """
+
+    def render_iterable(self, iterable, renderer_context=None):
+        """Génère la représentation JSON d'une liste, morceau par morceau
+        """
+        separators = self.compact_separators if self.compact else self.pretty_separators
+
+        def dumps(item):
+            return json.dumps(
+                item,
+                cls=self.encoder_class,
+                ensure_ascii=self.ensure_ascii,
+                allow_nan=not self.strict,
+                separators=separators,
+            ).encode()
+
+        yield b"["
+        for i, item in enumerate(iterable):
+            yield dumps(item) if i == 0 else b"," + dumps(item)
+        yield b"]"
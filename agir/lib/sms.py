@@ -1,25 +1,58 @@
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
 from itertools import zip_longest
 
 import ovh
 from collections import namedtuple
 from django.conf import settings
 from django.utils import timezone
+from django.utils.module_loading import import_string
 from math import ceil
 from phonenumber_field.phonenumber import PhoneNumber
 from phonenumbers import number_type, PhoneNumberType
 
 logger = logging.getLogger(__name__)
 
-client = ovh.Client(
-    endpoint="ovh-eu",
-    application_key=settings.OVH_APPLICATION_KEY,
-    application_secret=settings.OVH_APPLICATION_SECRET,
-    consumer_key=settings.OVH_CONSUMER_KEY,
-)
+
+def create_ovh_client():
+    return ovh.Client(
+        endpoint="ovh-eu",
+        application_key=settings.OVH_APPLICATION_KEY,
+        application_secret=settings.OVH_APPLICATION_SECRET,
+        consumer_key=settings.OVH_CONSUMER_KEY,
+    )
+
+
+class LocalSMSClient:
+    """Client imitant l'API SMS d'OVH, pour le développement et les tests
+
+    Les messages ne sont pas envoyés mais conservés dans `jobs`. Les numéros
+    de `invalid_receivers` sont refusés comme le ferait OVH.
+    """
+
+    def __init__(self, invalid_receivers=()):
+        self.jobs = []
+        self.invalid_receivers = set(invalid_receivers)
+
+    def post(self, path, receivers, **params):
+        self.jobs.append({"receivers": receivers, **params})
+        logger.info(f"SMS à {', '.join(receivers)} : {params.get('message')}")
+
+        return {
+            "validReceivers": [r for r in receivers if r not in self.invalid_receivers],
+            "invalidReceivers": [r for r in receivers if r in self.invalid_receivers],
+        }
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    return import_string(settings.SMS_CLIENT)()
 
 
 BULK_GROUP_SIZE = 50
+BULK_MAX_WORKERS = 4
 GSM7_CODEPOINTS = {
     0x0040: 1,  # 	COMMERCIAL AT
     0x00A3: 1,  # 	POUND SIGN
@@ -160,6 +193,11 @@ GSM7_CODEPOINTS = {
     0x00FC: 1,  # 	LATIN SMALL LETTER U WITH DIAERESIS
     0x00E0: 1,  # 	LATIN SMALL LETTER A WITH GRAVE
 }
+GSM7_CHARACTERS = frozenset(chr(c) for c in GSM7_CODEPOINTS)
+GSM7_EXTENDED_CHARACTERS = frozenset(
+    chr(c) for c, septets in GSM7_CODEPOINTS.items() if septets == 2
+)
+GSM7_SEPTETS_TABLE = str.maketrans({c: "  " for c in GSM7_EXTENDED_CHARACTERS})
 
 
 def _send_sms(message, recipients, at=None):
@@ -182,7 +220,7 @@ def _send_sms(message, recipients, at=None):
         minutes = ceil((at - now).total_seconds() / 60)
         params["differedPeriod"] = minutes
 
-    return client.post("/sms/" + settings.OVH_SMS_SERVICE + "/jobs", **params)
+    return get_client().post("/sms/" + settings.OVH_SMS_SERVICE + "/jobs", **params)
 
 
 def to_phone_number(n):
@@ -193,27 +231,54 @@ def grouper(it, n):
     return ([e for e in g if e is not None] for g in zip_longest(*[iter(it)] * n))
 
 
+SMS_TEMPLATE_VARIABLE = re.compile(r"{{\s*([A-Z_]+)\s*}}")
+
+
+def sms_template_variables(template):
+    return set(SMS_TEMPLATE_VARIABLE.findall(template))
+
+
+def render_sms(template, bindings):
+    """Remplace les variables `{{ NOM }}` du modèle par leur valeur
+
+    Les variables sans valeur sont remplacées par une chaîne vide.
+    """
+    return SMS_TEMPLATE_VARIABLE.sub(
+        lambda match: bindings.get(match.group(1)) or "", template
+    )
+
+
 MessageLength = namedtuple("MessageLength", ["encoding", "byte_length", "messages"])
 
 
 def compute_sms_length_information(message):
-    if any(ord(c) not in GSM7_CODEPOINTS for c in message):
+    characters = set(message)
+
+    if not characters <= GSM7_CHARACTERS:
         return MessageLength(
             "UCS-2",
             2 * len(message),
             1 if len(message) <= 70 else ceil(len(message) / 67),
         )
 
-    encoding = (
-        "GSM7-EXT" if any(GSM7_CODEPOINTS[ord(c)] == 2 for c in message) else "GSM7"
-    )
-    base_length = sum(GSM7_CODEPOINTS[ord(c)] for c in message)
+    encoding = "GSM7-EXT" if characters & GSM7_EXTENDED_CHARACTERS else "GSM7"
+    # les caractères étendus sont remplacés par deux caractères : la longueur du
+    # résultat est le nombre de septets
+    base_length = len(message.translate(GSM7_SEPTETS_TABLE))
     byte_length = ceil(base_length * 7 / 8)
     messages = 1 if byte_length <= 140 else ceil(byte_length / 134)
 
     return MessageLength(encoding, byte_length, messages)
 
 
+def compute_sms_length_information_batch(messages):
+    """Renvoie les informations de longueur de chacun des messages distincts
+
+    :return: un dictionnaire associant chaque message distinct à son `MessageLength`
+    """
+    return {m: compute_sms_length_information(m) for m in set(messages)}
+
+
 class SMSSendException(Exception):
     def __init__(self, *args, sent=None, invalid=None):
         super().__init__()
@@ -257,18 +322,116 @@ def send_sms(message, phone_number, force=False, at=None):
         raise SMSSendException("Le message n'a pas été envoyé.")
 
 
-def send_bulk_sms(message, phone_numbers, at=None):
+def send_bulk_sms(
+    message, phone_numbers, at=None, journal=None, max_workers=BULK_MAX_WORKERS
+):
+    """Envoie un même message à de nombreux numéros, par lots envoyés en parallèle
+
+    Si un journal est fourni, les numéros qu'il indique comme déjà traités sont
+    ignorés, chaque lot y est enregistré avant son envoi et son résultat dès qu'il
+    est connu. Au plus `max_workers` lots sont en cours d'envoi à un moment donné.
+
+    :param journal: un objet possédant les méthodes `handled_numbers()`,
+        `start_batch(numbers)`, `finish_batch(batch_id, sent, invalid)` et
+        `fail_batch(batch_id)`, par exemple un `agir.people.actions.sms.SMSJournal`
+    :return: les ensembles des numéros auxquels le message a été envoyé et des
+        numéros invalides
+    :raises SMSSendException: si l'envoi de certains lots a échoué, une fois tous les
+        autres lots traités
+    """
+    numbers = (to_phone_number(n) for n in phone_numbers)
+    if journal is not None:
+        handled = journal.handled_numbers()
+        numbers = (n for n in numbers if n.as_e164 not in handled)
+
+    return _send_batches(
+        ((message, batch) for batch in grouper(numbers, BULK_GROUP_SIZE)),
+        at=at,
+        journal=journal,
+        max_workers=max_workers,
+    )
+
+
+def send_personalized_sms(
+    messages, at=None, journal=None, max_workers=BULK_MAX_WORKERS
+):
+    """Envoie à chaque numéro son propre message
+
+    Les numéros sont regroupés par texte : les destinataires d'un même texte sont
+    envoyés ensemble, par lots, comme avec `send_bulk_sms`.
+
+    :param messages: un itérable de couples (numéro, texte)
+    :return: les ensembles des numéros auxquels leur message a été envoyé et des
+        numéros invalides
+    :raises SMSSendException: comme `send_bulk_sms`
+    """
+    handled = journal.handled_numbers() if journal is not None else set()
+
+    groups = {}
+    for number, message in messages:
+        number = to_phone_number(number)
+        if number.as_e164 not in handled:
+            groups.setdefault(message, []).append(number)
+
+    return _send_batches(
+        (
+            (message, batch)
+            for message, numbers in groups.items()
+            for batch in grouper(numbers, BULK_GROUP_SIZE)
+        ),
+        at=at,
+        journal=journal,
+        max_workers=max_workers,
+    )
+
+
+def _send_batches(batches, at, journal, max_workers):
     sent = set()
     invalid = set()
+    failed = False
 
-    for numbers in grouper(phone_numbers, BULK_GROUP_SIZE):
+    def handle_result(future, batch_id):
+        nonlocal failed
         try:
-            result = _send_sms(message, [to_phone_number(n) for n in numbers], at=at)
-        except ovh.exceptions.APIError:
-            raise SMSSendException(
-                "L'API OVH a rencontré une erreur", sent=sent, invalid=invalid
-            )
+            result = future.result()
+        except (ovh.exceptions.APIError, SMSSendException):
+            logger.exception("Erreur lors de l'envoi d'un lot de SMS.")
+            failed = True
+            if journal is not None:
+                journal.fail_batch(batch_id)
+            return
+
         sent.update(result["validReceivers"])
         invalid.update(result["invalidReceivers"])
+        if journal is not None:
+            journal.finish_batch(
+                batch_id, result["validReceivers"], result["invalidReceivers"]
+            )
+
+    # le journal n'est manipulé que depuis ce thread : seuls les appels à l'API
+    # sont effectués dans les threads du pool
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+
+        for message, batch in batches:
+            if len(in_flight) >= max_workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    handle_result(future, in_flight.pop(future))
+
+            batch_id = (
+                journal.start_batch([n.as_e164 for n in batch])
+                if journal is not None
+                else None
+            )
+            in_flight[executor.submit(_send_sms, message, batch, at=at)] = batch_id
+
+        for future in list(in_flight):
+            handle_result(future, in_flight.pop(future))
+
+    if failed:
+        raise SMSSendException(
+            "L'API OVH a rencontré une erreur", sent=sent, invalid=invalid
+        )
 
     return sent, invalid
@@ -1,12 +1,46 @@
 import requests
 from celery import shared_task
+from django.core.cache import cache
+from django.db.models import Q
 
-from .geo import geocode_element
+from .geo import (
+    geocode_element,
+    geocode_ban_csv,
+    BAN_CSV_ENDPOINT,
+    NominatimExecutor,
+    RateLimitExceeded,
+    update_communes as _update_communes,
+)
+from .mail_templates import update_mail_templates as _update_mail_templates
+from .models import LocationMixin
 from agir.events.models import Event
 from agir.groups.models import SupportGroup
 from agir.people.models import Person
 
-__all__ = ["geocode_event", "geocode_support_group", "geocode_person"]
+__all__ = [
+    "geocode_event",
+    "geocode_support_group",
+    "geocode_person",
+    "bulk_geocode_people",
+    "geocode_foreign_people",
+    "update_mail_templates",
+    "update_communes",
+]
+
+BULK_GEOCODING_CHECKPOINT_KEY = "geocoding:bulk_people:checkpoint"
+BULK_GEOCODING_BATCH_SIZE = 5000
+FOREIGN_GEOCODING_BATCH_SIZE = 100
+FOREIGN_GEOCODING_MAX_ATTEMPTS = 5
+GEOCODING_FIELDS = [
+    "coordinates",
+    "coordinates_type",
+    "location_citycode",
+    "location_city",
+]
+
+
+def retry_countdown(retries):
+    return min(60 * 2 ** retries, 3600)
 
 
 def create_geocoder(model):
@@ -21,12 +55,104 @@ def create_geocoder(model):
             item.save()
         except (ValueError, requests.RequestException) as exc:
             self.retry(countdown=60, exc=exc)
+        except RateLimitExceeded as exc:
+            self.retry(countdown=retry_countdown(self.request.retries), exc=exc)
 
     geocode_model.__name__ = "geocode_{}".format(model.__name__.lower())
 
-    return shared_task(geocode_model, bind=True)
+    return shared_task(geocode_model, bind=True, max_retries=5)
 
 
 geocode_event = create_geocoder(Event)
 geocode_support_group = create_geocoder(SupportGroup)
 geocode_person = create_geocoder(Person)
+
+
+def people_to_geocode(foreign=False):
+    qs = Person.objects.filter(
+        Q(coordinates_type__isnull=True)
+        | Q(coordinates_type=LocationMixin.COORDINATES_NOT_FOUND),
+        ~Q(location_zip="", location_city=""),
+    )
+
+    if foreign:
+        qs = qs.exclude(location_country__in=["", "FR"])
+    else:
+        qs = qs.filter(location_country="FR")
+
+    return qs.order_by("pk")
+
+
+def get_bulk_geocoding_checkpoint():
+    return cache.get(BULK_GEOCODING_CHECKPOINT_KEY)
+
+
+def geocode_people_batch(
+    after=None, batch_size=BULK_GEOCODING_BATCH_SIZE, endpoint=BAN_CSV_ENDPOINT
+):
+    """Géolocalise le lot de personnes suivant `after` et enregistre l'avancement
+
+    Les personnes sont parcourues dans l'ordre de leur identifiant : le dernier
+    identifiant traité est conservé en cache et permet de reprendre un traitement
+    interrompu.
+
+    :return: le dernier identifiant traité, ou None s'il ne reste plus personne
+    """
+    qs = people_to_geocode()
+    if after is not None:
+        qs = qs.filter(pk__gt=after)
+
+    people = list(qs[:batch_size])
+    if not people:
+        cache.delete(BULK_GEOCODING_CHECKPOINT_KEY)
+        return None
+
+    geocode_ban_csv(people, endpoint=endpoint)
+    Person.objects.bulk_update(people, GEOCODING_FIELDS)
+
+    last = str(people[-1].pk)
+    cache.set(BULK_GEOCODING_CHECKPOINT_KEY, last, timeout=None)
+    return last
+
+
+@shared_task(bind=True, max_retries=5)
+def bulk_geocode_people(
+    self, after=None, batch_size=BULK_GEOCODING_BATCH_SIZE, endpoint=BAN_CSV_ENDPOINT
+):
+    try:
+        last = geocode_people_batch(after, batch_size, endpoint)
+    except requests.RequestException as exc:
+        self.retry(countdown=60, exc=exc)
+
+    if last is not None:
+        bulk_geocode_people.delay(last, batch_size, endpoint)
+
+
+@shared_task
+def geocode_foreign_people(pks, attempt=0):
+    """Géolocalise un lot de personnes étrangères avec Nominatim
+
+    Les personnes dont la géolocalisation a échoué sont reprogrammées dans un nouveau
+    lot, avec un délai croissant à chaque tentative.
+    """
+    people = list(Person.objects.filter(pk__in=pks))
+    failed = NominatimExecutor().geocode(people)
+
+    Person.objects.bulk_update([p for p in people if p not in failed], GEOCODING_FIELDS)
+
+    if failed and attempt + 1 < FOREIGN_GEOCODING_MAX_ATTEMPTS:
+        geocode_foreign_people.apply_async(
+            ([str(p.pk) for p in failed], attempt + 1),
+            countdown=retry_countdown(attempt),
+        )
+
+
+@shared_task
+def update_mail_templates():
+    updated, failed = _update_mail_templates()
+    return {"updated": updated, "failed": failed}
+
+
+@shared_task
+def update_communes():
+    return _update_communes()
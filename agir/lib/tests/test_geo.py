@@ -1,17 +1,42 @@
+import csv
+import io
 import json
+import shutil
+import tempfile
+import threading
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
 from unittest.mock import patch, Mock
 
 from functools import wraps
 
-from django.test import TestCase
+from django.conf import settings
+from requests import RequestException
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 
-from agir.lib.geo import geocode_ban
+from agir.lib.geo import (
+    geocode_ban,
+    CommuneIndex,
+    get_results_from_ban,
+    NominatimExecutor,
+    RateLimitExceeded,
+    get_results_from_nominatim,
+    get_communes,
+)
 from agir.lib.models import LocationMixin
 from agir.people.models import Person
 
 
 JSON_DIR = Path(__file__).parent / "geoban_json"
+COMMUNES_FIXTURE = Path(__file__).parent / "data" / "communes.csv"
+
+
+def use_commune_index(test_case, index):
+    patcher = patch("agir.lib.geo.get_communes", return_value=index)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
 
 
 def with_json_response(file_name):
@@ -40,6 +65,8 @@ def with_json_response(file_name):
 
 class BanTestCase(TestCase):
     def setUp(self):
+        # index local vide : toutes les recherches passent par la BAN
+        use_commune_index(self, CommuneIndex([]))
         self.person = Person.objects.create_person(
             "multi_city@test.com", location_country="FR"
         )
@@ -118,3 +145,249 @@ class BanTestCase(TestCase):
         self.assertEqual(
             self.person.coordinates_type, LocationMixin.COORDINATES_NOT_FOUND
         )
+
+
+class OfflineGeocodingTestCase(TestCase):
+    def setUp(self):
+        use_commune_index(self, CommuneIndex.from_csv(COMMUNES_FIXTURE))
+        self.person = Person.objects.create_person(
+            "offline@test.com", location_country="FR"
+        )
+
+    def geocode_offline(self):
+        with patch("agir.lib.geo.requests") as requests:
+            geocode_ban(self.person)
+            requests.get.assert_not_called()
+
+    def test_geocode_zip_with_single_commune(self):
+        self.person.location_zip = "21000"
+        self.geocode_offline()
+
+        self.assertEqual(self.person.location_citycode, "21231")
+        self.assertEqual(self.person.coordinates.coords, (5.041742, 47.322982))
+        self.assertEqual(self.person.coordinates_type, LocationMixin.COORDINATES_CITY)
+
+    def test_geocode_shared_zip_with_city_name(self):
+        self.person.location_zip = "21570"
+        self.person.location_city = "belan sur ource"
+        self.geocode_offline()
+
+        self.assertEqual(self.person.location_citycode, "21058")
+        self.assertEqual(self.person.coordinates_type, LocationMixin.COORDINATES_CITY)
+
+    def test_geocode_city_name_only(self):
+        self.person.location_city = "Riel-les-Eaux"
+        self.geocode_offline()
+
+        self.assertEqual(self.person.location_citycode, "21524")
+
+    @with_json_response("45621_invalide.json")
+    def test_unknown_zip_falls_back_to_ban(self):
+        self.person.location_zip = "45621"
+        geocode_ban(self.person)
+
+        self.assertEqual(
+            self.person.coordinates_type, LocationMixin.COORDINATES_NOT_FOUND
+        )
+
+    def test_commune_index(self):
+        index = CommuneIndex(
+            [
+                ("01000", "01001", "Saint-Denis", "1.0", "2.0"),
+                ("01001", "01001", "Saint-Denis", "1.0", "2.0"),
+                ("02000", "02002", "Saint-Denis", "3.0", "4.0"),
+            ]
+        )
+
+        self.assertEqual(len(index), 2)
+        self.assertIs(index.find("01000")[0], index.find("01001")[0])
+        self.assertEqual(len(index.find(city="saint denis")), 2)
+        self.assertEqual(index.find("03000"), [])
+
+    def test_commune_index_is_loaded_once_file_exists(self):
+        with tempfile.TemporaryDirectory() as directory:
+            communes_file = Path(directory) / "communes.csv"
+            with patch("agir.lib.geo.COMMUNES_FILE", communes_file), patch(
+                "agir.lib.geo._communes", None
+            ):
+                self.assertEqual(len(get_communes()), 0)
+
+                shutil.copy(COMMUNES_FIXTURE, communes_file)
+                self.assertEqual(get_communes().find("21000")[0].citycode, "21231")
+
+
+@override_settings(
+    CACHES={
+        **settings.CACHES,
+        "geocoding_test": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    },
+    GEOCODING_CACHE="geocoding_test",
+)
+class GeocodingCacheTestCase(TestCase):
+    @with_json_response("92160_adresse_complette.json")
+    def test_repeated_queries_are_cached(self):
+        from agir.lib.geo import requests
+
+        query = {"q": "14 rue du Lavoir de la Grande Pierre 92160 Antony", "limit": 5}
+        results = get_results_from_ban(query)
+
+        self.assertEqual(
+            get_results_from_ban(
+                {"q": "14 RUE DU LAVOIR DE LA GRANDE PIERRE  92160 ANTONY", "limit": 5}
+            ),
+            results,
+        )
+        self.assertEqual(requests.get.call_count, 1)
+        self.assertEqual(results["features"][0]["properties"]["citycode"], "92002")
+
+    @with_json_response("92160_adresse_complette.json")
+    def test_geocoding_works_when_cache_is_down(self):
+        from agir.lib.geo import requests
+
+        cache = Mock()
+        cache.get.side_effect = cache.set.side_effect = ConnectionError()
+
+        with patch("agir.lib.geo.caches", {"geocoding_test": cache}):
+            results = get_results_from_ban(
+                {"q": "14 rue du Lavoir de la Grande Pierre 92160 Antony", "limit": 5}
+            )
+
+        self.assertEqual(requests.get.call_count, 1)
+        self.assertEqual(results["features"][0]["properties"]["citycode"], "92002")
+
+
+class BanCSVHandler(BaseHTTPRequestHandler):
+    """Imite l'API CSV de la BAN : seules les adresses de `KNOWN_ADDRESSES` sont trouvées
+    """
+
+    KNOWN_ADDRESSES = {
+        "14 rue du lavoir de la grande pierre": {
+            "result_type": "housenumber",
+            "result_citycode": "92002",
+            "longitude": "2.298665",
+            "latitude": "48.751302",
+        }
+    }
+    RESULT_COLUMNS = ["result_type", "result_citycode", "longitude", "latitude"]
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        message = BytesParser().parsebytes(
+            "Content-Type: {}\r\n\r\n".format(self.headers["Content-Type"]).encode()
+            + body
+        )
+        data = next(
+            part.get_payload(decode=True).decode()
+            for part in message.get_payload()
+            if part.get_param("name", header="content-disposition") == "data"
+        )
+
+        reader = csv.DictReader(io.StringIO(data))
+        output = io.StringIO()
+        writer = csv.DictWriter(output, reader.fieldnames + self.RESULT_COLUMNS)
+        writer.writeheader()
+        for row in reader:
+            writer.writerow(
+                {**row, **self.KNOWN_ADDRESSES.get(row["address"].lower(), {})}
+            )
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.end_headers()
+        self.wfile.write(output.getvalue().encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class BulkGeocodingTestCase(TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), BanCSVHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = "http://127.0.0.1:{}/search/csv/".format(
+            self.server.server_port
+        )
+
+        self.found = Person.objects.create_person(
+            "found@test.com",
+            location_country="FR",
+            location_address1="14 rue du Lavoir de la Grande Pierre",
+            location_zip="92160",
+            location_city="Antony",
+            coordinates_type=LocationMixin.COORDINATES_NOT_FOUND,
+        )
+        self.not_found = Person.objects.create_person(
+            "not_found@test.com",
+            location_country="FR",
+            location_address1="1 rue qui n'existe pas",
+            location_zip="92160",
+            coordinates_type=LocationMixin.COORDINATES_NOT_FOUND,
+        )
+        self.city_only = Person.objects.create_person(
+            "city_only@test.com", location_country="FR", location_zip="21000"
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_geocode_people_in_batches(self):
+        call_command("geocode_people", batch_size=2, endpoint=self.endpoint)
+
+        for person in [self.found, self.not_found, self.city_only]:
+            person.refresh_from_db()
+
+        self.assertEqual(self.found.coordinates_type, LocationMixin.COORDINATES_EXACT)
+        self.assertEqual(self.found.location_citycode, "92002")
+        self.assertEqual(self.found.coordinates.coords, (2.298665, 48.751302))
+        self.assertEqual(
+            self.not_found.coordinates_type, LocationMixin.COORDINATES_NOT_FOUND
+        )
+        self.assertEqual(
+            self.city_only.coordinates_type, LocationMixin.COORDINATES_CITY
+        )
+        self.assertEqual(self.city_only.location_citycode, "21231")
+
+
+class NominatimTestCase(TestCase):
+    def setUp(self):
+        self.people = [
+            Person.objects.create_person(
+                "foreign{}@test.com".format(i),
+                location_country="BE",
+                location_city=city,
+            )
+            for i, city in enumerate(["Bruxelles", "Liège", "Namur"])
+        ]
+
+    @patch("agir.lib.geo.nominatim_bucket")
+    @patch("agir.lib.geo.nominatim_session")
+    def test_executor_returns_failed_items(self, session, bucket):
+        bucket.has_tokens.return_value = True
+
+        def get(url, params, timeout):
+            if "Namur" in params["q"]:
+                raise RequestException()
+            res = Mock()
+            res.json.return_value = [{"lon": "4.35", "lat": "50.85"}]
+            return res
+
+        session.get.side_effect = get
+
+        failed = NominatimExecutor(max_workers=2).geocode(self.people)
+
+        self.assertEqual(failed, [self.people[2]])
+        self.assertEqual(self.people[0].coordinates.coords, (4.35, 50.85))
+        self.assertEqual(
+            self.people[1].coordinates_type, LocationMixin.COORDINATES_UNKNOWN_PRECISION
+        )
+
+    @override_settings(NOMINATIM_MAX_WAIT=0)
+    @patch("agir.lib.geo.nominatim_bucket")
+    @patch("agir.lib.geo.nominatim_session")
+    def test_rate_limit_does_not_block(self, session, bucket):
+        bucket.has_tokens.return_value = False
+
+        with self.assertRaises(RateLimitExceeded):
+            get_results_from_nominatim({"format": "json", "q": "Namur", "limit": 1})
+        session.get.assert_not_called()
@@ -0,0 +1,114 @@
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from agir.lib import mail_templates
+
+
+class MosaicoHandler(BaseHTTPRequestHandler):
+    """Imite le serveur Mosaico, avec revalidation par ETag
+    """
+
+    content = "<p>Bonjour [EMAIL]</p>"
+    requests = []
+
+    def do_GET(self):
+        etag = f'"{len(self.content)}"'
+        self.requests.append(self.headers.get("If-None-Match"))
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(self.content.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class MailTemplatesTestCase(TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), MosaicoHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_port}/template.html"
+        MosaicoHandler.requests = []
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        directory = Path(self.tmp_dir.name)
+        (directory / "OLD_TEMPLATE.html").write_text("ancien")
+
+        self.patches = [
+            patch.object(mail_templates, "MAIL_TEMPLATES_DIR", directory),
+            patch.object(mail_templates, "VERSIONS_FILE", directory / "versions.json"),
+        ]
+        for p in self.patches:
+            p.start()
+
+        self.settings_override = override_settings(
+            EMAIL_TEMPLATES={"TEST_TEMPLATE": url}
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        for p in reversed(self.patches):
+            p.stop()
+        self.tmp_dir.cleanup()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_update_mail_templates_with_revalidation(self):
+        updated, failed = mail_templates.update_mail_templates()
+
+        self.assertEqual((updated, failed), (["TEST_TEMPLATE"], []))
+        self.assertEqual(
+            (mail_templates.MAIL_TEMPLATES_DIR / "TEST_TEMPLATE.html").read_text(),
+            "<p>Bonjour {{ EMAIL }}</p>",
+        )
+        self.assertTrue(
+            (mail_templates.MAIL_TEMPLATES_DIR / "TEST_TEMPLATE.txt").exists()
+        )
+        self.assertFalse(
+            (mail_templates.MAIL_TEMPLATES_DIR / "OLD_TEMPLATE.html").exists()
+        )
+
+        updated, failed = mail_templates.update_mail_templates()
+
+        self.assertEqual((updated, failed), ([], []))
+        self.assertEqual(MosaicoHandler.requests, [None, '"22"'])
+
+    def test_compiled_template_is_invalidated_when_file_changes(self):
+        mail_templates.update_mail_templates()
+
+        template = mail_templates.get_mail_template("TEST_TEMPLATE")
+        self.assertIs(mail_templates.get_mail_template("TEST_TEMPLATE"), template)
+        self.assertEqual(template.render({"EMAIL": "a@b.fr"}), "<p>Bonjour a@b.fr</p>")
+
+        with patch.object(MosaicoHandler, "content", "<p>Salut [EMAIL]</p>"):
+            mail_templates.update_mail_templates()
+
+        self.assertEqual(
+            mail_templates.get_mail_template("TEST_TEMPLATE").render(
+                {"EMAIL": "a@b.fr"}
+            ),
+            "<p>Salut a@b.fr</p>",
+        )
+
+    def test_packaged_template_is_used_until_copied(self):
+        template = mail_templates.get_mail_template("WELCOME_MESSAGE")
+
+        self.assertEqual(
+            template.template.source,
+            (
+                mail_templates.PACKAGED_TEMPLATES_DIR / "WELCOME_MESSAGE.html"
+            ).read_text(),
+        )
@@ -1,11 +1,18 @@
+from datetime import timedelta
 from unittest import mock
 
+from django.conf import settings
 from django.test import TestCase, override_settings
+from django.utils import timezone
 
+from agir.api.redis import get_auth_redis_client, using_redislite
+from agir.groups.models import SupportGroup, SupportGroupSubtype, Membership
 from agir.lib import mailtrain
-from agir.people.models import Person
+from agir.people.actions import mailtrain as mailtrain_sync
+from agir.people.models import Person, PersonTag
 
 
+@using_redislite
 @override_settings(MAILTRAIN_DISABLE=False)
 class MailTrainTestCase(TestCase):
     @mock.patch("agir.lib.mailtrain.s.post")
@@ -47,3 +54,110 @@ class MailTrainTestCase(TestCase):
         delete.assert_called_once()
         unsubscribe.assert_called_once()
         self.assertEqual(subscribe.call_count, 2)
+
+    @mock.patch("agir.people.tasks.update_person_mailtrain")
+    @mock.patch("agir.lib.mailtrain.subscribe_email")
+    def test_update_people(self, subscribe, *args):
+        certified_subtype = SupportGroupSubtype.objects.create(
+            label=settings.CERTIFIED_GROUP_SUBTYPES[0],
+            description="Groupe certifié",
+            type=SupportGroup.TYPE_LOCAL_GROUP,
+        )
+        group = SupportGroup.objects.create(
+            name="Groupe", type=SupportGroup.TYPE_LOCAL_GROUP
+        )
+        group.subtypes.add(certified_subtype)
+        tag = PersonTag.objects.create(label="exporté", exported=True)
+
+        animator = Person.objects.create(email="animator@example.com")
+        Membership.objects.create(person=animator, supportgroup=group, is_manager=True)
+        animator.tags.add(tag, PersonTag.objects.create(label="interne"))
+        other = Person.objects.create(email="other@example.com")
+
+        self.assertEqual(mailtrain.update_people([animator, other]), 2)
+
+        fields = {call[0][0]: call[0][1] for call in subscribe.call_args_list}
+        self.assertCountEqual(fields, ["animator@example.com", "other@example.com"])
+        self.assertEqual(
+            fields["animator@example.com"]["MERGE_INSCRIPTIONS"],
+            "evenements_no,groupe_yes,groupe_certifié_yes,groupe_anim_yes,"
+            "groupe_certifié_anim_yes,country-FR",
+        )
+        self.assertEqual(fields["animator@example.com"]["MERGE_TAGS"], ",exporté,")
+        self.assertEqual(
+            fields["other@example.com"]["MERGE_INSCRIPTIONS"],
+            "evenements_no,groupe_no,groupe_certifié_no,groupe_anim_no,"
+            "groupe_certifié_anim_no,country-FR",
+        )
+        self.assertEqual(fields["other@example.com"]["MERGE_TAGS"], ",,")
+
+    def mock_push(self, update_people):
+        pushed = []
+
+        def push(people, max_workers):
+            pushed.extend(person.email for person in people)
+            return len(people)
+
+        update_people.side_effect = push
+        get_auth_redis_client().delete(
+            mailtrain_sync.WATERMARK_KEY, mailtrain_sync.REFRESH_DATE_KEY
+        )
+        return pushed
+
+    @mock.patch("agir.people.tasks.update_person_mailtrain")
+    @mock.patch("agir.people.actions.mailtrain.update_people")
+    def test_incremental_sync(self, update_people, *args):
+        pushed = self.mock_push(update_people)
+
+        group = SupportGroup.objects.create(name="Groupe")
+        tagged = Person.objects.create(email="tagged@example.com")
+        member = Person.objects.create(email="member@example.com")
+        Person.objects.create(email="unchanged@example.com")
+
+        # sans date de dernière synchronisation, toutes les personnes sont envoyées
+        self.assertEqual(list(mailtrain_sync.incremental_sync()), [3])
+        self.assertLessEqual(
+            mailtrain_sync.get_watermark(),
+            timezone.now() - mailtrain_sync.WATERMARK_MARGIN,
+        )
+
+        # on ignore la marge de sécurité, qui renverrait toutes les personnes
+        mailtrain_sync.set_watermark(timezone.now())
+        pushed.clear()
+        tagged.tags.add(PersonTag.objects.create(label="tag"))
+        Membership.objects.create(person=member, supportgroup=group)
+
+        self.assertEqual(list(mailtrain_sync.incremental_sync()), [2])
+        self.assertCountEqual(pushed, ["tagged@example.com", "member@example.com"])
+
+        mailtrain_sync.set_watermark(timezone.now())
+        self.assertEqual(list(mailtrain_sync.incremental_sync()), [])
+        self.assertEqual(list(mailtrain_sync.incremental_sync(full=True)), [3])
+
+    @mock.patch("agir.people.tasks.update_person_mailtrain")
+    @mock.patch("agir.people.actions.mailtrain.update_people")
+    def test_unchanged_people_are_pushed_before_login_links_expire(
+        self, update_people, *args
+    ):
+        pushed = self.mock_push(update_people)
+        Person.objects.create(email="unchanged@example.com")
+        start = timezone.now()
+
+        with mock.patch("django.utils.timezone.now", return_value=start):
+            list(mailtrain_sync.incremental_sync())
+
+        for days in range(1, settings.CONNECTION_LINK_VALIDITY + 1):
+            pushed.clear()
+            # une synchronisation un jour sur deux seulement
+            if days % 2:
+                continue
+            with mock.patch(
+                "django.utils.timezone.now", return_value=start + timedelta(days=days)
+            ):
+                list(mailtrain_sync.incremental_sync())
+
+            if pushed:
+                break
+
+        self.assertEqual(pushed, ["unchanged@example.com"])
+        self.assertLess(days, settings.CONNECTION_LINK_VALIDITY)
@@ -4,6 +4,7 @@ from datetime import datetime
 from django.test import TestCase
 from django.db import IntegrityError
 
+from agir.lib import data
 from . import models
 
 
@@ -105,6 +106,26 @@ class LocationMixinTestCase(TestCase):
         self.assertEqual(instance.region, "Guadeloupe")
         self.assertEqual(instance.ancienne_region, "Guadeloupe")
 
+    def test_location_codes(self):
+        instance = models.LocationModel.objects.create(
+            location_zip="20200", location_country="FR"
+        )
+        self.assertEqual(instance.location_departement_code, "2B")
+        self.assertEqual(instance.location_region_code, "94")
+        self.assertTrue(
+            models.LocationModel.objects.filter(
+                data.filtre_region("Corse"), pk=instance.pk
+            ).exists()
+        )
+
+        instance.location_country = "BE"
+        instance.save(update_fields=["location_country"])
+        instance.refresh_from_db()
+        self.assertEqual(instance.location_departement_code, "")
+        self.assertFalse(
+            models.LocationModel.objects.filter(data.filtre_departement("2B")).exists()
+        )
+
     def test_no_region(self):
         instance = models.LocationModel.objects.create(
             location_zip="97500", location_country="FR"
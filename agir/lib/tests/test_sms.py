@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from django.test import TestCase
 from math import ceil
 
@@ -6,7 +8,13 @@ from agir.lib.sms import (
     MessageLength,
     SMSSendException,
     send_bulk_sms,
+    LocalSMSClient,
+    compute_sms_length_information_batch,
+    render_sms,
+    send_personalized_sms,
 )
+from agir.people.actions.sms import SMSJournal
+from agir.people.models import SMSBatch
 
 
 def _mock_send_sms(message, recipients, at=None):
@@ -46,6 +54,27 @@ class SMSLengthTestCase(TestCase):
         )
         self.assertEqual(res, MessageLength("UCS-2", 57 * 2, 1))
 
+    def test_batch_length_information(self):
+        res = compute_sms_length_information_batch(["a" * 200, "ŸÔâ", "a" * 200])
+
+        self.assertEqual(
+            res,
+            {
+                "a" * 200: MessageLength("GSM7", 175, 2),
+                "ŸÔâ": MessageLength("UCS-2", 6, 1),
+            },
+        )
+
+
+class SMSTemplateTestCase(TestCase):
+    def test_render_sms(self):
+        self.assertEqual(
+            render_sms(
+                "Bonjour {{ FIRST_NAME }}{{UNKNOWN}} !", {"FIRST_NAME": "Marie"}
+            ),
+            "Bonjour Marie !",
+        )
+
 
 class SMSSendingTestCase(TestCase):
     def setUp(self) -> None:
@@ -72,3 +101,72 @@ class SMSSendingTestCase(TestCase):
 
         self.assertEqual(sent, {"+33678956454", "+33678451252"})
         self.assertEqual(invalid, {"+33754986598"})
+
+    def test_can_resume_mass_sms_from_journal(self):
+        numbers = ["+33678956454", "+33754986598", "+33678451252", "+33612345678"]
+        journal = SMSJournal("test")
+
+        # le deuxième lot échoue
+        _mock_send_sms.counter = 2
+        try:
+            with self.assertRaises(SMSSendException) as cm:
+                send_bulk_sms("mon message", numbers, journal=journal, max_workers=1)
+        finally:
+            _mock_send_sms.counter = None
+
+        self.assertEqual(cm.exception.sent, {"+33678956454"})
+        self.assertEqual(
+            journal.batches.filter(status=SMSBatch.STATUS_FAILED).count(), 1
+        )
+
+        sent, invalid = send_bulk_sms("mon message", numbers, journal=journal)
+        self.assertEqual(sent, {"+33678451252", "+33612345678"})
+        self.assertEqual(
+            journal.results(), ({*sent, "+33678956454"}, invalid | {"+33754986598"})
+        )
+
+    def test_pending_batches_are_not_sent_again(self):
+        journal = SMSJournal("test")
+        journal.start_batch(["+33678956454"])
+
+        sent, invalid = send_bulk_sms(
+            "mon message", ["+33678956454", "+33678451252"], journal=journal
+        )
+        self.assertEqual(sent, {"+33678451252"})
+
+
+class LocalSMSClientTestCase(TestCase):
+    def test_can_send_with_local_client(self):
+        client = LocalSMSClient(invalid_receivers=["+33754986598"])
+
+        with patch("agir.lib.sms.get_client", return_value=client):
+            sent, invalid = send_bulk_sms(
+                "mon message", ["+33678956454", "+33754986598"]
+            )
+
+        self.assertEqual(sent, {"+33678956454"})
+        self.assertEqual(invalid, {"+33754986598"})
+        self.assertEqual(client.jobs[0]["message"], "mon message")
+
+
+class PersonalizedSMSTestCase(TestCase):
+    def test_recipients_are_grouped_by_text(self):
+        client = LocalSMSClient()
+
+        with patch("agir.lib.sms.get_client", return_value=client):
+            sent, invalid = send_personalized_sms(
+                [
+                    ("+33600000001", "Bonjour Marie"),
+                    ("+33600000002", "Bonjour Paul"),
+                    ("+33600000003", "Bonjour Marie"),
+                ]
+            )
+
+        self.assertEqual(sent, {"+33600000001", "+33600000002", "+33600000003"})
+        self.assertCountEqual(
+            [(job["message"], sorted(job["receivers"])) for job in client.jobs],
+            [
+                ("Bonjour Marie", ["+33600000001", "+33600000003"]),
+                ("Bonjour Paul", ["+33600000002"]),
+            ],
+        )
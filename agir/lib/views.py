@@ -1,8 +1,15 @@
+from itertools import islice
+
 from django.contrib import messages
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
 from rest_framework.generics import GenericAPIView, get_object_or_404
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 
 from agir.lib.form_fields import AcceptCreativeCommonsLicenceField
+from agir.lib.renderers import StreamingJSONRenderer
 
 PICT_RATIO_MIN = 1.8
 PICT_RATIO_MAX = 2.1
@@ -40,6 +47,65 @@ class NationBuilderViewMixin(GenericAPIView):
         return obj
 
 
+def iterate_queryset(queryset, chunk_size):
+    """Parcourt un queryset avec un curseur côté serveur, en préchargeant les relations par morceaux
+
+    `QuerySet.iterator()` ignore les `prefetch_related` : ils sont donc appliqués ici à chaque
+    morceau de `chunk_size` éléments.
+    """
+    lookups = queryset._prefetch_related_lookups
+    iterator = queryset.iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+
+        if lookups:
+            prefetch_related_objects(chunk, *lookups)
+
+        yield from chunk
+
+
+class StreamingListMixin(object):
+    """Renvoie les listes en JSON au fur et à mesure du parcours du queryset
+
+    La mémoire utilisée ne dépend ainsi pas du nombre d'éléments renvoyés. Avec un autre
+    renderer (par exemple l'API navigable), la réponse est construite de façon habituelle.
+    """
+
+    renderer_classes = (StreamingJSONRenderer, *api_settings.DEFAULT_RENDERER_CLASSES)
+    streaming_chunk_size = 1000
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        return self.get_list_response(queryset)
+
+    def get_list_response(self, queryset, serializer=None):
+        if serializer is None:
+            serializer = self.get_serializer()
+
+        items = (
+            serializer.to_representation(item)
+            for item in iterate_queryset(queryset, self.streaming_chunk_size)
+        )
+
+        renderer = self.request.accepted_renderer
+        if not isinstance(renderer, StreamingJSONRenderer):
+            return Response(list(items))
+
+        return StreamingHttpResponse(
+            renderer.render_iterable(items, self.get_renderer_context()),
+            content_type=renderer.media_type,
+        )
+
+
 class CreationSerializerMixin(object):
     def get_serializer_class(self):
         if self.request.method == "POST":
@@ -0,0 +1,36 @@
+# Generated by Django 2.2 on 2019-05-28 14:37
+
+from django.db import migrations, models
+
+from agir.lib.models import location_codes_backfill
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("payments", "0012_change_europeennes_dons")]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="location_departement_code",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=3,
+                verbose_name="code du département",
+            ),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="location_region_code",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=3,
+                verbose_name="code de la région",
+            ),
+        ),
+        location_codes_backfill("payments", "payment"),
+    ]
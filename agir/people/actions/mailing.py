@@ -1,20 +1,32 @@
 from email.mime.base import MIMEBase
+from uuid import uuid4
 from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 import re
+from functools import lru_cache
+
+from celery import group
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.http import QueryDict
 from django.core.mail import EmailMultiAlternatives, get_connection
-from django.template import loader, TemplateDoesNotExist
+from django.template import TemplateDoesNotExist
 
 import html2text
+from django.utils.html import conditional_escape
 from django.utils.safestring import mark_safe
 
+from agir.lib.mail_templates import get_mail_template
 from agir.people.models import Person
 from agir.lib.utils import generate_token_params, front_url, is_front_url, AutoLoginUrl
 
-__all__ = ["send_mail", "send_mosaico_email"]
+__all__ = [
+    "send_mail",
+    "send_mosaico_email",
+    "dispatch_notification",
+    "send_notification_chunk",
+]
 
 _h = html2text.HTML2Text(bodywidth=0)
 _h.ignore_images = True
@@ -27,6 +39,7 @@ def conditional_html_to_text(text):
     return mark_safe(text)
 
 
+@lru_cache(maxsize=256)
 def generate_plain_text(html_message):
     return (
         re.sub("Cet email a été envoyé à .*$", "", _h.handle(html_message))
@@ -55,26 +68,104 @@ def add_params_to_urls(url, params):
     )
 
 
-def get_context_from_bindings(code, recipient, bindings):
-    """Finalizes the bindings and create a Context for templating
+# variables dont la valeur dépend du destinataire, en plus des liens de connexion
+# automatique
+RECIPIENT_VARIABLES = ["EMAIL", "LINK_BROWSER", "MERGE_LOGIN_QUERY"]
+
+
+def query_string(params):
+    qs = QueryDict(mutable=True)
+    qs.update(params)
+    return qs.urlencode()
+
+
+TEMPLATE_TAG_REGEX = re.compile(r"{{(.*?)}}|{%.*?%}", re.DOTALL)
+
+
+def substitutable_variables(source, variables):
+    """Renvoie celles des variables que le template n'utilise que sous la forme `{{ VARIABLE }}`
+
+    Une variable à laquelle le template applique un filtre ou une balise (`{% if %}`,
+    `{% with %}`...) ne peut pas être remplacée après le rendu.
     """
-    if code not in settings.EMAIL_TEMPLATES:
-        raise ImproperlyConfigured("Mail '%s' cannot be found")
+    variables = set(variables)
+    for match in TEMPLATE_TAG_REGEX.finditer(source):
+        if match.group(1) is None or match.group(1).strip() not in variables:
+            variables.difference_update(re.findall(r"\w+", match.group(0)))
+    return variables
 
-    url = settings.EMAIL_TEMPLATES[code]
 
-    res = dict(bindings)
-    res["EMAIL"] = recipient
+class MosaicoSkeleton:
+    """Rendu d'un template Mosaico commun à tous les destinataires
 
-    qs = QueryDict(mutable=True)
-    qs.update(res)
+    Le template est rendu une seule fois, les variables propres à chaque
+    destinataire étant remplacées par des marqueurs ; le message de chaque
+    destinataire est ensuite obtenu en substituant ces marqueurs.
+
+    Ce n'est possible que si le template insère ces variables telles quelles : si
+    l'une d'elles est filtrée (`{{ EMAIL|upper }}`) ou utilisée dans une balise
+    (`{% if LINK_BROWSER %}`), le rendu porterait sur le marqueur et non sur sa
+    valeur. Le template est alors rendu en entier pour chaque destinataire.
+    """
+
+    def __init__(self, html_template, text_template, bindings, variables):
+        self.html_template = html_template
+        self.text_template = text_template
+        self.bindings = bindings
+        self.sources = [t.template.source for t in (html_template, text_template) if t]
+        self.substitutable = all(
+            substitutable_variables(source, variables) == set(variables)
+            for source in self.sources
+        )
+
+        if not self.substitutable:
+            return
+
+        self.placeholders = {
+            name: f"agirvariable{i}x" for i, name in enumerate(variables)
+        }
+        self.placeholder_regex = re.compile(
+            "|".join(re.escape(p) for p in self.placeholders.values())
+        )
+        self.names = {p: name for name, p in self.placeholders.items()}
+
+        self.html, self.text = self.render_templates(self.placeholders)
+
+    def render_templates(self, values):
+        context = {**self.bindings, **values}
+        html = self.html_template.render(context=context)
+        text = (
+            self.text_template.render(
+                context={k: conditional_html_to_text(v) for k, v in context.items()}
+            )
+            if self.text_template
+            else generate_plain_text(html)
+        )
+        return html, text
 
-    # We first initialize the LINK_BROWSER variable as "#" (same page)
-    qs["LINK_BROWSER"] = "#"
-    # we generate the final browser link and add it to result dictionary
-    res["LINK_BROWSER"] = f"{url}?{qs.urlencode()}"
+    def uses(self, name):
+        if not self.substitutable:
+            return any(re.search(rf"\b{name}\b", source) for source in self.sources)
 
-    return res
+        placeholder = self.placeholders[name]
+        return placeholder in self.html or placeholder in self.text
+
+    def render(self, values):
+        """Renvoie les versions HTML et texte du message pour un destinataire
+
+        :param values: la valeur de chacune des variables propres au destinataire
+        """
+        if not self.substitutable:
+            return self.render_templates(values)
+
+        return (
+            self.placeholder_regex.sub(
+                lambda m: conditional_escape(values[self.names[m.group(0)]]), self.html
+            ),
+            self.placeholder_regex.sub(
+                lambda m: str(values[self.names[m.group(0)]]), self.text
+            ),
+        )
 
 
 def send_mosaico_email(
@@ -102,72 +193,188 @@ def send_mosaico_email(
     :param fail_silently: whether any error should be raised, or just be ignored; by default it will raise
     :param gen_connection_params_function: a function that takes a recipient and generates connection params
     """
+    if connection is None:
+        connection = get_connection(backend, fail_silently)
+
+    with connection:
+        for recipient, email in generate_mosaico_emails(
+            code=code,
+            subject=subject,
+            from_email=from_email,
+            recipients=recipients,
+            bindings=bindings,
+            connection=connection,
+            preferences_link=preferences_link,
+            reply_to=reply_to,
+            attachments=attachments,
+        ):
+            email.send(fail_silently=fail_silently)
+
+
+def generate_mosaico_emails(
+    code,
+    subject,
+    from_email,
+    recipients,
+    bindings=None,
+    connection=None,
+    preferences_link=True,
+    reply_to=None,
+    attachments=None,
+):
+    """Generate the emails built from a Mosaico template, without sending them
+
+    Takes the same arguments as `send_mosaico_email`, and yields (recipient, email)
+    tuples, so that the caller may send each email and record its delivery.
+    """
     try:
-        iter(recipients)
+        recipients = list(recipients)
     except TypeError:
         recipients = [recipients]
 
     if bindings is None:
         bindings = {}
 
-    if connection is None:
-        connection = get_connection(backend, fail_silently)
-
     if preferences_link:
         bindings["PREFERENCES_LINK"] = front_url("contact")
 
-    link_bindings = {
-        key: value for key, value in bindings.items() if is_front_url(value)
+    auto_login_bindings = {
+        key: value
+        for key, value in bindings.items()
+        if isinstance(value, AutoLoginUrl) and is_front_url(value)
     }
+    variables = [*RECIPIENT_VARIABLES, *auto_login_bindings]
+    default_values = {name: bindings.get(name, "") for name in variables}
 
-    html_template = loader.get_template(f"mail_templates/{code}.html")
+    html_template = get_mail_template(code, "html")
     try:
-        text_template = loader.get_template(f"mail_templates/{code}.txt")
+        text_template = get_mail_template(code, "txt")
     except TemplateDoesNotExist:
         text_template = None
 
-    with connection:
-        for recipient in recipients:
-            # recipient can be either a Person or an email address
-            if link_bindings and isinstance(recipient, Person):
+    skeleton = MosaicoSkeleton(html_template, text_template, bindings, variables)
+    needs_token = skeleton.uses("MERGE_LOGIN_QUERY") or any(
+        skeleton.uses(key) for key in auto_login_bindings
+    )
+
+    if any(isinstance(recipient, Person) for recipient in recipients):
+        if code not in settings.EMAIL_TEMPLATES:
+            raise ImproperlyConfigured("Mail '%s' cannot be found")
+
+        # la partie du lien vers la version web commune à tous les destinataires
+        browser_link = "{}?{}".format(
+            settings.EMAIL_TEMPLATES[code],
+            query_string(
+                {
+                    **{
+                        k: v
+                        for k, v in bindings.items()
+                        if k not in auto_login_bindings
+                    },
+                    "LINK_BROWSER": "#",
+                }
+            ),
+        )
+
+    for recipient in recipients:
+        # recipient can be either a Person or an email address
+        values = dict(default_values)
+
+        if isinstance(recipient, Person):
+            if needs_token:
                 connection_params = generate_token_params(recipient)
-                for key, value in link_bindings.items():
-                    if isinstance(value, AutoLoginUrl):
-                        bindings[key] = add_params_to_urls(value, connection_params)
-
-            if isinstance(recipient, Person):
-                context = get_context_from_bindings(code, recipient, bindings)
-            else:
-                context = dict(bindings)
-
-            html_message = html_template.render(context=context)
-            text_message = (
-                text_template.render(
-                    context={k: conditional_html_to_text(v) for k, v in context.items()}
-                )
-                if text_template
-                else generate_plain_text(html_message)
+                values["MERGE_LOGIN_QUERY"] = urlencode(connection_params)
+                for key, value in auto_login_bindings.items():
+                    values[key] = add_params_to_urls(value, connection_params)
+
+            values["EMAIL"] = str(recipient)
+            values["LINK_BROWSER"] = "{}&{}".format(
+                browser_link,
+                query_string(
+                    {
+                        **{k: values[k] for k in auto_login_bindings},
+                        "EMAIL": values["EMAIL"],
+                    }
+                ),
             )
 
-            email = EmailMultiAlternatives(
-                subject=subject,
-                body=text_message,
-                from_email=from_email,
-                reply_to=reply_to,
-                to=[recipient.email if isinstance(recipient, Person) else recipient],
-                connection=connection,
-            )
-            email.attach_alternative(html_message, "text/html")
-            email.attach_alternative(html_message, "text/html")
-            if attachments is not None:
-                for attachment in attachments:
-                    if isinstance(attachment, MIMEBase):
-                        email.attach(attachment)
-                    elif isinstance(attachment, dict):
-                        email.attach(**attachment)
-                    else:
-                        email.attach(*attachment)
-            email.send(fail_silently=fail_silently)
+        html_message, text_message = skeleton.render(values)
+
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=text_message,
+            from_email=from_email,
+            reply_to=reply_to,
+            to=[recipient.email if isinstance(recipient, Person) else recipient],
+            connection=connection,
+        )
+        email.attach_alternative(html_message, "text/html")
+        email.attach_alternative(html_message, "text/html")
+        if attachments is not None:
+            for attachment in attachments:
+                if isinstance(attachment, MIMEBase):
+                    email.attach(attachment)
+                elif isinstance(attachment, dict):
+                    email.attach(**attachment)
+                else:
+                    email.attach(*attachment)
+        yield recipient, email
+
+
+# nombre de destinataires de chacune des tâches d'envoi d'une notification
+NOTIFICATION_CHUNK_SIZE = 500
+# les envois sont enregistrés assez longtemps pour couvrir les nouvelles tentatives
+NOTIFICATION_DELIVERY_TIMEOUT = 24 * 3600
+
+
+def notification_delivery_key(notification_id, person_pk):
+    return f"notification:{notification_id}:{person_pk}"
+
+
+def dispatch_notification(chunk_task, args, person_pks):
+    """Répartit l'envoi d'une notification entre plusieurs tâches Celery
+
+    Les destinataires sont découpés en tranches de `NOTIFICATION_CHUNK_SIZE`
+    personnes ; chaque tranche est envoyée par une tâche `chunk_task` distincte,
+    appelée avec les arguments `args`, l'identifiant de la notification puis la
+    liste des identifiants des personnes de la tranche.
+    """
+    person_pks = [str(pk) for pk in person_pks]
+    if not person_pks:
+        return
+
+    notification_id = uuid4().hex
+    group(
+        chunk_task.si(
+            *args, notification_id, person_pks[i : i + NOTIFICATION_CHUNK_SIZE]
+        )
+        for i in range(0, len(person_pks), NOTIFICATION_CHUNK_SIZE)
+    ).delay()
+
+
+def send_notification_chunk(notification_id, person_pks, **kwargs):
+    """Envoie une notification aux personnes d'une tranche qui ne l'ont pas reçue
+
+    Chaque envoi réussi est enregistré : si la tâche recommence après une erreur,
+    seules les personnes restantes reçoivent la notification. Les arguments
+    supplémentaires sont ceux de `send_mosaico_email`.
+
+    :raises smtplib.SMTPException: les erreurs d'envoi, pour que la tâche puisse
+        recommencer
+    """
+    keys = {pk: notification_delivery_key(notification_id, pk) for pk in person_pks}
+    delivered = cache.get_many(keys.values())
+    recipients = Person.objects.filter(
+        pk__in=[pk for pk, key in keys.items() if key not in delivered]
+    )
+
+    connection = get_connection()
+    with connection:
+        for recipient, email in generate_mosaico_emails(
+            recipients=recipients, connection=connection, **kwargs
+        ):
+            email.send()
+            cache.set(keys[str(recipient.pk)], True, NOTIFICATION_DELIVERY_TIMEOUT)
 
 
 def send_mail(
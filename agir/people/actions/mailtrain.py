@@ -0,0 +1,216 @@
+from datetime import timedelta
+from uuid import UUID
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+
+from agir.api.redis import get_auth_redis_client
+from agir.events.models import RSVP
+from agir.groups.models import Membership
+from agir.lib.mailtrain import update_people, MAX_WORKERS
+from agir.people import metrics
+from agir.people.models import Person
+
+# état de la synchronisation, conservé dans le Redis d'authentification : le cache
+# peut évincer ses clés, ce qui entraînerait une synchronisation complète
+WATERMARK_KEY = "mailtrain:sync:watermark"
+REFRESH_DATE_KEY = "mailtrain:sync:refresh_date"
+SYNC_BATCH_SIZE = 1000
+
+# les transactions encore ouvertes au début d'une synchronisation peuvent écrire
+# des dates de modification antérieures : elles sont reprises à la suivante
+WATERMARK_MARGIN = timedelta(minutes=5)
+
+# les liens de connexion envoyés à Mailtrain expirent après
+# CONNECTION_LINK_VALIDITY jours : chaque personne est renvoyée avant
+REFRESH_PERIOD = settings.CONNECTION_LINK_VALIDITY - 1
+
+PENDING_UPDATES_KEY = "mailtrain:pending"
+FLUSH_SCHEDULED_KEY = "mailtrain:flush_scheduled"
+
+
+def get_watermark():
+    value = get_auth_redis_client().get(WATERMARK_KEY)
+    return value and parse_datetime(value.decode())
+
+
+def set_watermark(value):
+    get_auth_redis_client().set(WATERMARK_KEY, value.isoformat())
+
+
+def get_refresh_date():
+    value = get_auth_redis_client().get(REFRESH_DATE_KEY)
+    return value and parse_date(value.decode())
+
+
+def refresh_slice(day):
+    """Renvoie le filtre de la tranche de personnes à renvoyer un jour donné
+
+    Les identifiants sont répartis en `REFRESH_PERIOD` intervalles d'UUID, parcourus
+    un par jour.
+    """
+    index = day.toordinal() % REFRESH_PERIOD
+    q = Q(id__gte=UUID(int=(index << 128) // REFRESH_PERIOD))
+    if index + 1 < REFRESH_PERIOD:
+        q &= Q(id__lt=UUID(int=((index + 1) << 128) // REFRESH_PERIOD))
+    return q
+
+
+def refresh_people(today):
+    """Renvoie le filtre des personnes dont les liens de connexion doivent être renouvelés
+
+    Ce sont les tranches de tous les jours écoulés depuis le dernier renouvellement,
+    pour que les jours sans synchronisation ne laissent expirer aucun lien.
+    """
+    last_refresh = get_refresh_date()
+    if last_refresh is None:
+        days = 1
+    else:
+        days = min((today - last_refresh).days, REFRESH_PERIOD)
+
+    q = Q(pk__in=[])
+    for i in range(days):
+        q |= refresh_slice(today - timedelta(days=i))
+    return q
+
+
+def changed_people(since, until, refresh=Q(pk__in=[])):
+    """Renvoie les personnes dont les champs Mailtrain ont pu changer depuis `since`
+
+    Sont retenues les personnes modifiées, celles dont une adhésion ou une
+    participation a été modifiée, celles membres d'un groupe modifié, et celles
+    inscrites à un événement modifié ou qui s'est terminé depuis. Les
+    modifications sans date (tags, adresses email, suppressions) mettent à jour la
+    date de modification de la personne, voir `agir.people.signals`.
+
+    :param refresh: filtre des personnes à renvoyer même sans changement
+    """
+    memberships = Membership.objects.filter(
+        Q(modified__gt=since) | Q(supportgroup__modified__gt=since)
+    )
+    rsvps = RSVP.objects.filter(
+        Q(modified__gt=since)
+        | Q(event__modified__gt=since)
+        | Q(event__end_time__gt=since, event__end_time__lte=until)
+    )
+
+    return Person.objects.filter(
+        Q(modified__gt=since)
+        | Q(pk__in=memberships.values("person_id"))
+        | Q(pk__in=rsvps.values("person_id"))
+        | refresh
+    )
+
+
+def sync_people(queryset, batch_size=SYNC_BATCH_SIZE, max_workers=MAX_WORKERS):
+    """Envoie à Mailtrain les personnes du queryset, par lots
+
+    :return: un générateur du nombre total de personnes envoyées, après chaque lot
+    """
+    queryset = queryset.order_by("id")
+    last_id = None
+    total = 0
+
+    while True:
+        batch = list(
+            (queryset if last_id is None else queryset.filter(id__gt=last_id))[
+                :batch_size
+            ]
+        )
+        if not batch:
+            return
+
+        total += update_people(batch, max_workers=max_workers)
+        metrics.mailtrain_people_pushed.inc(len(batch))
+        last_id = batch[-1].id
+
+        yield total
+
+
+def incremental_sync(full=False, **kwargs):
+    """Envoie à Mailtrain les personnes modifiées depuis la dernière synchronisation
+
+    La date de la dernière synchronisation n'est mise à jour qu'une fois toutes
+    les personnes envoyées : une synchronisation interrompue est reprise en
+    entier. Sans date connue, ou si `full` est vrai, toutes les personnes sont
+    envoyées. Une tranche de personnes est aussi renvoyée chaque jour, voir
+    `refresh_people`.
+
+    :return: un générateur du nombre total de personnes envoyées, après chaque lot
+    """
+    until = timezone.now()
+    since = None if full else get_watermark()
+
+    today = timezone.localdate(until)
+
+    if since is None:
+        queryset = Person.objects.all()
+    else:
+        queryset = changed_people(since, until, refresh_people(today))
+    yield from sync_people(queryset, **kwargs)
+
+    get_auth_redis_client().mset(
+        {
+            WATERMARK_KEY: (until - WATERMARK_MARGIN).isoformat(),
+            REFRESH_DATE_KEY: today.isoformat(),
+        }
+    )
+
+
+def schedule_person_update(person_pk):
+    """Demande la mise à jour d'une personne sur Mailtrain
+
+    La personne est ajoutée à l'ensemble des personnes à mettre à jour, qui est
+    vidé par la tâche `flush_mailtrain_updates` après `settings.MAILTRAIN_UPDATE_DELAY`
+    secondes : toutes les demandes reçues pour une même personne pendant ce délai
+    ne donnent lieu qu'à une seule mise à jour.
+    """
+    from agir.people.tasks import flush_mailtrain_updates
+
+    delay = settings.MAILTRAIN_UPDATE_DELAY
+
+    p = get_auth_redis_client().pipeline(transaction=False)
+    p.sadd(PENDING_UPDATES_KEY, str(person_pk))
+    # si la tâche est perdue, la clé expire et une nouvelle tâche sera programmée
+    p.set(FLUSH_SCHEDULED_KEY, 1, nx=True, ex=delay * 10)
+    p.scard(PENDING_UPDATES_KEY)
+    added, flush_needed, pending = p.execute()
+
+    metrics.mailtrain_updates_requested.inc()
+    if not added:
+        metrics.mailtrain_updates_coalesced.inc()
+    metrics.mailtrain_pending_updates.set(pending)
+
+    if flush_needed:
+        flush_mailtrain_updates.apply_async(countdown=delay)
+
+
+def start_flush():
+    """Indique que les mises à jour en attente sont en cours d'envoi
+
+    Les demandes reçues à partir de ce moment programment une nouvelle tâche.
+    """
+    get_auth_redis_client().delete(FLUSH_SCHEDULED_KEY)
+
+
+def pop_pending_updates(count=SYNC_BATCH_SIZE):
+    """Retire de l'ensemble des mises à jour en attente jusqu'à `count` personnes
+
+    :return: la liste des identifiants des personnes retirées
+    """
+    p = get_auth_redis_client().pipeline(transaction=False)
+    p.spop(PENDING_UPDATES_KEY, count)
+    p.scard(PENDING_UPDATES_KEY)
+    person_pks, pending = p.execute()
+
+    metrics.mailtrain_pending_updates.set(pending)
+    return [pk.decode() for pk in person_pks]
+
+
+def requeue_updates(person_pks):
+    """Remet dans l'ensemble des mises à jour en attente des personnes non envoyées
+    """
+    if person_pks:
+        get_auth_redis_client().sadd(PENDING_UPDATES_KEY, *person_pks)
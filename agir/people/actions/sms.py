@@ -0,0 +1,280 @@
+from django.contrib.gis.measure import Distance
+from django.db import connection
+from django.db.models import F, FloatField, Func
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from phonenumber_field.phonenumber import PhoneNumber
+from phonenumbers import number_type, PhoneNumberType
+
+from agir.api.redis import get_auth_redis_client
+from agir.lib import data
+from agir.lib.sms import to_phone_number, sms_template_variables, render_sms
+from agir.people.models import Person, SMSBatch
+
+CAMPAIGN_CHUNKS_KEY = "sms_campaign:{pk}:pending_chunks"
+CAMPAIGN_CHUNKS_TIMEOUT = 7 * 24 * 3600
+
+
+class KNNDistance(Func):
+    """Distance entre deux géographies calculée par l'opérateur `<->` de PostGIS
+
+    L'opérateur peut être évalué à l'aide d'un index GiST lorsqu'il est utilisé
+    dans un `ORDER BY` entre une colonne indexée et une constante.
+    """
+
+    arg_joiner = " <-> "
+    template = "%(expressions)s"
+    output_field = FloatField()
+
+
+NEAREST_SQL = """
+WITH candidates AS ({items})
+SELECT contact_phone, distance, (SELECT count(*) FROM candidates)
+FROM (
+    SELECT DISTINCT ON (contact_phone) contact_phone, distance
+    FROM candidates
+    ORDER BY contact_phone, distance
+) AS numbers
+ORDER BY distance
+"""
+
+
+class SMSJournal:
+    """Journal d'un envoi de SMS en masse, enregistré dans la base de données
+
+    Les numéros des lots envoyés ou dont l'envoi a commencé sans que le résultat
+    ne soit connu sont considérés comme déjà traités : en cas d'interruption, ces
+    derniers ne sont pas renvoyés, pour ne pas risquer d'envoyer deux fois le même
+    message. Les lots en échec sont renvoyés à la reprise.
+    """
+
+    def __init__(self, campaign):
+        self.campaign = campaign
+
+    @property
+    def batches(self):
+        return SMSBatch.objects.filter(campaign=self.campaign)
+
+    def _numbers(self, *statuses):
+        return {
+            number
+            for numbers in self.batches.filter(status__in=statuses).values_list(
+                "numbers", flat=True
+            )
+            for number in numbers
+        }
+
+    def handled_numbers(self):
+        return self._numbers(SMSBatch.STATUS_SENT, SMSBatch.STATUS_PENDING)
+
+    def uncertain_numbers(self):
+        return self._numbers(SMSBatch.STATUS_PENDING)
+
+    def start_batch(self, numbers):
+        return SMSBatch.objects.create(campaign=self.campaign, numbers=numbers).pk
+
+    def finish_batch(self, batch_id, sent, invalid):
+        SMSBatch.objects.filter(pk=batch_id).update(
+            status=SMSBatch.STATUS_SENT,
+            sent=sent,
+            invalid=invalid,
+            modified=timezone.now(),
+        )
+
+    def fail_batch(self, batch_id):
+        SMSBatch.objects.filter(pk=batch_id).update(
+            status=SMSBatch.STATUS_FAILED, modified=timezone.now()
+        )
+
+    def results(self):
+        """Renvoie les ensembles des numéros auxquels le message a été envoyé et des
+        numéros invalides, pour l'ensemble de l'envoi
+        """
+        sent = set()
+        invalid = set()
+
+        for batch_sent, batch_invalid in self.batches.filter(
+            status=SMSBatch.STATUS_SENT
+        ).values_list("sent", "invalid"):
+            sent.update(batch_sent)
+            invalid.update(batch_invalid)
+
+        return sent, invalid
+
+
+def can_receive_sms(phone_number):
+    return phone_number.is_valid() and number_type(phone_number) in [
+        PhoneNumberType.MOBILE,
+        PhoneNumberType.FIXED_LINE_OR_MOBILE,
+    ]
+
+
+def _nearest_numbers(queryset, coordinates, max_distance, limit):
+    # `<->` et ST_DWithin portent sur la colonne elle-même, pour que PostgreSQL
+    # puisse parcourir l'index spatial par distance croissante jusqu'à `limit`
+    distance = KNNDistance(
+        F("coordinates"), RawSQL("%s::geography", [coordinates.ewkt])
+    )
+
+    items = queryset.exclude(coordinates=None)
+    if max_distance is not None:
+        items = items.filter(coordinates__dwithin=(coordinates, max_distance))
+    items = (
+        items.annotate(distance=distance)
+        .order_by(distance.asc())
+        .values("contact_phone", "distance")
+    )
+    if limit is not None:
+        items = items[:limit]
+
+    items_sql, items_params = items.query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(NEAREST_SQL.format(items=items_sql), items_params)
+        return cursor.fetchall()
+
+
+def nearest_sms_recipients(
+    coordinates, number=None, max_distance=None, queryset=None, predicate=None
+):
+    """Renvoie les numéros de téléphone des personnes les plus proches d'un point
+
+    Les personnes sont parcourues par ordre de distance (opérateur `<->`), et les
+    numéros en double sont éliminés par PostgreSQL.
+    Si certains numéros sont écartés par `predicate`, la recherche est
+    recommencée sur un plus grand nombre de personnes.
+
+    :param coordinates: le point autour duquel chercher
+    :param number: le nombre maximum de numéros à renvoyer
+    :param max_distance: la distance maximale, une instance de `Distance`
+    :param queryset: les personnes parmi lesquelles chercher, par défaut celles
+        inscrites aux SMS
+    :param predicate: une fonction indiquant si un numéro doit être retenu, par
+        défaut `can_receive_sms`
+    :return: une liste de tuples (numéro, distance), par distance croissante
+    """
+    if queryset is None:
+        queryset = Person.objects.filter(subscribed_sms=True).exclude(contact_phone="")
+    if predicate is None:
+        predicate = can_receive_sms
+
+    limit = 2 * number if number is not None else None
+
+    while True:
+        rows = _nearest_numbers(queryset, coordinates, max_distance, limit)
+
+        results = []
+        for phone, distance, candidates_count in rows:
+            phone = PhoneNumber.from_string(phone)
+            if predicate(phone):
+                results.append((phone, Distance(m=distance)))
+
+        exhausted = limit is None or not rows or rows[0][2] < limit
+        if number is None or len(results) >= number or exhausted:
+            return results[:number]
+
+        limit *= 4
+
+
+def campaign_recipients(campaign):
+    """Renvoie les numéros de téléphone des destinataires d'une campagne SMS
+
+    Les critères de la campagne (département, région, tag) se cumulent. Si la
+    campagne est liée à un événement, les numéros sont ceux des personnes les plus
+    proches de l'événement, par distance croissante.
+
+    :param campaign: une instance de `SMSCampaign`
+    :return: une liste d'instances de `PhoneNumber`, sans doublons
+    """
+    queryset = Person.objects.filter(subscribed_sms=True).exclude(contact_phone="")
+
+    if campaign.departement:
+        queryset = queryset.filter(data.filtre_departement(campaign.departement))
+    if campaign.region:
+        queryset = queryset.filter(data.filtre_region(campaign.region))
+    if campaign.tag_id is not None:
+        queryset = queryset.filter(tags=campaign.tag_id)
+
+    if campaign.event is not None:
+        return [
+            phone
+            for phone, distance in nearest_sms_recipients(
+                campaign.event.coordinates,
+                number=campaign.max_recipients,
+                max_distance=Distance(km=campaign.max_distance)
+                if campaign.max_distance is not None
+                else None,
+                queryset=queryset,
+            )
+        ]
+
+    numbers = (
+        to_phone_number(n)
+        for n in queryset.order_by("contact_phone")
+        .values_list("contact_phone", flat=True)
+        .distinct()
+    )
+    return [n for n in numbers if can_receive_sms(n)][: campaign.max_recipients]
+
+
+def event_sms_bindings(event):
+    return {
+        "EVENT_NAME": event.name,
+        "EVENT_DATE": event.get_simple_display_date(),
+        "EVENT_LOCATION": event.short_location(),
+    }
+
+
+def campaign_messages(campaign, numbers):
+    """Renvoie le texte personnalisé de la campagne pour chacun des numéros
+
+    Les informations des personnes ne sont récupérées que si le modèle du message
+    les utilise, en une seule requête pour l'ensemble des numéros. Quand plusieurs
+    personnes partagent un même numéro, la plus ancienne est retenue.
+
+    :param campaign: une instance de `SMSCampaign`
+    :param numbers: une liste de numéros au format E.164
+    :return: une liste de couples (numéro, texte)
+    """
+    variables = sms_template_variables(campaign.message)
+    if not variables:
+        return [(number, campaign.message) for number in numbers]
+
+    bindings = {}
+    if campaign.event is not None and variables & campaign.EVENT_VARIABLES:
+        bindings = event_sms_bindings(campaign.event)
+
+    fields = {
+        v: campaign.PERSON_VARIABLES[v]
+        for v in variables
+        if v in campaign.PERSON_VARIABLES
+    }
+    people = {}
+    if fields:
+        for phone, *values in (
+            Person.objects.filter(contact_phone__in=numbers)
+            .order_by("-created")
+            .values_list("contact_phone", *fields.values())
+        ):
+            people[to_phone_number(phone).as_e164] = dict(zip(fields, values))
+
+    return [
+        (number, render_sms(campaign.message, {**bindings, **people.get(number, {})}))
+        for number in numbers
+    ]
+
+
+def start_campaign_chunks(campaign, count):
+    """Enregistre le nombre de tranches d'une campagne dont l'envoi est programmé
+    """
+    get_auth_redis_client().set(
+        CAMPAIGN_CHUNKS_KEY.format(pk=campaign.pk), count, ex=CAMPAIGN_CHUNKS_TIMEOUT
+    )
+
+
+def finish_campaign_chunk(campaign):
+    """Indique qu'une tranche d'une campagne a été traitée
+
+    :return: vrai si c'était la dernière tranche à traiter
+    """
+    return get_auth_redis_client().decr(CAMPAIGN_CHUNKS_KEY.format(pk=campaign.pk)) <= 0
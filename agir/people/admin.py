@@ -29,7 +29,15 @@ from agir.people.person_forms.display import (
     get_formatted_submissions,
     get_formatted_submission,
 )
-from .models import Person, PersonTag, PersonEmail, PersonForm, PersonFormSubmission
+from .models import (
+    Person,
+    PersonTag,
+    PersonEmail,
+    PersonForm,
+    PersonFormSubmission,
+    SMSCampaign,
+)
+from .tasks import send_sms_campaign
 from agir.authentication.models import Role
 from agir.events.models import RSVP
 from agir.groups.models import Membership
@@ -195,9 +203,6 @@ class PersonAdmin(DisplayContactPhoneMixin, CenterOnFranceMixin, OSMGeoAdmin):
 
         return queryset, use_distinct
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related("emails")
-
     def role_link(self, obj):
         return format_html(
             '<a href="{link}">{text}</a>',
@@ -292,6 +297,88 @@ class PersonTagAdmin(admin.ModelAdmin):
     set_as_not_exported.short_description = _("Ne plus exporter")
 
 
+@admin.register(SMSCampaign, site=admin_site)
+class SMSCampaignAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "created", "progress")
+    list_filter = ("status",)
+    search_fields = ("name",)
+    autocomplete_fields = ("event", "tag")
+
+    fieldsets = (
+        (None, {"fields": ("name", "message", "at")}),
+        (
+            _("Destinataires"),
+            {
+                "fields": (
+                    "event",
+                    "max_distance",
+                    "max_recipients",
+                    "departement",
+                    "region",
+                    "tag",
+                )
+            },
+        ),
+        (
+            _("Envoi"),
+            {
+                "fields": (
+                    "status",
+                    "encoding",
+                    "message_count",
+                    "recipients_count",
+                    "sent_count",
+                    "invalid_count",
+                    "progress",
+                )
+            },
+        ),
+    )
+    readonly_fields = (
+        "status",
+        "encoding",
+        "message_count",
+        "recipients_count",
+        "sent_count",
+        "invalid_count",
+        "progress",
+    )
+
+    actions = ("send_campaigns",)
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None and obj.status != SMSCampaign.STATUS_DRAFT:
+            return [f.name for f in SMSCampaign._meta.fields] + ["progress"]
+        return self.readonly_fields
+
+    def progress(self, obj):
+        if not obj.recipients_count:
+            return "-"
+        handled = obj.sent_count + obj.invalid_count
+        return f"{handled}/{obj.recipients_count} ({handled * 100 // obj.recipients_count} %)"
+
+    progress.short_description = _("Progression")
+
+    def send_campaigns(self, request, queryset):
+        campaigns = list(
+            queryset.filter(
+                status__in=[SMSCampaign.STATUS_DRAFT, SMSCampaign.STATUS_ERROR]
+            )
+        )
+        SMSCampaign.objects.filter(pk__in=[c.pk for c in campaigns]).update(
+            status=SMSCampaign.STATUS_SENDING
+        )
+
+        for campaign in campaigns:
+            send_sms_campaign.delay(campaign.pk)
+
+        self.message_user(
+            request, _("%d campagne(s) en cours d'envoi.") % len(campaigns)
+        )
+
+    send_campaigns.short_description = _("Envoyer ces campagnes")
+
+
 class PersonFormForm(forms.ModelForm):
     class Meta:
         fields = "__all__"
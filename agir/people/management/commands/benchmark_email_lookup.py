@@ -0,0 +1,70 @@
+import random
+from time import perf_counter
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from agir.people.models import PersonEmail
+
+TABLE = "benchmark_personemail"
+
+LOOKUPS = [
+    ("address = %s, sans index", "address = %s"),
+    ("UPPER(address) = UPPER(%s), sans index", "UPPER(address::text) = UPPER(%s)"),
+    ("UPPER(address) = UPPER(%s), avec index", "UPPER(address::text) = UPPER(%s)"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare les temps de recherche d'une adresse email, avec et sans l'index "
+        "sur UPPER(address), sur une copie temporaire de la table des emails"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--number", type=int, default=3_000_000)
+        parser.add_argument("-q", "--queries", type=int, default=50)
+
+    def handle(self, *args, number, queries, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {TABLE} (LIKE people_personemail) ON COMMIT DROP"
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {TABLE} (id, address, bounced, person_id, _order)
+                SELECT i, 'Prenom.Nom' || i || '@example.com', false, md5(i::text)::uuid, 0
+                FROM generate_series(1, %s) i
+                """,
+                [number],
+            )
+            cursor.execute(f"ANALYZE {TABLE}")
+
+            samples = [
+                f"prenom.nom{random.randint(1, number)}@EXAMPLE.com"
+                for _ in range(queries)
+            ]
+
+            for label, condition in LOOKUPS:
+                if label.endswith("avec index"):
+                    cursor.execute(f"CREATE INDEX ON {TABLE} (UPPER(address))")
+                    cursor.execute(f"ANALYZE {TABLE}")
+
+                start = perf_counter()
+                for sample in samples:
+                    cursor.execute(
+                        f"SELECT id FROM {TABLE} WHERE {condition}", [sample]
+                    )
+                    cursor.fetchall()
+                duration = perf_counter() - start
+
+                self.stdout.write(
+                    f"{label} : {duration / queries * 1000:.2f} ms par recherche"
+                )
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            "\nPlan de PersonEmail.objects.with_address sur la table réelle :"
+        )
+        self.stdout.write(PersonEmail.objects.with_address(samples[0]).explain())
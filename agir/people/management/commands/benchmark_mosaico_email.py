@@ -0,0 +1,36 @@
+from time import perf_counter
+
+from django.core.management import BaseCommand, CommandError
+
+from agir.lib.utils import front_url
+from agir.people.actions.mailing import send_mosaico_email
+from agir.people.models import Person
+
+
+class Command(BaseCommand):
+    help = "Mesure le nombre d'emails Mosaico générés par seconde, sans les envoyer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("code", nargs="?", default="EVENT_CHANGED")
+        parser.add_argument("-n", "--number", type=int, default=1000)
+
+    def handle(self, *args, code, number, **options):
+        recipients = list(Person.objects.exclude(emails=None)[:number])
+        if not recipients:
+            raise CommandError("Aucune personne avec une adresse email.")
+
+        start = perf_counter()
+        send_mosaico_email(
+            code=code,
+            subject="Test",
+            from_email="benchmark@example.com",
+            recipients=recipients,
+            bindings={"PROFILE_LINK": front_url("personal_information")},
+            backend="django.core.mail.backends.locmem.EmailBackend",
+        )
+        duration = perf_counter() - start
+
+        self.stdout.write(
+            f"{len(recipients)} messages en {duration:.2f} secondes "
+            f"({len(recipients) / duration:.0f} messages par seconde)."
+        )
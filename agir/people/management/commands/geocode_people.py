@@ -0,0 +1,81 @@
+from datetime import datetime
+
+from django.core.management import BaseCommand
+
+from agir.lib.geo import BAN_CSV_ENDPOINT
+from agir.lib.tasks import (
+    BULK_GEOCODING_BATCH_SIZE,
+    FOREIGN_GEOCODING_BATCH_SIZE,
+    bulk_geocode_people,
+    geocode_foreign_people,
+    geocode_people_batch,
+    get_bulk_geocoding_checkpoint,
+    people_to_geocode,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Géolocalise par lots les personnes sans coordonnées, avec l'API CSV de la BAN"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BULK_GEOCODING_BATCH_SIZE)
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Reprendre après la dernière personne traitée",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Effectuer le traitement dans une tâche Celery",
+        )
+        parser.add_argument("--endpoint", default=BAN_CSV_ENDPOINT)
+        parser.add_argument(
+            "--foreign",
+            action="store_true",
+            help="Géolocaliser les personnes étrangères avec Nominatim, dans des tâches Celery",
+        )
+
+    def handle(
+        self, *args, batch_size, resume, background, endpoint, foreign, **kwargs
+    ):
+        if foreign:
+            self.dispatch_foreign_people()
+            return
+
+        after = get_bulk_geocoding_checkpoint() if resume else None
+
+        if background:
+            bulk_geocode_people.delay(after, batch_size, endpoint)
+            return
+
+        start = datetime.now()
+        remaining = people_to_geocode().count()
+        i = 0
+
+        while True:
+            after = geocode_people_batch(after, batch_size, endpoint)
+            if after is None:
+                break
+
+            i += 1
+            if kwargs["verbosity"] > 1:
+                self.stdout.write(
+                    f"Lot {i} traité ({remaining} personnes à traiter au départ)"
+                )
+
+        duration = datetime.now() - start
+        self.stdout.write(f"{i} lots traités en {duration.seconds} secondes.")
+
+    def dispatch_foreign_people(self):
+        pks = [
+            str(pk)
+            for pk in people_to_geocode(foreign=True).values_list("pk", flat=True)
+        ]
+
+        for i in range(0, len(pks), FOREIGN_GEOCODING_BATCH_SIZE):
+            geocode_foreign_people.delay(pks[i : i + FOREIGN_GEOCODING_BATCH_SIZE])
+
+        self.stdout.write(f"{len(pks)} personnes étrangères à géolocaliser.")
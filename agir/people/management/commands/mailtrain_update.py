@@ -1,39 +1,50 @@
 from datetime import datetime
-import string
-from uuid import UUID
 
 from django.core.management import BaseCommand
-from django.utils import timezone
 
-from agir.lib.mailtrain import update_person
-from agir.people.models import Person
-
-PADDING = "0000000-0000-0000-0000-000000000000"
+from agir.lib.mailtrain import MAX_WORKERS
+from agir.people.actions.mailtrain import (
+    incremental_sync,
+    get_watermark,
+    SYNC_BATCH_SIZE,
+)
 
 
 class Command(BaseCommand):
-    help = "Synchronize all the database with mailtrain"
+    help = (
+        "Synchronize with mailtrain the people changed since the last synchronization"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Synchronize all the database, e.g. to recover from a failed synchronization",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=MAX_WORKERS, help="Concurrent requests"
+        )
+        parser.add_argument("--batch-size", type=int, default=SYNC_BATCH_SIZE)
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, full, workers, batch_size, verbosity, **kwargs):
+        watermark = get_watermark()
         start = datetime.now()
         i = 0
 
-        min_letter = string.hexdigits[timezone.now().day % 8 * 2]
-        max_letter = string.hexdigits[(timezone.now().day + 1) % 8 * 2]
-
-        qs = Person.objects.filter(id__gte=UUID(min_letter + PADDING))
-        if max_letter > min_letter:
-            qs = qs.filter(id__lt=UUID(max_letter + PADDING))
-
-        for person in qs.iterator():
-            update_person(person)
-            if kwargs["verbosity"] > 1:
-                print("Updated %s " % person.email)
+        if full or watermark is None:
+            print("Full synchronization")
+        else:
+            print(f"Synchronizing people changed since {watermark.isoformat()}")
 
-            i += 1
+        for i in incremental_sync(
+            full=full, batch_size=batch_size, max_workers=workers
+        ):
+            if verbosity > 1:
+                print("Updated %d people" % i)
 
-        duration = datetime.now() - start
+        duration = (datetime.now() - start).total_seconds()
+        rate = i / duration if duration else 0
 
         print(
-            f"Updated people from {min_letter} to {max_letter} ({str(i)}) in {str(duration.seconds)} seconds."
+            f"Updated {i} people in {duration:.0f} seconds ({rate:.1f} people/second)."
         )
@@ -1,20 +1,18 @@
 import secrets
 from argparse import FileType
-from pathlib import Path
 
 import re
-from django.contrib.gis.db.models.functions import Distance as DistanceFunction
 from django.contrib.gis.geos import Point
 from django.contrib.gis.measure import Distance as DistanceMeasure
 from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from phonenumber_field.phonenumber import PhoneNumber
-from phonenumbers import number_type, PhoneNumberType
 from tqdm import tqdm
 
 from agir.events.models import Event
 from agir.lib import data
 from agir.lib.sms import compute_sms_length_information, send_bulk_sms, SMSSendException
+from agir.people.actions.sms import SMSJournal, nearest_sms_recipients, can_receive_sms
 from agir.people.models import Person
 
 
@@ -39,18 +37,6 @@ def coordinates_argument(coords):
     return Point(float(lon), float(lat), srid=4326)
 
 
-def drop_duplicate_numbers(it, n=None):
-    s = set()
-
-    for number, distance in it:
-        if number not in s:
-            s.add(number)
-            yield number, distance
-
-        if n and len(s) >= n:
-            return
-
-
 def departement_argument(dep):
     return data.filtre_departement(dep)
 
@@ -89,16 +75,12 @@ class Command(BaseCommand):
         parser.add_argument("-R", "--region", type=region_argument)
         parser.add_argument("-a", "--at", type=datetime_argument)
         parser.add_argument("-s", "--sentfile", type=FileType(mode="r"))
-
-    def can_send(self, phone):
-        return phone.is_valid() and number_type(phone) in [
-            PhoneNumberType.MOBILE,
-            PhoneNumberType.FIXED_LINE_OR_MOBILE,
-        ]
-
-    def write_numbers(self, path, numbers):
-        with open(path, "w") as f:
-            f.write("\n".join(numbers))
+        parser.add_argument(
+            "-r",
+            "--resume",
+            metavar="CAMPAGNE",
+            help="Reprendre un envoi interrompu à partir de son journal",
+        )
 
     def read_numbers(self, file):
         return set(PhoneNumber.from_string(n) for n in file.read().split("\n"))
@@ -113,6 +95,7 @@ class Command(BaseCommand):
         region,
         sentfile,
         at,
+        resume,
         **options,
     ):
         if (
@@ -149,27 +132,9 @@ class Command(BaseCommand):
             self.stdout.write("\n")  # ligne vide
 
         if coordinates:
-            ps = (
-                Person.objects.filter(subscribed_sms=True)
-                .exclude(contact_phone="")
-                .annotate(distance=DistanceFunction("coordinates", coordinates))
-                .order_by("distance")
-            )
-
-            if distance is not None:
-                ps = ps.filter(distance__lte=distance)
-
-            res = list(
-                drop_duplicate_numbers(
-                    (
-                        (p.contact_phone, p.distance)
-                        for p in ps.iterator()
-                        if self.can_send(p.contact_phone)
-                    ),
-                    number,
-                )
+            res = nearest_sms_recipients(
+                coordinates, number=number, max_distance=distance
             )
-
             numbers = [n for n, _ in res]
             max_distance = res[-1][1]
             self.stdout.write(f"Distance maximale : {max_distance}")
@@ -179,7 +144,9 @@ class Command(BaseCommand):
                 region or departement, subscribed_sms=True
             ).exclude(contact_phone="")
             numbers = set(
-                p.contact_phone for p in ps.iterator() if self.can_send(p.contact_phone)
+                p.contact_phone
+                for p in ps.iterator()
+                if can_receive_sms(p.contact_phone)
             )
 
         self.stdout.write(f"Nombre de numéros : {len(numbers)}")
@@ -191,6 +158,15 @@ class Command(BaseCommand):
                 f"{len(numbers)} après prise en compte des numéros déjà envoyés."
             )
 
+        journal = SMSJournal(resume or secrets.token_urlsafe(4))
+        if resume:
+            handled = journal.handled_numbers()
+            uncertain = journal.uncertain_numbers()
+            self.stdout.write(
+                f"{len(handled)} numéros déjà traités lors de l'envoi {resume}, dont "
+                f"{len(uncertain)} pour lesquels l'envoi a été interrompu : ils ne seront pas renvoyés."
+            )
+
         self.stdout.write("\n")  # empty line
 
         self.stdout.write("Entrez votre message (deux lignes vides pour terminer)")
@@ -223,33 +199,22 @@ class Command(BaseCommand):
         if answer == "ANNULER":
             return
 
-        token = secrets.token_urlsafe(4)
-        sent_filename = Path(f"sent.{token}")
-        invalid_filename = Path(f"invalid.{token}")
-
+        failed = False
         try:
-            sent, invalid = send_bulk_sms(message, tqdm(numbers), at=at)
-        except SMSSendException as e:
-            self.stderr.write("Erreur lors de l'envoi des SMS.")
-            self.stderr.write(
-                f"{len(e.sent)} SMS ont déjà été envoyés ({len(e.invalid)} numéros invalides)."
-            )
-
-            try:
-                self.write_numbers(sent_filename, e.sent)
-                self.write_numbers(invalid_filename, e.invalid)
-            except OSError:
-                self.stderr.write(
-                    "Impossible d'écrire les fichiers avec les numéros testés."
-                )
-                raise
-
-            self.stderr.write(f"Fichiers {sent_filename} et {invalid_filename} écrits.")
-            return 1
+            send_bulk_sms(message, tqdm(numbers), at=at, journal=journal)
+        except SMSSendException:
+            failed = True
 
-        self.stdout.write(f"{len(sent)} SMS envoyés")
+        sent, invalid = journal.results()
+        self.stdout.write(
+            f"{len(sent)} SMS envoyés au total pour l'envoi {journal.campaign}"
+        )
 
         if invalid:
             self.stdout.write(f"{len(invalid)} numéros invalides")
-            self.write_numbers(invalid_filename, invalid)
-            self.stdout.write(f"{invalid_filename} écrit.")
+
+        if failed:
+            self.stderr.write(
+                f"Erreur lors de l'envoi de certains SMS : relancez la commande avec --resume {journal.campaign}"
+            )
+            return 1
@@ -1,4 +1,17 @@
-from prometheus_client import Counter
+from prometheus_client import Counter, Gauge
 
 
 subscriptions = Counter("agir_people_subscriptions", "New subscriptions")
+mailtrain_people_pushed = Counter(
+    "agir_mailtrain_people_pushed", "People pushed to Mailtrain by the synchronization"
+)
+mailtrain_updates_requested = Counter(
+    "agir_mailtrain_updates_requested", "Mailtrain updates requested for a person"
+)
+mailtrain_updates_coalesced = Counter(
+    "agir_mailtrain_updates_coalesced",
+    "Mailtrain updates requested for a person already pending",
+)
+mailtrain_pending_updates = Gauge(
+    "agir_mailtrain_pending_updates", "People waiting to be updated on Mailtrain"
+)
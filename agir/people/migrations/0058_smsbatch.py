@@ -0,0 +1,94 @@
+# Generated by Django 2.2 on 2019-05-29 11:02
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("people", "0057_person_location_codes")]
+
+    operations = [
+        migrations.CreateModel(
+            name="SMSBatch",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="created",
+                    ),
+                ),
+                (
+                    "modified",
+                    models.DateTimeField(auto_now=True, verbose_name="modified"),
+                ),
+                (
+                    "campaign",
+                    models.CharField(
+                        editable=False, max_length=255, verbose_name="campagne"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("P", "En cours d'envoi"),
+                            ("S", "Envoyé"),
+                            ("F", "Échec"),
+                        ],
+                        default="P",
+                        max_length=1,
+                        verbose_name="statut",
+                    ),
+                ),
+                (
+                    "numbers",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=30),
+                        size=None,
+                        verbose_name="numéros",
+                    ),
+                ),
+                (
+                    "sent",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=30),
+                        default=list,
+                        size=None,
+                        verbose_name="envoyés",
+                    ),
+                ),
+                (
+                    "invalid",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=30),
+                        default=list,
+                        size=None,
+                        verbose_name="invalides",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "lot de SMS",
+                "verbose_name_plural": "lots de SMS",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="smsbatch",
+            index=models.Index(
+                fields=["campaign", "status"], name="sms_batch_campaign_index"
+            ),
+        ),
+    ]
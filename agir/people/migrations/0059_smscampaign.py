@@ -0,0 +1,158 @@
+# Generated by Django 2.2 on 2019-06-03 14:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0076_event_location_codes"),
+        ("people", "0058_smsbatch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SMSCampaign",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="created",
+                    ),
+                ),
+                (
+                    "modified",
+                    models.DateTimeField(auto_now=True, verbose_name="modified"),
+                ),
+                ("name", models.CharField(max_length=255, verbose_name="nom")),
+                ("message", models.TextField(verbose_name="message")),
+                (
+                    "at",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="Laisser vide pour un envoi immédiat.",
+                        null=True,
+                        verbose_name="envoi différé",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("D", "Brouillon"),
+                            ("S", "En cours d'envoi"),
+                            ("E", "Envoyée"),
+                            ("X", "Erreur lors de l'envoi"),
+                        ],
+                        default="D",
+                        editable=False,
+                        max_length=1,
+                        verbose_name="statut",
+                    ),
+                ),
+                (
+                    "max_distance",
+                    models.FloatField(
+                        blank=True,
+                        null=True,
+                        verbose_name="distance maximale à l'événement (km)",
+                    ),
+                ),
+                (
+                    "max_recipients",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        null=True,
+                        verbose_name="nombre maximum de destinataires",
+                    ),
+                ),
+                (
+                    "departement",
+                    models.CharField(
+                        blank=True, max_length=3, verbose_name="code du département"
+                    ),
+                ),
+                (
+                    "region",
+                    models.CharField(
+                        blank=True,
+                        max_length=50,
+                        verbose_name="code ou nom de la région",
+                    ),
+                ),
+                (
+                    "encoding",
+                    models.CharField(
+                        editable=False, max_length=10, verbose_name="encodage"
+                    ),
+                ),
+                (
+                    "message_count",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        editable=False,
+                        verbose_name="nombre de SMS par destinataire",
+                    ),
+                ),
+                (
+                    "recipients_count",
+                    models.PositiveIntegerField(
+                        default=0,
+                        editable=False,
+                        verbose_name="nombre de destinataires",
+                    ),
+                ),
+                (
+                    "sent_count",
+                    models.PositiveIntegerField(
+                        default=0, editable=False, verbose_name="SMS envoyés"
+                    ),
+                ),
+                (
+                    "invalid_count",
+                    models.PositiveIntegerField(
+                        default=0, editable=False, verbose_name="numéros invalides"
+                    ),
+                ),
+                (
+                    "event",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="events.Event",
+                        verbose_name="autour de l'événement",
+                    ),
+                ),
+                (
+                    "tag",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="people.PersonTag",
+                        verbose_name="tag",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "campagne SMS",
+                "verbose_name_plural": "campagnes SMS",
+            },
+        )
+    ]
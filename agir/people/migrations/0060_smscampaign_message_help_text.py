@@ -0,0 +1,19 @@
+# Generated by Django 2.2 on 2019-06-05 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("people", "0059_smscampaign")]
+
+    operations = [
+        migrations.AlterField(
+            model_name="smscampaign",
+            name="message",
+            field=models.TextField(
+                help_text="Le message peut être personnalisé avec les variables {{ FIRST_NAME }}, {{ LAST_NAME }}, et, si un événement est indiqué, {{ EVENT_NAME }}, {{ EVENT_DATE }} et {{ EVENT_LOCATION }}.",
+                verbose_name="message",
+            ),
+        )
+    ]
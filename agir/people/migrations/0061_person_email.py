@@ -0,0 +1,39 @@
+# Generated by Django 2.2 on 2019-06-12 15:27
+
+from django.db import migrations, models
+
+
+COPY_PRIMARY_EMAIL_SQL = """
+UPDATE people_person p
+SET email = e.address
+FROM (
+  SELECT DISTINCT ON (person_id) person_id, address
+  FROM people_personemail
+  ORDER BY person_id, _order
+) e
+WHERE e.person_id = p.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("people", "0060_smscampaign_message_help_text")]
+
+    operations = [
+        migrations.AddField(
+            model_name="person",
+            name="_email",
+            field=models.EmailField(
+                blank=True,
+                db_column="email",
+                db_index=True,
+                default="",
+                editable=False,
+                max_length=254,
+                verbose_name="adresse email principale",
+            ),
+        ),
+        migrations.RunSQL(
+            sql=COPY_PRIMARY_EMAIL_SQL, reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -4,7 +4,7 @@ import phonenumbers
 import warnings
 
 from django.conf import settings
-from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.fields import JSONField, ArrayField
 from django.db import models, transaction, IntegrityError
 from django.db.models import Q
 from django.utils.http import urlencode
@@ -28,7 +28,9 @@ from agir.lib.models import (
     TimeStampedModel,
 )
 from agir.authentication.models import Role
+from agir.lib import data
 from agir.lib.search import PrefixSearchQuery
+from agir.lib.sms import compute_sms_length_information, sms_template_variables
 from agir.lib.utils import generate_token_params
 from . import metrics
 
@@ -57,7 +59,8 @@ class PersonQueryset(models.QuerySet):
 class PersonManager(models.Manager.from_queryset(PersonQueryset)):
     def get(self, *args, **kwargs):
         if "email" in kwargs:
-            kwargs["emails__address"] = kwargs["email"]
+            # même recherche que PersonEmailManager.with_address, à travers la jointure
+            kwargs["emails__address__iexact"] = kwargs["email"]
             del kwargs["email"]
         return super().get(*args, **kwargs)
 
@@ -75,11 +78,7 @@ class PersonManager(models.Manager.from_queryset(PersonQueryset)):
         return person
 
     def get_by_natural_key(self, email):
-        email_field_class = self.model.emails.rel.related_model
-        try:
-            return email_field_class.objects.get_by_natural_key(email).person
-        except email_field_class.DoesNotExist:
-            raise self.model.DoesNotExist
+        return self.get(email=email)
 
     def _create_person(
         self, email, password, *, is_staff, is_superuser, is_active=True, **extra_fields
@@ -107,9 +106,9 @@ class PersonManager(models.Manager.from_queryset(PersonQueryset)):
             person.add_email(email)
 
         if not settings.MAILTRAIN_DISABLE:
-            from .tasks import update_person_mailtrain
+            from .actions.mailtrain import schedule_person_update
 
-            transaction.on_commit(partial(update_person_mailtrain.delay, person.pk))
+            transaction.on_commit(partial(schedule_person_update, person.pk))
 
         return person
 
@@ -244,6 +243,16 @@ class Person(
 
     tags = models.ManyToManyField("PersonTag", related_name="people", blank=True)
 
+    # copie de l'adresse principale, maintenue à jour par `update_primary_email_address`
+    _email = models.EmailField(
+        _("adresse email principale"),
+        db_column="email",
+        blank=True,
+        default="",
+        editable=False,
+        db_index=True,
+    )
+
     CONTACT_PHONE_UNVERIFIED = "U"
     CONTACT_PHONE_VERIFIED = "V"
     CONTACT_PHONE_PENDING = "P"
@@ -303,9 +312,29 @@ class Person(
     def save(self, *args, **kwargs):
         if self._state.adding:
             metrics.subscriptions.inc()
+        elif kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            deferred_fields = self.get_deferred_fields()
+            if deferred_fields:
+                # même enregistrement partiel que Django pour une instance incomplète,
+                # sans l'adresse principale (voir `_do_update`)
+                kwargs["update_fields"] = [
+                    f.attname
+                    for f in self._meta.concrete_fields
+                    if not f.primary_key
+                    and f.attname not in deferred_fields
+                    and f.attname != "_email"
+                ]
 
         return super().save(*args, **kwargs)
 
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, *args):
+        # l'adresse principale n'est modifiée que par update_primary_email_address :
+        # une instance chargée avant un changement d'adresse ne doit pas l'écraser,
+        # sauf si `_email` est explicitement demandé dans `update_fields`
+        if update_fields is None:
+            values = [v for v in values if v[0].attname != "_email"]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, *args)
+
     def __str__(self):
         if self.first_name and self.last_name:
             return "{} {} <{}>".format(self.first_name, self.last_name, self.email)
@@ -317,7 +346,7 @@ class Person(
 
     @property
     def email(self):
-        return self.primary_email.address if self.primary_email else ""
+        return self._email
 
     @cached_property
     def primary_email(self):
@@ -376,7 +405,17 @@ class Person(
         order.remove(email_instance.id)
         order.insert(0, email_instance.id)
         self.set_personemail_order(order)
-        self.primary_email = email_instance
+        self.update_primary_email_address()
+
+    def update_primary_email_address(self):
+        """Recopie l'adresse principale dans le champ `_email` de la personne
+
+        Doit être appelée quand l'ordre des adresses change : les modifications et
+        suppressions d'adresses l'appellent à travers les signaux de `PersonEmail`.
+        """
+        self.__dict__.pop("primary_email", None)
+        self._email = self.primary_email.address if self.primary_email else ""
+        Person.objects.filter(pk=self.pk).update(_email=self._email)
 
     def get_subscriber_status(self):
         if self.bounced:
@@ -430,9 +469,17 @@ class PersonEmailManager(models.Manager):
             **kwargs,
         )
 
+    def with_address(self, address):
+        """Renvoie les adresses égales à `address`, sans tenir compte de la casse
+
+        `address__iexact` est traduit par `UPPER(address::text) = UPPER(%s)`, qui
+        utilise l'index unique `uppercase_email` (voir la migration 0043). Les
+        recherches exactes sur `address` ne sont pas indexées et doivent être évitées.
+        """
+        return self.filter(address__iexact=address)
+
     def get_by_natural_key(self, address):
-        # look first without lowercasing email
-        return self.get(address__iexact=address)
+        return self.with_address(address).get()
 
 
 class PersonEmail(ExportModelOperationsMixin("person_email"), models.Model):
@@ -493,7 +540,7 @@ class PersonEmail(ExportModelOperationsMixin("person_email"), models.Model):
             errors = e.message_dict
 
         if exclude is None or "address" not in exclude:
-            qs = PersonEmail.objects.filter(address__iexact=self.address)
+            qs = PersonEmail.objects.with_address(self.address)
             if not self._state.adding and self.pk:
                 qs = qs.exclude(pk=self.pk)
 
@@ -526,3 +573,189 @@ class PersonValidationSMS(
     class Meta:
         verbose_name = _("SMS de validation")
         verbose_name_plural = _("SMS de validation")
+
+
+class SMSBatch(TimeStampedModel):
+    """Journal des lots de SMS envoyés lors d'un envoi en masse
+
+    Un lot est enregistré avant son envoi, puis mis à jour dès que son résultat
+    est connu : il est ainsi possible de reprendre un envoi interrompu sans
+    envoyer deux fois le même message.
+    """
+
+    STATUS_PENDING = "P"
+    STATUS_SENT = "S"
+    STATUS_FAILED = "F"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _("En cours d'envoi")),
+        (STATUS_SENT, _("Envoyé")),
+        (STATUS_FAILED, _("Échec")),
+    )
+
+    campaign = models.CharField(_("campagne"), max_length=255, editable=False)
+    status = models.CharField(
+        _("statut"), max_length=1, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    numbers = ArrayField(models.CharField(max_length=30), verbose_name=_("numéros"))
+    sent = ArrayField(
+        models.CharField(max_length=30), default=list, verbose_name=_("envoyés")
+    )
+    invalid = ArrayField(
+        models.CharField(max_length=30), default=list, verbose_name=_("invalides")
+    )
+
+    class Meta:
+        verbose_name = _("lot de SMS")
+        verbose_name_plural = _("lots de SMS")
+        indexes = (
+            models.Index(
+                fields=["campaign", "status"], name="sms_batch_campaign_index"
+            ),
+        )
+
+
+class SMSCampaign(TimeStampedModel):
+    """Envoi d'un SMS à un ensemble de personnes, effectué par une tâche Celery
+    """
+
+    STATUS_DRAFT = "D"
+    STATUS_SENDING = "S"
+    STATUS_SENT = "E"
+    STATUS_ERROR = "X"
+    STATUS_CHOICES = (
+        (STATUS_DRAFT, _("Brouillon")),
+        (STATUS_SENDING, _("En cours d'envoi")),
+        (STATUS_SENT, _("Envoyée")),
+        (STATUS_ERROR, _("Erreur lors de l'envoi")),
+    )
+
+    # variables utilisables dans le message : champ de `Person` correspondant aux
+    # variables propres au destinataire, et variables décrivant l'événement
+    PERSON_VARIABLES = {"FIRST_NAME": "first_name", "LAST_NAME": "last_name"}
+    EVENT_VARIABLES = {"EVENT_NAME", "EVENT_DATE", "EVENT_LOCATION"}
+
+    name = models.CharField(_("nom"), max_length=255)
+    message = models.TextField(
+        _("message"),
+        help_text=_(
+            "Le message peut être personnalisé avec les variables {{ FIRST_NAME }}, "
+            "{{ LAST_NAME }}, et, si un événement est indiqué, {{ EVENT_NAME }}, "
+            "{{ EVENT_DATE }} et {{ EVENT_LOCATION }}."
+        ),
+    )
+    at = models.DateTimeField(
+        _("envoi différé"),
+        null=True,
+        blank=True,
+        help_text=_("Laisser vide pour un envoi immédiat."),
+    )
+    status = models.CharField(
+        _("statut"),
+        max_length=1,
+        choices=STATUS_CHOICES,
+        default=STATUS_DRAFT,
+        editable=False,
+    )
+
+    event = models.ForeignKey(
+        "events.Event",
+        verbose_name=_("autour de l'événement"),
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    max_distance = models.FloatField(
+        _("distance maximale à l'événement (km)"), null=True, blank=True
+    )
+    max_recipients = models.PositiveIntegerField(
+        _("nombre maximum de destinataires"), null=True, blank=True
+    )
+    departement = models.CharField(_("code du département"), max_length=3, blank=True)
+    region = models.CharField(_("code ou nom de la région"), max_length=50, blank=True)
+    tag = models.ForeignKey(
+        "PersonTag",
+        verbose_name=_("tag"),
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+
+    encoding = models.CharField(_("encodage"), max_length=10, editable=False)
+    message_count = models.PositiveSmallIntegerField(
+        _("nombre de SMS par destinataire"), default=0, editable=False
+    )
+    recipients_count = models.PositiveIntegerField(
+        _("nombre de destinataires"), default=0, editable=False
+    )
+    sent_count = models.PositiveIntegerField(
+        _("SMS envoyés"), default=0, editable=False
+    )
+    invalid_count = models.PositiveIntegerField(
+        _("numéros invalides"), default=0, editable=False
+    )
+
+    @property
+    def journal_name(self):
+        return f"campaign:{self.pk}"
+
+    def clean(self):
+        if not any([self.event, self.departement, self.region, self.tag]):
+            raise ValidationError(
+                _(
+                    "Indiquez au moins un événement, un département, une région ou un tag."
+                )
+            )
+
+        variables = sms_template_variables(self.message)
+        unknown = variables - set(self.PERSON_VARIABLES) - self.EVENT_VARIABLES
+        if unknown:
+            raise ValidationError(
+                {"message": _("Variables inconnues : %s") % ", ".join(sorted(unknown))}
+            )
+        if variables & self.EVENT_VARIABLES and self.event is None:
+            raise ValidationError(
+                {
+                    "message": _(
+                        "Les variables de l'événement nécessitent d'indiquer un événement."
+                    )
+                }
+            )
+
+        if self.event and self.max_distance is None and self.max_recipients is None:
+            raise ValidationError(
+                {
+                    "max_distance": _(
+                        "Indiquez une distance maximale ou un nombre de destinataires."
+                    )
+                }
+            )
+
+        if self.event and self.event.coordinates is None:
+            raise ValidationError(
+                {"event": _("Cet événement n'a pas de coordonnées géographiques.")}
+            )
+
+        if self.departement and self.departement not in data.departements_map:
+            raise ValidationError({"departement": _("Ce département n'existe pas.")})
+
+        if self.region:
+            try:
+                data.filtre_region(self.region)
+            except KeyError:
+                raise ValidationError({"region": _("Cette région n'existe pas.")})
+
+    def save(self, *args, **kwargs):
+        length_information = compute_sms_length_information(self.message)
+        self.encoding = length_information.encoding
+        self.message_count = length_information.messages
+
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = _("campagne SMS")
+        verbose_name_plural = _("campagnes SMS")
@@ -15,7 +15,7 @@ import iso8601
 from phonenumber_field.formfields import PhoneNumberField
 
 from agir.events.models import Event
-from agir.lib.data import departements_choices, regions_choices
+from agir.lib import data
 from agir.lib.form_fields import DateTimePickerWidget, Select2Widget
 
 from ..models import Person
@@ -116,9 +116,21 @@ FIELDS = {
     "datetime": DateTimeField,
 }
 
+
+class TableChoices:
+    """Choix tirés d'une table de `agir.lib.data`, lue seulement à l'utilisation
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __iter__(self):
+        return iter(getattr(data, self.name))
+
+
 PREDEFINED_CHOICES = {
-    "departements": departements_choices,
-    "regions": regions_choices,
+    "departements": TableChoices("departements_choices"),
+    "regions": TableChoices("regions_choices"),
     "organized_events": lambda instance: (
         (
             e.id,
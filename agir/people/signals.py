@@ -1,13 +1,23 @@
 from django.db import transaction
-from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.db.models.signals import (
+    pre_save,
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+)
 from django.dispatch import receiver
 from django.conf import settings
+from django.utils import timezone
 from functools import partial
 
 from agir.lib.mailtrain import delete_person
+from agir.people.actions.mailtrain import schedule_person_update
 from . import tasks
 from .models import Person, PersonEmail
 from agir.authentication.models import Role
+from agir.events.models import RSVP
+from agir.groups.models import Membership
 
 
 @receiver(pre_save, sender=Person, dispatch_uid="person_ensure_has_role")
@@ -25,7 +35,7 @@ def update_mailtrain(sender, instance, raw, **kwargs):
     if kwargs["created"]:
         return
 
-    transaction.on_commit(partial(tasks.update_person_mailtrain.delay, instance.id))
+    transaction.on_commit(partial(schedule_person_update, instance.id))
 
 
 @receiver(pre_delete, sender=Person, dispatch_uid="person_delete_mailtrain")
@@ -39,6 +49,22 @@ def delete_role(sender, instance, **kwargs):
         instance.role.delete()
 
 
+@receiver(post_save, sender=PersonEmail, dispatch_uid="personemail_save_primary_email")
+@receiver(
+    post_delete, sender=PersonEmail, dispatch_uid="personemail_delete_primary_email"
+)
+def update_primary_email_address(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    try:
+        person = instance.person
+    except Person.DoesNotExist:
+        return
+
+    person.update_primary_email_address()
+
+
 @receiver(post_delete, sender=PersonEmail, dispatch_uid="personemail_delete_mailtrain")
 def delete_email_person(sender, instance, **kwargs):
     if settings.MAILTRAIN_DISABLE:
@@ -48,3 +74,30 @@ def delete_email_person(sender, instance, **kwargs):
         tasks.delete_email_mailtrain.delay(instance.address)
     except Person.DoesNotExist:
         pass
+
+
+def touch_people(person_ids):
+    """Met à jour la date de modification de personnes, sans déclencher de signal
+
+    La synchronisation incrémentale avec Mailtrain se base sur cette date : elle
+    doit changer avec les objets liés qui n'ont pas leur propre date de modification,
+    ou quand ceux-ci sont supprimés.
+    """
+    Person.objects.filter(pk__in=person_ids).update(modified=timezone.now())
+
+
+@receiver(m2m_changed, sender=Person.tags.through, dispatch_uid="person_tags_touch")
+def touch_people_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ["post_add", "post_remove"]:
+        touch_people(pk_set if reverse else [instance.pk])
+    elif action == "pre_clear":
+        touch_people(instance.people.values("pk") if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=PersonEmail, dispatch_uid="personemail_save_touch")
+@receiver(post_delete, sender=PersonEmail, dispatch_uid="personemail_delete_touch")
+@receiver(post_delete, sender=Membership, dispatch_uid="membership_delete_touch")
+@receiver(post_delete, sender=RSVP, dispatch_uid="rsvp_delete_touch")
+def touch_person_on_related_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch_people([instance.person_id])
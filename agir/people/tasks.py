@@ -4,7 +4,10 @@ import socket
 import requests
 from celery import shared_task
 from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.http import urlencode
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
@@ -15,11 +18,28 @@ from agir.authentication.signers import (
     merge_account_token_generator,
 )
 from agir.lib.display import pretty_time_since
-from agir.lib.mailtrain import update_person, delete_email
+from agir.lib.mailtrain import update_person, delete_email, update_people
+from agir.lib.sms import (
+    send_personalized_sms,
+    SMSSendException,
+    compute_sms_length_information_batch,
+)
 from agir.lib.utils import front_url
 from agir.people.actions.mailing import send_mosaico_email
+from agir.people.actions.mailtrain import (
+    start_flush,
+    pop_pending_updates,
+    requeue_updates,
+)
+from agir.people.actions.sms import (
+    SMSJournal,
+    campaign_recipients,
+    campaign_messages,
+    start_campaign_chunks,
+    finish_campaign_chunk,
+)
 from agir.people.person_forms.display import get_formatted_submission
-from .models import Person, PersonFormSubmission, PersonEmail
+from .models import Person, PersonFormSubmission, PersonEmail, SMSCampaign
 
 
 @shared_task(max_retries=2, bind=True)
@@ -40,7 +60,7 @@ def send_welcome_mail(self, person_pk):
 
 @shared_task(max_retries=2, bind=True)
 def send_confirmation_email(self, email, **kwargs):
-    if PersonEmail.objects.filter(address__iexact=email).exists():
+    if PersonEmail.objects.with_address(email).exists():
         p = Person.objects.get_by_natural_key(email)
 
         try:
@@ -187,6 +207,22 @@ def update_person_mailtrain(self, person_pk):
         self.retry(countdown=60, exc=exc)
 
 
+@shared_task(max_retries=2, bind=True)
+def flush_mailtrain_updates(self):
+    start_flush()
+
+    while True:
+        person_pks = pop_pending_updates()
+        if not person_pks:
+            return
+
+        try:
+            update_people(Person.objects.filter(pk__in=person_pks))
+        except requests.RequestException as exc:
+            requeue_updates(person_pks)
+            self.retry(countdown=60, exc=exc)
+
+
 @shared_task(max_retries=2, bind=True)
 def delete_email_mailtrain(self, email):
     try:
@@ -257,3 +293,99 @@ def send_person_form_notification(self, submission_pk):
         )
     except (smtplib.SMTPException, socket.error) as exc:
         self.retry(countdown=60, exc=exc)
+
+
+@shared_task
+def send_sms_campaign(campaign_pk):
+    """Répartit l'envoi d'une campagne SMS entre des tâches par tranche
+
+    Chaque tranche de destinataires est envoyée par une tâche
+    `send_sms_campaign_chunk` distincte, programmée
+    `settings.SMS_CAMPAIGN_CHUNK_INTERVAL` secondes après la précédente : aucun
+    worker n'est occupé entre deux tranches.
+
+    L'envoi est journalisé : si la campagne est relancée, les numéros déjà traités
+    ne sont pas renvoyés.
+    """
+    try:
+        campaign = SMSCampaign.objects.get(pk=campaign_pk)
+    except SMSCampaign.DoesNotExist:
+        return
+
+    if campaign.status != SMSCampaign.STATUS_SENDING:
+        return
+
+    numbers = [n.as_e164 for n in campaign_recipients(campaign)]
+    SMSCampaign.objects.filter(pk=campaign_pk).update(recipients_count=len(numbers))
+
+    handled = SMSJournal(campaign.journal_name).handled_numbers()
+    numbers = [n for n in numbers if n not in handled]
+
+    chunk_size = settings.SMS_CAMPAIGN_CHUNK_SIZE
+    chunks = [numbers[i : i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+
+    if not chunks:
+        SMSCampaign.objects.filter(
+            pk=campaign_pk, status=SMSCampaign.STATUS_SENDING
+        ).update(status=SMSCampaign.STATUS_SENT)
+        return
+
+    start_campaign_chunks(campaign, len(chunks))
+    for i, chunk in enumerate(chunks):
+        send_sms_campaign_chunk.apply_async(
+            (campaign_pk, chunk), countdown=i * settings.SMS_CAMPAIGN_CHUNK_INTERVAL
+        )
+
+
+@shared_task(max_retries=2, bind=True)
+def send_sms_campaign_chunk(self, campaign_pk, numbers):
+    """Envoie une tranche d'une campagne SMS, en mettant à jour sa progression
+
+    Le message est personnalisé pour chaque destinataire, puis les destinataires
+    d'un même texte sont regroupés dans les mêmes envois. La dernière tranche
+    traitée marque la campagne comme envoyée, sauf si l'envoi d'une tranche a
+    échoué.
+    """
+    try:
+        campaign = SMSCampaign.objects.select_related("event").get(pk=campaign_pk)
+    except SMSCampaign.DoesNotExist:
+        return
+
+    # une campagne en erreur ou annulée n'envoie plus ses tranches restantes
+    if campaign.status == SMSCampaign.STATUS_SENDING:
+        journal = SMSJournal(campaign.journal_name)
+        at = campaign.at if campaign.at and campaign.at > timezone.now() else None
+
+        messages = campaign_messages(campaign, numbers)
+        # le nombre de SMS par destinataire dépend du texte personnalisé
+        lengths = compute_sms_length_information_batch(text for _, text in messages)
+        SMSCampaign.objects.filter(pk=campaign_pk).update(
+            message_count=Greatest(
+                "message_count", max(l.messages for l in lengths.values())
+            )
+        )
+
+        failed = False
+        try:
+            sent, invalid = send_personalized_sms(messages, at=at, journal=journal)
+        except SMSSendException as e:
+            failed = True
+            sent, invalid = e.sent, e.invalid
+
+        SMSCampaign.objects.filter(pk=campaign_pk).update(
+            sent_count=F("sent_count") + len(sent),
+            invalid_count=F("invalid_count") + len(invalid),
+        )
+
+        if failed:
+            # les numéros déjà traités sont exclus à la nouvelle tentative
+            if self.request.retries < self.max_retries:
+                self.retry(countdown=300)
+            SMSCampaign.objects.filter(pk=campaign_pk).update(
+                status=SMSCampaign.STATUS_ERROR
+            )
+
+    if finish_campaign_chunk(campaign):
+        SMSCampaign.objects.filter(
+            pk=campaign_pk, status=SMSCampaign.STATUS_SENDING
+        ).update(status=SMSCampaign.STATUS_SENT)
@@ -1,13 +1,20 @@
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import Distance
+from django.core import mail
+from django.template import engines
 from django.test import TestCase
 
 from agir.lib.tests.mixins import FakeDataMixin
+from agir.lib.utils import front_url, generate_token_params
 
 from ..models import Person, PersonForm, PersonFormSubmission
 from agir.people.person_forms.display import (
     get_form_field_labels,
     get_formatted_submission,
 )
+from ..actions.mailing import send_mosaico_email, MosaicoSkeleton, RECIPIENT_VARIABLES
 from ..actions.management import merge_persons
+from ..actions.sms import nearest_sms_recipients
 
 
 class PeopleFormActionsTestCase(TestCase):
@@ -119,3 +126,83 @@ class MergePeopleTestCase(FakeDataMixin, TestCase):
             merge_persons(user, user)
 
         self.assertTrue(Person.objects.filter(pk=user.pk).exists())
+
+
+class NearestSMSRecipientsTestCase(TestCase):
+    def setUp(self):
+        # la même personne, inscrite deux fois, et un numéro fixe
+        for i, (phone, lon) in enumerate(
+            [
+                ("+33600000001", 2.35),
+                ("+33600000001", 2.36),
+                ("+33140000000", 2.37),
+                ("+33600000002", 2.4),
+                ("+33600000003", 3.5),
+            ]
+        ):
+            Person.objects.create_person(
+                f"sms{i}@test.com",
+                subscribed_sms=True,
+                contact_phone=phone,
+                coordinates=Point(lon, 48.85),
+            )
+
+    def test_nearest_numbers_are_deduplicated(self):
+        res = nearest_sms_recipients(Point(2.35, 48.85), number=2)
+
+        self.assertEqual([n.as_e164 for n, _ in res], ["+33600000001", "+33600000002"])
+        self.assertLess(res[0][1], res[1][1])
+
+    def test_max_distance(self):
+        res = nearest_sms_recipients(Point(2.35, 48.85), max_distance=Distance(km=10))
+
+        self.assertEqual(len(res), 2)
+        self.assertTrue(all(d <= Distance(km=10) for _, d in res))
+
+
+class MosaicoEmailTestCase(TestCase):
+    def setUp(self):
+        self.people = [
+            Person.objects.create_person("premier@test.com"),
+            Person.objects.create_person("second@test.com"),
+        ]
+
+    def test_recipient_variables_are_personalized(self):
+        send_mosaico_email(
+            code="WELCOME_MESSAGE",
+            subject="Bienvenue",
+            from_email="robot@test.com",
+            bindings={"PROFILE_LINK": front_url("personal_information")},
+            recipients=[*self.people, "adresse@test.com"],
+        )
+
+        self.assertEqual(len(mail.outbox), 3)
+
+        for person, message in zip(self.people, mail.outbox):
+            token_params = generate_token_params(person)
+            html = message.alternatives[0][0]
+
+            self.assertIn(person.email, message.body)
+            self.assertIn(f"p={token_params['p']}", message.body)
+            self.assertIn(token_params["code"], message.body)
+            self.assertIn(token_params["code"], html)
+
+            for other in self.people:
+                if other != person:
+                    self.assertNotIn(other.email, message.body)
+                    self.assertNotIn(other.email, html)
+
+        self.assertNotIn("code=", mail.outbox[2].body)
+
+    def test_filtered_recipient_variables_are_rendered_for_each_recipient(self):
+        html_template = engines["django"].from_string(
+            "<p>{{ EMAIL|upper }}</p>{% if LINK_BROWSER %}<a>lien</a>{% endif %}"
+        )
+        skeleton = MosaicoSkeleton(html_template, None, {}, RECIPIENT_VARIABLES)
+
+        values = {name: "" for name in RECIPIENT_VARIABLES}
+        html, text = skeleton.render({**values, "EMAIL": "premier@test.com"})
+        self.assertEqual(html, "<p>PREMIER@TEST.COM</p>")
+
+        html, text = skeleton.render({**values, "LINK_BROWSER": "https://lien"})
+        self.assertEqual(html, "<p></p><a>lien</a>")
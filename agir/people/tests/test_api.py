@@ -15,7 +15,7 @@ from agir.people.models import Person, PersonTag
 from agir.people.viewsets import LegacyPersonViewSet
 
 
-from agir.people.tasks import update_person_mailtrain
+from agir.people.actions.mailtrain import schedule_person_update
 
 
 @using_redislite
@@ -235,7 +235,7 @@ class LegacyPersonEndpointTestCase(APITestCase):
 
         on_commit.assert_called_once()
         partial = on_commit.call_args[0][0]
-        self.assertEqual(partial.func, update_person_mailtrain.delay)
+        self.assertEqual(partial.func, schedule_person_update)
         self.assertEqual(partial.args, (self.basic_person.pk,))
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -6,7 +6,7 @@ from django.core.exceptions import ObjectDoesNotExist
 
 from agir.authentication.models import Role
 from agir.people.models import Person, PersonEmail
-from agir.people.tasks import update_person_mailtrain
+from agir.people.actions.mailtrain import schedule_person_update
 
 
 class BasicPersonTestCase(TestCase):
@@ -59,6 +59,41 @@ class BasicPersonTestCase(TestCase):
         self.assertEqual(user.email, "test2@domain.com")
         self.assertEqual(user.emails.all()[1].address, "test@domain.com")
 
+    def test_primary_email_is_stored_on_person(self):
+        user = Person.objects.create_person(email="test@domain.com")
+        user.add_email("test2@domain.com")
+        stale = Person.objects.get(pk=user.pk)
+
+        user.set_primary_email("test2@domain.com")
+        stale.save()
+
+        user = Person.objects.get(pk=user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.email, "test2@domain.com")
+            self.assertEqual(str(user), "test2@domain.com")
+
+        user.emails.get(address="test2@domain.com").delete()
+        self.assertEqual(Person.objects.get(pk=user.pk).email, "test@domain.com")
+
+    def test_can_save_partially_loaded_person(self):
+        user = Person.objects.create_person(email="test@domain.com")
+
+        partial = Person.objects.only("first_name", "role").get(pk=user.pk)
+        partial.first_name = "Jean"
+        with self.assertNumQueries(1):
+            partial.save()
+        self.assertEqual(Person.objects.get(pk=user.pk).first_name, "Jean")
+
+    def test_email_lookups_are_case_insensitive(self):
+        user = Person.objects.create_person(email="Test@domain.com")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Person.objects.get_by_natural_key("test@DOMAIN.com"), user)
+        self.assertEqual(Person.objects.get(email="TEST@domain.com"), user)
+        self.assertEqual(
+            PersonEmail.objects.get_by_natural_key("test@domain.com").person, user
+        )
+
     def test_cannot_set_non_existing_primary_email(self):
         user = Person.objects.create_person(email="test@domain.com")
         user.add_email("test2@domain.com")
@@ -92,7 +127,7 @@ class BasicPersonTestCase(TestCase):
 
         on_commit.assert_called_once()
         partial = on_commit.call_args[0][0]
-        self.assertEqual(partial.func, update_person_mailtrain.delay)
+        self.assertEqual(partial.func, schedule_person_update)
         self.assertEqual(partial.args, (person.pk,))
 
     @override_settings(MAILTRAIN_DISABLE=False)
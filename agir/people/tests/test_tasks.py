@@ -1,7 +1,12 @@
-from django.test import TestCase
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
 from django.core import mail
 
-from agir.people.models import Person
+from agir.api.redis import using_redislite
+from agir.lib.sms import LocalSMSClient
+from agir.people.actions.mailtrain import schedule_person_update
+from agir.people.models import Person, PersonTag, SMSCampaign
 from agir.people import tasks
 
 
@@ -20,3 +25,117 @@ class PeopleTasksTestCase(TestCase):
 
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].recipients(), [self.person.email])
+
+
+@using_redislite
+class MailtrainUpdatesTestCase(TestCase):
+    def setUp(self):
+        self.person = Person.objects.create_person("me@me.org")
+
+    @patch("agir.people.tasks.update_people")
+    @patch("agir.people.tasks.flush_mailtrain_updates.apply_async")
+    def test_updates_are_coalesced(self, apply_async, update_people):
+        for _ in range(3):
+            schedule_person_update(self.person.pk)
+
+        apply_async.assert_called_once()
+
+        tasks.flush_mailtrain_updates()
+
+        update_people.assert_called_once()
+        self.assertEqual(list(update_people.call_args[0][0]), [self.person])
+
+        schedule_person_update(self.person.pk)
+        self.assertEqual(apply_async.call_count, 2)
+
+
+@using_redislite
+@override_settings(SMS_CAMPAIGN_CHUNK_SIZE=2, SMS_CAMPAIGN_CHUNK_INTERVAL=10)
+class SMSCampaignTaskTestCase(TestCase):
+    def setUp(self):
+        self.countdowns = []
+
+        def run_chunk(args, countdown):
+            self.countdowns.append(countdown)
+            tasks.send_sms_campaign_chunk(*args)
+
+        patcher = patch.object(
+            tasks.send_sms_campaign_chunk, "apply_async", side_effect=run_chunk
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.tag = PersonTag.objects.create(label="militants")
+
+        for i, phone in enumerate(
+            ["+33600000001", "+33600000002", "+33600000003", "+33700000004"]
+        ):
+            person = Person.objects.create_person(
+                f"campaign{i}@test.com", subscribed_sms=True, contact_phone=phone
+            )
+            person.tags.add(self.tag)
+
+        Person.objects.create_person(
+            "other@test.com", subscribed_sms=True, contact_phone="+33600000005"
+        )
+
+        self.campaign = SMSCampaign.objects.create(
+            name="Campagne", message="Mon message", tag=self.tag
+        )
+
+    def test_campaign_is_not_sent_if_draft(self):
+        client = LocalSMSClient()
+
+        with patch("agir.lib.sms.get_client", return_value=client):
+            tasks.send_sms_campaign(self.campaign.pk)
+
+        self.assertEqual(client.jobs, [])
+
+    def test_send_campaign_and_report_progress(self):
+        self.campaign.status = SMSCampaign.STATUS_SENDING
+        self.campaign.save()
+        client = LocalSMSClient(invalid_receivers=["+33700000004"])
+
+        with patch("agir.lib.sms.get_client", return_value=client):
+            tasks.send_sms_campaign(self.campaign.pk)
+
+        # chaque tranche est une tâche distincte, programmée après la précédente
+        self.assertEqual(self.countdowns, [0, 10])
+
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, SMSCampaign.STATUS_SENT)
+        self.assertEqual(self.campaign.recipients_count, 4)
+        self.assertEqual(self.campaign.sent_count, 3)
+        self.assertEqual(self.campaign.invalid_count, 1)
+        self.assertEqual(self.campaign.encoding, "GSM7")
+        self.assertEqual(self.campaign.message_count, 1)
+        self.assertEqual(
+            sorted(r for job in client.jobs for r in job["receivers"]),
+            ["+33600000001", "+33600000002", "+33600000003", "+33700000004"],
+        )
+
+        # une nouvelle tentative n'envoie pas une deuxième fois le message
+        self.campaign.status = SMSCampaign.STATUS_SENDING
+        self.campaign.save()
+        client.jobs.clear()
+
+        with patch("agir.lib.sms.get_client", return_value=client):
+            tasks.send_sms_campaign(self.campaign.pk)
+
+        self.assertEqual(client.jobs, [])
+
+    def test_send_personalized_campaign(self):
+        Person.objects.filter(contact_phone="+33600000001").update(first_name="Marie")
+        Person.objects.filter(contact_phone="+33600000002").update(first_name="Paul")
+        self.campaign.message = "Bonjour {{ FIRST_NAME }} !"
+        self.campaign.status = SMSCampaign.STATUS_SENDING
+        self.campaign.save()
+        client = LocalSMSClient()
+
+        with patch("agir.lib.sms.get_client", return_value=client):
+            tasks.send_sms_campaign(self.campaign.pk)
+
+        messages = {r: job["message"] for job in client.jobs for r in job["receivers"]}
+        self.assertEqual(messages["+33600000001"], "Bonjour Marie !")
+        self.assertEqual(messages["+33600000002"], "Bonjour Paul !")
+        self.assertEqual(messages["+33600000003"], "Bonjour  !")
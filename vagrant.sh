@@ -68,6 +68,9 @@ echo "## Install npm dependencies..."
 echo "## Migrate and populate test database..."
 (cd /vagrant && /usr/local/bin/pipenv run ./manage.py migrate && (/usr/local/bin/pipenv run ./manage.py load_fake_data || true)) &> /dev/null
 
+echo "## Download the local commune index..."
+(cd /vagrant && (/usr/local/bin/pipenv run ./manage.py update_communes || true)) &> /dev/null
+
 echo "## Create super user (address: admin@agir.local, password: password)"
 (cd /vagrant && (SUPERPERSON_PASSWORD="password" /usr/local/bin/pipenv run ./manage.py createsuperperson --noinput --email admin@agir.local || true)) &> /dev/null
 
@@ -107,6 +110,23 @@ Type=simple
 WantedBy=vagrant.mount
 EOT
 
+sudo bash -c "cat > /etc/systemd/system/celerybeat.service" <<EOT
+[Unit]
+Description=fi-api celery beat scheduler
+
+[Service]
+WorkingDirectory=/vagrant
+ExecStart=/usr/local/bin/pipenv run celery beat --app agir.api --schedule /home/vagrant/celerybeat-schedule --logfile=/dev/null
+User=vagrant
+Group=vagrant
+Restart=on-failure
+KillSignal=SIGTERM
+Type=simple
+
+[Install]
+WantedBy=vagrant.mount
+EOT
+
 sudo bash -c "cat > /etc/systemd/system/django.service" <<EOT
 [Unit]
 Description=Django Development Server
@@ -146,12 +166,14 @@ sudo systemctl daemon-reload
 echo "## Enable all services..."
 sudo systemctl enable django
 sudo systemctl enable celery
+sudo systemctl enable celerybeat
 sudo systemctl enable mailhog
 sudo systemctl enable webpack
 
 echo "## Start all services..."
 sudo systemctl start django
 sudo systemctl start celery
+sudo systemctl start celerybeat
 sudo systemctl start mailhog
 sudo systemctl start webpack
 